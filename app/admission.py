@@ -0,0 +1,174 @@
+"""
+Admission control for CPU-heavy requests.
+
+At most ADMISSION_MAX_ACTIVE encrypt/decrypt requests run at once; the rest
+wait in one priority queue (paid, then account, then guest, FIFO within a
+tier). Each tier may only have so many requests waiting, and nobody waits
+longer than ADMISSION_MAX_WAIT: past either limit the request is turned away
+with a Retry-After hint instead of piling up.
+"""
+import os
+import asyncio
+import heapq
+import itertools
+import math
+import time
+import weakref
+
+from app import metrics
+
+# ---------------- Config ----------------
+# crypto-heavy requests running at once; 0 turns admission control off
+ADMISSION_MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", str(os.cpu_count() or 1)))
+# requests allowed to wait per tier, as "tier=n,..."
+ADMISSION_QUEUE_LIMITS = os.getenv("ADMISSION_QUEUE_LIMITS", "guest=8,account=32,paid=64")
+# seconds a queued request may wait for a slot before it is turned away
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "30"))
+
+# lower goes first; unknown tiers queue with guests
+PRIORITY = {"paid": 0, "account": 1, "guest": 2}
+
+
+def parse_limits(spec: str) -> dict:
+    limits = {tier: 0 for tier in PRIORITY}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        tier, _, n = item.partition("=")
+        if tier not in PRIORITY or not n.strip().isdigit():
+            raise ValueError(f"Bad ADMISSION_QUEUE_LIMITS entry {item!r}")
+        limits[tier] = int(n)
+    return limits
+
+
+QUEUE_LIMITS = parse_limits(ADMISSION_QUEUE_LIMITS)
+
+
+class Overloaded(RuntimeError):
+    """
+    No slot came free: the tier's queue is full or the wait timed out.
+    ``retry_after`` is a whole-second hint for the client.
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """
+    A granted slot. ``release()`` may be called from every exit path; only
+    the first call frees the slot.
+    """
+
+    def __init__(self, gate, tier: str):
+        self._gate = gate
+        self.tier = tier
+        self._t0 = time.perf_counter()
+
+    def release(self) -> None:
+        gate, self._gate = self._gate, None
+        if gate is not None:
+            gate._release(time.perf_counter() - self._t0)
+
+
+class Gate:
+    def __init__(self, max_active: int, limits: dict, max_wait: float):
+        self.max_active = max_active
+        self.limits = limits
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = {tier: 0 for tier in PRIORITY}
+        self._heap = []                 # (priority, seq, future)
+        self._seq = itertools.count()
+        self._hold = 1.0                # moving average of seconds a slot is held
+
+    def retry_after(self) -> int:
+        # time for everyone queued now to get through, at the recent pace
+        queued = sum(self.waiting.values())
+        return max(1, min(60, math.ceil((queued + 1) * self._hold / max(1, self.max_active))))
+
+    def try_admit(self, tier: str) -> Ticket | None:
+        """
+        A slot only if one is free right now; never queues.
+        """
+        tier = tier if tier in PRIORITY else "guest"
+        if self.max_active <= 0:
+            return Ticket(None, tier)
+        if self.active < self.max_active:
+            self.active += 1
+            self._granted(tier, 0.0)
+            return Ticket(self, tier)
+        return None
+
+    async def admit(self, tier: str) -> Ticket:
+        tier = tier if tier in PRIORITY else "guest"
+        if self.max_active <= 0:
+            return Ticket(None, tier)
+        if self.active < self.max_active:
+            # nobody live can be queued while a slot is free
+            self.active += 1
+            self._granted(tier, 0.0)
+            return Ticket(self, tier)
+        if self.waiting[tier] >= self.limits.get(tier, 0):
+            metrics.ADMISSION_REJECTED.inc(tier=tier, reason="queue_full")
+            raise Overloaded("Server busy, retry later", self.retry_after())
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (PRIORITY[tier], next(self._seq), fut))
+        self._queued(tier, 1)
+        t0 = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.max_wait):
+                await fut
+        except (TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # the slot was handed over just as we gave up: pass it on
+                self._release(None)
+            fut.cancel()
+            if isinstance(e, TimeoutError):
+                metrics.ADMISSION_REJECTED.inc(tier=tier, reason="timeout")
+                raise Overloaded("Server busy, retry later", self.retry_after())
+            raise
+        finally:
+            self._queued(tier, -1)
+        self._granted(tier, time.perf_counter() - t0)
+        return Ticket(self, tier)
+
+    def _release(self, held: float | None) -> None:
+        if held is not None:
+            self._hold = 0.8 * self._hold + 0.2 * held
+        self.active -= 1
+        while self._heap and self.active < self.max_active:
+            _, _, fut = heapq.heappop(self._heap)
+            if not fut.done():          # skip waiters that gave up
+                fut.set_result(None)
+                self.active += 1
+        metrics.ADMISSION_ACTIVE.set(self.active)
+
+    def _queued(self, tier: str, delta: int) -> None:
+        self.waiting[tier] += delta
+        metrics.ADMISSION_QUEUED.set(self.waiting[tier], tier=tier)
+
+    def _granted(self, tier: str, waited: float) -> None:
+        metrics.ADMISSION_WAIT_SECONDS.observe(waited, tier=tier)
+        metrics.ADMISSION_ACTIVE.set(self.active)
+
+
+_gates: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Gate]" = weakref.WeakKeyDictionary()
+
+
+def gate() -> Gate:
+    """
+    The running loop's gate; futures cannot be shared across loops.
+    """
+    loop = asyncio.get_running_loop()
+    g = _gates.get(loop)
+    if g is None:
+        g = _gates[loop] = Gate(ADMISSION_MAX_ACTIVE, QUEUE_LIMITS, ADMISSION_MAX_WAIT)
+    return g
+
+
+async def admit(tier: str) -> Ticket:
+    """
+    Wait for a crypto slot in ``tier``'s priority class; raises Overloaded.
+    """
+    return await gate().admit(tier)
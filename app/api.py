@@ -1,33 +1,108 @@
 from fastapi import (
-    APIRouter, Depends, UploadFile, File, Form,
-    HTTPException, BackgroundTasks
+    APIRouter, Depends, UploadFile, File, Form, Query,
+    HTTPException, BackgroundTasks, Request
 )
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from urllib.parse import quote
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+from pathlib import Path
 import os
+import zipfile
 
-from .db.session      import SessionLocal, engine, Base
+from .db.session      import engine, Base, get_db
 from .db.crud         import (
     get_user_by_email, create_user,
-    sum_user_usage, create_file_meta, PER_FILE_CAP, TOTAL_CAP
+    sum_user_usage, queue_file_meta, list_user_files,
+    PER_FILE_CAP, TOTAL_CAP
 )
-from .encryptor       import encrypt_file
-from .decryptor       import decrypt_file
+from .encryptor       import (
+    encrypt_chunks, sealed_length, validate_method, load_public_key,
+    check_size_limit, CHUNK_SIZE
+)
+from .decryptor       import (
+    decrypt_chunks, decrypt_range_chunks, parse_byte_range, opened_size, sniff_method, HEADER_PEEK
+)
+from .header          import parse_header
+from .pipeline        import (
+    MeteredUpload, encrypt_upload, decrypt_upload,
+    first_piece, hashed_stream
+)
+from .batch           import encrypt_batch_zip, zip_members, BATCH_MAX_FILES
+from .workers         import run_crypto
+from .                import admission, jobs, metawriter, uploads
 from .auth            import (
     hash_pwd, authenticate_user,
-    create_access_token, get_current_user,
-    ACCESS_EXPIRE
+    create_access_token, get_current_user
 )
 
+# "file": write results under TEMP_DIR and serve them with FileResponse.
+# "stream": pipe the cipher output straight into the HTTP response.
+OUTPUT_MODE = os.getenv("ENCLYPT_OUTPUT_MODE", "file").lower()
+
 Base.metadata.create_all(bind=engine)
 router = APIRouter()
 
+def _disposition(filename):
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+def _stream_response(first, pieces, filename, length, log):
+    """
+    Response for stream mode. A failure mid-stream aborts the body, so the
+    client sees a short read rather than unauthenticated output.
+    """
+    headers = {"Content-Disposition": _disposition(filename)}
+    if length is not None:
+        headers["Content-Length"] = str(length)
+    return StreamingResponse(
+        hashed_stream(first, pieces, log),
+        media_type="application/octet-stream",
+        headers=headers,
+    )
+
+def _encrypt_cap(db, user, incoming=0):
+    """
+    (per-file byte cap, message) for the user's next upload; 403 up front
+    when the ``incoming`` bytes already overrun the guest total cap.
+    """
+    cap, cap_msg = PER_FILE_CAP[user.tier], f"{user.tier} single-file cap exceeded"
+    if user.tier=="guest" and TOTAL_CAP[user.tier]:
+        remaining = max(TOTAL_CAP[user.tier] - sum_user_usage(db, user), 0)
+        if incoming > remaining:
+            raise HTTPException(403, "Guest total-usage cap exceeded")
+        if cap is None or remaining < cap:
+            cap, cap_msg = remaining, "Guest total-usage cap exceeded"
+    return cap, cap_msg
+
+async def crypto_slot(user=Depends(get_current_user)):
+    """
+    Hold an admission slot for the whole request, streamed body included;
+    handlers whose crypto is done before the response release it early.
+    """
+    try:
+        ticket = await admission.admit(user.tier)
+    except admission.Overloaded as e:
+        raise HTTPException(429, str(e), headers={"Retry-After": str(e.retry_after)})
+    try:
+        yield ticket
+    finally:
+        ticket.release()
+
+def _meta_logger(user, filename, method):
+    def log(size, digest):
+        queue_file_meta(user, filename, size, digest, method)
+    return log
+
 @router.post("/register")
 def register(
     email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(lambda: SessionLocal())
+    db: Session = Depends(get_db)
 ):
     if get_user_by_email(db, email):
         raise HTTPException(400, "Email already registered")
@@ -37,7 +112,7 @@ def register(
 @router.post("/token")
 def login(
     form: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(lambda: SessionLocal())
+    db: Session = Depends(get_db)
 ):
     user = authenticate_user(db, form.username, form.password)
     if not user:
@@ -52,83 +127,411 @@ async def encrypt_endpoint(
     method: str = Form("fernet"),
     rsa_public_key: str = Form(None),
     user=Depends(get_current_user),
-    db: Session = Depends(lambda: SessionLocal())
+    slot=Depends(crypto_slot),
+    db: Session = Depends(get_db)
 ):
-    tier = user.tier
+    # size caps are enforced incrementally while the upload streams through
+    cap, cap_msg = _encrypt_cap(db, user)
 
-    # read + size check
-    content = await file.read()
-    size    = len(content)
-    cap     = PER_FILE_CAP[tier]
-    if cap and size > cap:
-        raise HTTPException(403, f"{tier} single-file cap exceeded")
-    if tier=="guest" and TOTAL_CAP[tier] and sum_user_usage(db, user)+size > TOTAL_CAP[tier]:
-        raise HTTPException(403, "Guest total-usage cap exceeded")
-    await file.seek(0)
-
-    # encrypt
+    # encrypt: one read of the upload, hashed and written in the same pass
     try:
-        out = await encrypt_file(
-            file=file,
-            password=user.license_key,
-            method=method,
-            user_level=user.tier,
-            rsa_public_key=rsa_public_key,
-        )
+        if OUTPUT_MODE == "stream":
+            pieces = encrypt_chunks(
+                MeteredUpload(file, cap, cap_msg),
+                user.license_key, method, user.tier, rsa_public_key,
+            )
+            first = await first_piece(pieces)
+        else:
+            res = await encrypt_upload(
+                file=file,
+                password=user.license_key,
+                method=method,
+                user_level=user.tier,
+                rsa_public_key=rsa_public_key,
+                cap=cap,
+                cap_message=cap_msg,
+            )
     except PermissionError as e:
         raise HTTPException(403, str(e))
     except ValueError as e:
         raise HTTPException(400, str(e))
     except:
         raise HTTPException(500, "Encryption failed")
+    finally:
+        if OUTPUT_MODE != "stream":
+            slot.release()
+
+    if OUTPUT_MODE == "stream":
+        # fernet is single-shot; uncompressed segmented output size follows
+        # from the upload size, compressed output streams chunked
+        if method == "fernet":
+            length = len(first)
+        elif file.size is not None and parse_header(first)[0].compression == "none":
+            length = sealed_length(file.size, len(first))
+        else:
+            length = None
+        log = _meta_logger(user, file.filename, method)
+        return _stream_response(first, pieces, f"encrypted_{file.filename}", length, log)
 
     # log
-    with open(out,"rb") as f:
-        data = f.read()
-    create_file_meta(db, user, file.filename, data, method)
+    queue_file_meta(user, file.filename, res.size, res.sha256, method)
 
     # return + cleanup
-    resp = FileResponse(out, filename=f"encrypted_{file.filename}")
-    background_tasks.add_task(os.remove, out)
+    resp = FileResponse(res.path, filename=f"encrypted_{file.filename}")
+    background_tasks.add_task(os.remove, res.path)
     return resp
 
+@router.post("/encrypt/batch")
+async def encrypt_batch_endpoint(
+    files: list[UploadFile] = File(...),
+    method: str = Form("fernet"),
+    rsa_public_key: str = Form(None),
+    expand_zip: bool = Form(True),
+    user=Depends(get_current_user),
+    # members share this slot one at a time and borrow any other free ones
+    slot=Depends(crypto_slot),
+    db: Session = Depends(get_db)
+):
+    """
+    Encrypt many files (or the members of one uploaded zip) concurrently and
+    stream back a zip of ciphertexts plus manifest.json, in completion order.
+    """
+    tier = user.tier
+    try:
+        validate_method(method, tier)
+        if method == "rsa":
+            if not rsa_public_key:
+                raise ValueError("Missing RSA public key.")
+            await run_crypto(load_public_key, rsa_public_key)
+    except PermissionError as e:
+        raise HTTPException(403, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    archive = None
+    if expand_zip and len(files) == 1 and (files[0].filename or "").lower().endswith(".zip"):
+        try:
+            archive = zipfile.ZipFile(files[0].file)
+            sources = zip_members(archive)
+        except zipfile.BadZipFile:
+            raise HTTPException(400, "Invalid zip archive")
+    else:
+        sources = files
+    if not sources:
+        raise HTTPException(400, "No files to encrypt")
+    if len(sources) > BATCH_MAX_FILES:
+        raise HTTPException(400, f"At most {BATCH_MAX_FILES} files per batch")
+
+    # quota is checked on the batch total before any work starts
+    cap, cap_msg = _encrypt_cap(db, user, sum(s.size or 0 for s in sources))
+
+    def log(results):
+        for r in results:
+            queue_file_meta(user, r.name, r.size, r.sha256, method)
+
+    async def body():
+        try:
+            async for piece in encrypt_batch_zip(
+                sources, user.license_key, method, tier, rsa_public_key,
+                cap=cap, cap_message=cap_msg, on_complete=log,
+            ):
+                yield piece
+        finally:
+            if archive is not None:
+                archive.close()
+
+    return StreamingResponse(
+        body(),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="encrypted_batch.zip"'},
+    )
+
+async def _range_response(file, range_header, method, rsa_private_key, user):
+    """
+    206 with just the requested plaintext bytes, or None when the upload has
+    no per-segment layout (fernet, compressed) and must be decrypted whole.
+    """
+    head = await file.read(HEADER_PEEK)
+    await file.seek(0)
+    total = opened_size(head, file.size, method) if file.size is not None else None
+    if total is None:
+        return None
+    unit, _, spec = range_header.partition("=")
+    try:
+        if unit.strip().lower() != "bytes" or "," in spec:
+            raise ValueError("Only single byte ranges are supported.")
+        start, stop = parse_byte_range(spec, total)
+    except ValueError as e:
+        raise HTTPException(416, str(e), headers={"Content-Range": f"bytes */{total}"})
+
+    try:
+        validate_method(method, user.tier)
+        validate_method(sniff_method(head, method), user.tier)
+        pieces = decrypt_range_chunks(file, file.size, start, stop, user.license_key, rsa_private_key)
+        first = await first_piece(pieces)
+    except PermissionError as e:
+        raise HTTPException(403, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    # segment by segment, like stream mode: memory stays bounded by one chunk
+    log = _meta_logger(user, file.filename, f"decrypt:{method}")
+    return StreamingResponse(
+        hashed_stream(first, pieces, log),
+        status_code=206,
+        media_type="application/octet-stream",
+        headers={
+            "Content-Range": f"bytes {start}-{stop - 1}/{total}",
+            "Content-Length": str(stop - start),
+            "Content-Disposition": _disposition(f"decrypted_{file.filename}"),
+        },
+    )
+
 @router.post("/decrypt")
 async def decrypt_endpoint(
+    request: Request,
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     method: str = Form("fernet"),
     rsa_private_key: str = Form(None),
     user=Depends(get_current_user),
-    db: Session = Depends(lambda: SessionLocal())
+    slot=Depends(crypto_slot),
+    db: Session = Depends(get_db)
 ):
     # online‐only decrypt for account & paid
     if user.tier not in ("account","paid"):
         raise HTTPException(403, "Guests cannot decrypt online")
 
+    # Range: decrypt only the segments covering the requested plaintext bytes
+    if "range" in request.headers:
+        resp = await _range_response(file, request.headers["range"], method, rsa_private_key, user)
+        if resp is not None:
+            return resp
+
     try:
-        out = await decrypt_file(
-            file=file,
-            password=user.license_key,
-            method=method,
-            user_level=user.tier,
-            rsa_private_key=rsa_private_key,
-        )
+        if OUTPUT_MODE == "stream":
+            # peek at the header so the plaintext length is known up front
+            head = await file.read(HEADER_PEEK)
+            await file.seek(0)
+            pieces = decrypt_chunks(
+                file, user.license_key, method, user.tier, rsa_private_key
+            )
+            first = await first_piece(pieces)
+        else:
+            res = await decrypt_upload(
+                file=file,
+                password=user.license_key,
+                method=method,
+                user_level=user.tier,
+                rsa_private_key=rsa_private_key,
+            )
+    except PermissionError as e:
+        # the header can name a cipher the tier may not use
+        raise HTTPException(403, str(e))
     except ValueError as e:
         raise HTTPException(400, str(e))
-    except:
+    except Exception:
         raise HTTPException(500, "Decryption failed")
+    finally:
+        if OUTPUT_MODE != "stream":
+            slot.release()
+
+    if OUTPUT_MODE == "stream":
+        # baseline (headerless) files cannot be sized up front, so they stream chunked
+        if sniff_method(head, method) == "fernet":
+            length = len(first)
+        elif file.size is not None:
+            length = opened_size(head, file.size, method)
+        else:
+            length = None
+        log = _meta_logger(user, file.filename, f"decrypt:{method}")
+        return _stream_response(first, pieces, f"decrypted_{file.filename}", length, log)
 
-    with open(out,"rb") as f:
-        data = f.read()
-    create_file_meta(db, user, file.filename, data, f"decrypt:{method}")
+    queue_file_meta(user, file.filename, res.size, res.sha256, f"decrypt:{method}")
 
-    resp = FileResponse(out, filename=f"decrypted_{file.filename}")
-    background_tasks.add_task(os.remove, out)
+    resp = FileResponse(res.path, filename=f"decrypted_{file.filename}")
+    background_tasks.add_task(os.remove, res.path)
     return resp
 
+@router.post("/jobs")
+async def create_job(
+    file: UploadFile = File(...),
+    op: str = Form("encrypt"),
+    method: str = Form("fernet"),
+    rsa_key: str = Form(None),
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # queue the work and answer immediately; poll GET /jobs/{id} for progress
+    # jobs skip the admission gate: they run on their own JOB_WORKERS threads,
+    # and JOB_MAX_PENDING turns submissions away instead
+    if op not in ("encrypt", "decrypt"):
+        raise HTTPException(400, "op must be 'encrypt' or 'decrypt'")
+    if op == "decrypt" and user.tier not in ("account","paid"):
+        raise HTTPException(403, "Guests cannot decrypt online")
+    try:
+        validate_method(method, user.tier)
+        if op == "encrypt" and file.size is not None:
+            check_size_limit(file.size, user.tier)
+    except PermissionError as e:
+        raise HTTPException(403, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    cap, cap_msg = _encrypt_cap(db, user) if op == "encrypt" else (None, "")
+    job = jobs.new_job(user.license_key, op, method, file.filename, file.size or 0, user.tier)
+    log = _meta_logger(user, file.filename, method if op == "encrypt" else f"decrypt:{method}")
+    try:
+        # the request's spooled upload is gone once we return: keep a copy
+        src = MeteredUpload(file, cap, cap_msg)
+        with open(job.input_path, "wb") as f:
+            while chunk := await src.read(CHUNK_SIZE):
+                f.write(chunk)
+        job.bytes_total = src.bytes_in
+        jobs.submit(job, user.license_key, rsa_key, on_done=lambda j: log(j.size, j.sha256))
+    except PermissionError as e:
+        Path(job.input_path).unlink(missing_ok=True)
+        raise HTTPException(403, str(e))
+    except jobs.QueueFull as e:
+        Path(job.input_path).unlink(missing_ok=True)
+        raise HTTPException(429, str(e), headers={"Retry-After": "30"})
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str, user=Depends(get_current_user)):
+    job = jobs.get(job_id, user.license_key)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}/result")
+def job_result(job_id: str, user=Depends(get_current_user)):
+    job = jobs.get(job_id, user.license_key)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    if job.status == jobs.FAILED:
+        raise HTTPException(400, job.error)
+    if job.status != jobs.DONE:
+        raise HTTPException(409, f"Job is {job.status}")
+    prefix = "encrypted" if job.op == "encrypt" else "decrypted"
+    # the result stays available until the job expires
+    return FileResponse(job.result_path, filename=f"{prefix}_{job.filename}")
+
+@router.post("/uploads", status_code=201)
+async def create_upload(
+    filename: str = Form(...),
+    total_size: int = Form(...),
+    method: str = Form("aes256"),
+    rsa_public_key: str = Form(None),
+    user=Depends(get_current_user),
+    slot=Depends(crypto_slot),
+    db: Session = Depends(get_db)
+):
+    # resumable upload: PUT each chunk to /uploads/{id}/chunks/{index}, then finalize
+    cap, cap_msg = _encrypt_cap(db, user)
+    if cap is not None and total_size > cap:
+        raise HTTPException(403, cap_msg)
+    try:
+        upload = await uploads.create(db, user, filename, total_size, method, rsa_public_key)
+    except PermissionError as e:
+        raise HTTPException(403, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return uploads.status(upload)
+
+def _upload_or_404(db, upload_id, user):
+    upload = uploads.get(db, upload_id, user)
+    if upload is None:
+        raise HTTPException(404, "Upload not found")
+    return upload
+
+async def _read_body(request: Request, limit: int) -> bytes:
+    body = bytearray()
+    async for piece in request.stream():
+        body += piece
+        if len(body) > limit:
+            raise HTTPException(413, f"Chunks are at most {limit} bytes")
+    return bytes(body)
+
+@router.put("/uploads/{upload_id}/chunks/{index}")
+async def put_upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    user=Depends(get_current_user),
+    slot=Depends(crypto_slot),
+    db: Session = Depends(get_db)
+):
+    upload = _upload_or_404(db, upload_id, user)
+    data = await _read_body(request, upload.chunk_size)
+    try:
+        return await uploads.put_chunk(db, upload, index, data, user.license_key)
+    except uploads.SessionLost as e:
+        raise HTTPException(410, str(e))
+    except LookupError as e:
+        raise HTTPException(409, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+@router.get("/uploads/{upload_id}")
+def upload_status(upload_id: str, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    return uploads.status(_upload_or_404(db, upload_id, user))
+
+@router.post("/uploads/{upload_id}/finalize")
+async def finalize_upload(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    user=Depends(get_current_user),
+    slot=Depends(crypto_slot),
+    db: Session = Depends(get_db)
+):
+    upload = _upload_or_404(db, upload_id, user)
+    filename, method = upload.filename, upload.method
+    try:
+        path, size, digest = await uploads.finalize(db, upload, user.license_key)
+    except uploads.SessionLost as e:
+        raise HTTPException(410, str(e))
+    except LookupError as e:
+        raise HTTPException(409, str(e))
+
+    # every chunk was sealed and hashed on arrival; only the metadata is left
+    queue_file_meta(user, filename, size, digest, method)
+    background_tasks.add_task(os.remove, path)
+    return FileResponse(path, filename=f"encrypted_{filename}")
+
+@router.delete("/uploads/{upload_id}", status_code=204)
+def abort_upload(upload_id: str, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    uploads.abort(db, _upload_or_404(db, upload_id, user))
+
+def _encode_cursor(after) -> str:
+    ts, last_id = after
+    return urlsafe_b64encode(f"{ts.isoformat()}|{last_id}".encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        ts, last_id = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(last_id)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
 @router.get("/dashboard")
-def dashboard(user=Depends(get_current_user), db: Session = Depends(lambda: SessionLocal())):
-    # return your file metadata + hidden license_key
+def dashboard(
+    limit: int = Query(50, ge=1, le=500),
+    after: str | None = None,
+    method: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # return one page of your file metadata + hidden license_key;
+    # commit anything of yours still in the write-behind buffer first
+    metawriter.settle(user.id)
+    rows, total, next_after = list_user_files(
+        db, user, limit,
+        after=_decode_cursor(after) if after else None,
+        method=method, since=since, until=until,
+    )
     files = [
         {
             "filename": m.filename,
@@ -136,14 +539,16 @@ def dashboard(user=Depends(get_current_user), db: Session = Depends(lambda: Sess
             "method":   m.method,
             "timestamp": m.timestamp.isoformat()
         }
-        for m in user.files
+        for m in rows
     ]
     return {
         "email":        user.email,
         "tier":         user.tier,
         "license_key":  "••••••••••••" ,
         "can_show_key": True,
-        "files":        files
+        "files":        files,
+        "total":        total,
+        "next_cursor":  _encode_cursor(next_after) if next_after else None,
     }
 
 @router.get("/dashboard/key")
@@ -153,4 +558,5 @@ def get_license_key(user=Depends(get_current_user)):
 @router.get("/dashboard/json")
 def dashboard_json(user=Depends(get_current_user)):
     from app.json_store import get_entries
+    metawriter.settle(user.id)
     return {"files": get_entries(user.license_key)}
@@ -3,11 +3,12 @@ from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 
-from .db.session import SessionLocal
-from .db.crud    import get_user_by_email, get_user_by_license
+from .db.session import get_db
+from .db.crud    import get_user_by_email
+from .authcache  import lookup
 
 # SECRET used for signing JWTs
 # In production, set the SECRET_KEY environment variable
@@ -29,13 +30,6 @@ def create_access_token(data: dict) -> str:
     to_encode.update({"exp": datetime.utcnow()+ACCESS_EXPIRE})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def authenticate_user(db: Session, email: str, password: str):
     user = get_user_by_email(db, email)
     if not user or not verify_pwd(password, user.password_hash):
@@ -54,7 +48,8 @@ async def get_current_user(token: str = Depends(oauth2), db: Session = Depends(g
     except JWTError:
         raise creds_exc
 
-    user = get_user_by_license(db, sub)
+    # cached snapshot; the DB is only consulted on a miss
+    user = lookup(sub, db)
     if not user or not user.is_active:
         raise creds_exc
     return user
@@ -0,0 +1,74 @@
+import os
+from dataclasses import dataclass
+
+from app.cache import TTLCache
+from app import metrics
+from app.db.session import SessionLocal
+from app.db.models import User
+
+# ---------------- Config ----------------
+# A revoked key or tier change made on another worker is served stale for
+# at most AUTH_CACHE_TTL seconds; changes made here invalidate immediately.
+AUTH_CACHE_TTL  = int(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+_MISSING = object()
+_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+metrics.watch_cache("auth", _cache)
+
+
+@dataclass(frozen=True)
+class AuthUser:
+    """
+    Immutable snapshot of the user fields request handlers need; safe to
+    share between requests, unlike a session-bound ORM instance.
+    """
+    id: int
+    email: str
+    license_key: str
+    tier: str
+    is_active: bool
+
+
+def snapshot(user: User) -> AuthUser:
+    return AuthUser(
+        id=user.id,
+        email=user.email,
+        license_key=user.license_key,
+        tier=user.tier,
+        is_active=bool(user.is_active),
+    )
+
+
+def lookup(license_key: str, db=None) -> AuthUser | None:
+    """
+    Resolve a license key (the JWT subject) to a user snapshot, hitting the
+    database only on a cache miss. Unknown keys are cached as None too.
+    """
+    entry = _cache.get(license_key, _MISSING)
+    if entry is not _MISSING:
+        return entry
+    if db is None:
+        with SessionLocal() as db:
+            user = db.query(User).filter(User.license_key == license_key).first()
+            entry = snapshot(user) if user else None
+    else:
+        user = db.query(User).filter(User.license_key == license_key).first()
+        entry = snapshot(user) if user else None
+    _cache.set(license_key, entry)
+    return entry
+
+
+def invalidate(license_key: str) -> None:
+    """
+    Drop a cached entry; call after deactivation, tier changes or key rotation.
+    """
+    _cache.pop(license_key)
+
+
+def clear() -> None:
+    _cache.clear()
+
+
+def stats() -> dict:
+    return _cache.stats()
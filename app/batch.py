@@ -0,0 +1,198 @@
+import os
+import json
+import asyncio
+import hashlib
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import PurePosixPath
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator
+
+from app import admission
+from app.encryptor import TEMP_DIR, CHUNK_SIZE, encrypt_chunks, sanitize_filename
+from app.pipeline import MeteredUpload
+
+# ---------------- Config ----------------
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_FILES   = int(os.getenv("BATCH_MAX_FILES", "1000"))
+# encrypted outputs stay in memory below this size, spill to TEMP_DIR above it
+BATCH_SPOOL_BYTES = int(os.getenv("BATCH_SPOOL_BYTES", str(4 * CHUNK_SIZE)))
+# members started but not yet written to the zip; a slow client stalls the rest
+BATCH_MAX_BUFFERED = int(os.getenv("BATCH_MAX_BUFFERED", str(2 * BATCH_CONCURRENCY)))
+
+
+@dataclass
+class BatchResult:
+    name: str
+    arcname: str = ""
+    size: int = 0
+    sha256: str = ""
+    error: str | None = None
+    spool: SpooledTemporaryFile | None = field(default=None, repr=False)
+
+
+class ZipMember:
+    """
+    Async-readable view of one member of an uploaded zip, so archive entries
+    go through the same pipeline as plain uploads.
+    """
+
+    def __init__(self, zf: zipfile.ZipFile, info: zipfile.ZipInfo):
+        self._fh = zf.open(info)
+        self.filename = info.filename
+        self.size = info.file_size
+
+    async def read(self, size: int = -1) -> bytes:
+        # inflate off the event loop; ZipFile serialises access to the archive
+        return await asyncio.to_thread(self._fh.read, size)
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+def zip_members(zf: zipfile.ZipFile) -> list:
+    return [ZipMember(zf, info) for info in zf.infolist() if not info.is_dir()]
+
+
+class _ZipSink:
+    """
+    Write-only, unseekable target for ZipFile: bytes are buffered until the
+    response generator drains them, so the archive is never held whole.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self.pending = 0
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self.pending += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts, self.pending = [], 0
+        return out
+
+
+def _arcname(name: str, taken: set) -> str:
+    parts = [sanitize_filename(p) for p in PurePosixPath(name or "file").parts if p not in ("", ".", "..", "/")]
+    base = "/".join(p for p in parts if p) or "file"
+    arc, n = f"{base}.enc", 1
+    while arc in taken:
+        arc, n = f"{base}.{n}.enc", n + 1
+    taken.add(arc)
+    return arc
+
+
+async def _member_slot(own: asyncio.Semaphore, tier: str):
+    """
+    Release callback for a member's crypto slot: a free admission slot if
+    there is one, otherwise the batch's own request slot once it is idle.
+    """
+    ticket = admission.gate().try_admit(tier)
+    if ticket is not None:
+        return ticket.release
+    await own.acquire()
+    return own.release
+
+
+async def _encrypt_one(src, buffered, sem, own, password, method, user_level, rsa_public_key, cap, cap_msg) -> BatchResult:
+    # released by the zip writer once this member is out of its spool
+    await buffered.acquire()
+    async with sem:
+        release = await _member_slot(own, user_level)
+        try:
+            return await _seal_member(src, password, method, user_level, rsa_public_key, cap, cap_msg)
+        finally:
+            release()
+
+
+async def _seal_member(src, password, method, user_level, rsa_public_key, cap, cap_msg) -> BatchResult:
+    spool = SpooledTemporaryFile(max_size=BATCH_SPOOL_BYTES, dir=TEMP_DIR)
+    h = hashlib.sha256()
+    size = 0
+    try:
+        metered = MeteredUpload(src, cap, cap_msg)
+        async for piece in encrypt_chunks(metered, password, method, user_level, rsa_public_key):
+            spool.write(piece)
+            h.update(piece)
+            size += len(piece)
+    except Exception as e:
+        spool.close()
+        return BatchResult(src.filename or "", error=str(e) or type(e).__name__)
+    spool.seek(0)
+    return BatchResult(src.filename or "", size=size, sha256=h.hexdigest(), spool=spool)
+
+
+async def encrypt_batch_zip(
+    sources: list,
+    password: str,
+    method: str,
+    user_level: str,
+    rsa_public_key: str = None,
+    cap: int | None = None,
+    cap_message: str = "File size cap exceeded",
+    on_complete=None,
+) -> AsyncIterator[bytes]:
+    """
+    Encrypt ``sources`` concurrently (at most BATCH_CONCURRENCY at once) and
+    yield a zip of the ciphertexts, adding each entry as soon as it finishes.
+    No more than BATCH_MAX_BUFFERED members are in flight or waiting to be
+    written, so the client's read pace throttles encryption.
+    Every member runs on an admission slot: the caller's request slot, one
+    member at a time, plus whatever slots are free when a member starts.
+    A manifest.json entry lists every input with its digest or error.
+    ``on_complete(results)`` receives the successful results at the end.
+    """
+    buffered = asyncio.Semaphore(BATCH_MAX_BUFFERED)
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+    own = asyncio.Semaphore(1)
+    tasks = [
+        asyncio.create_task(
+            _encrypt_one(src, buffered, sem, own, password, method, user_level, rsa_public_key, cap, cap_message)
+        )
+        for src in sources
+    ]
+    sink = _ZipSink()
+    zf = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+    results, taken = [], set()
+    try:
+        for fut in asyncio.as_completed(tasks):
+            res = await fut
+            results.append(res)
+            if res.error is None:
+                res.arcname = _arcname(res.name, taken)
+                with zf.open(res.arcname, "w", force_zip64=True) as dst:
+                    while block := res.spool.read(CHUNK_SIZE):
+                        dst.write(block)
+                        if sink.pending >= CHUNK_SIZE:
+                            yield sink.drain()
+                res.spool.close()
+                res.spool = None
+            buffered.release()
+            if sink.pending:
+                yield sink.drain()
+
+        manifest = [
+            {"file": r.name, "entry": r.arcname, "size": r.size, "sha256": r.sha256}
+            if r.error is None else {"file": r.name, "error": r.error}
+            for r in results
+        ]
+        zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+        zf.close()
+        yield sink.drain()
+        if on_complete is not None:
+            on_complete([r for r in results if r.error is None])
+    finally:
+        for t in tasks:
+            t.cancel()
+        for r in results:
+            if r.spool is not None:
+                r.spool.close()
+        for src in sources:
+            if isinstance(src, ZipMember):
+                src.close()
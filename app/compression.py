@@ -0,0 +1,191 @@
+import os
+import lzma
+import math
+import zlib
+from collections import Counter
+
+try:  # Python 3.14+
+    from compression import zstd as _zstd
+except ImportError:
+    _zstd = None
+try:
+    import zstandard as _zstandard
+except ImportError:
+    _zstandard = None
+
+from app import metrics
+
+# ---------------- Config ----------------
+# codec applied before encryption: none | zlib | lzma | zstd
+COMPRESSION = os.getenv("ENCLYPT_COMPRESSION", "none").lower()
+# first-chunk entropy (bits/byte) above which data is treated as already
+# compressed (media, archives) and stored as is
+ENTROPY_MAX_BITS = float(os.getenv("COMPRESSION_ENTROPY_MAX", "7.5"))
+ENTROPY_SAMPLE = 64 * 1024
+# largest piece a decompressor hands back at once, so a small ciphertext
+# cannot expand into one huge buffer
+MAX_PIECE = 1024 * 1024
+
+
+class _Identity:
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class _Inflater:
+    """
+    zlib/lzma/zstd decompressor yielding at most MAX_PIECE bytes per piece.
+    """
+
+    def __init__(self, obj, tail_attr: str = None):
+        self._obj = obj
+        self._tail_attr = tail_attr      # zlib keeps leftover input here
+
+    def feed(self, data: bytes):
+        obj = self._obj
+        if obj.eof and data:
+            raise ValueError("Invalid ciphertext format.")
+        while data or self._pending():
+            piece = obj.decompress(data, MAX_PIECE)
+            data = getattr(obj, self._tail_attr) if self._tail_attr else b""
+            if piece:
+                yield piece
+            if not piece and not data:
+                break
+
+    def _pending(self) -> bool:
+        # lzma/zstd buffer input internally when output was capped
+        return not self._tail_attr and not self._obj.eof and not self._obj.needs_input
+
+    def close(self) -> None:
+        if not self._obj.eof or self._obj.unused_data:
+            raise ValueError("Invalid ciphertext format.")
+
+
+class _ZstandardInflater:
+    # the zstandard package's decompressobj has no output cap
+    def __init__(self):
+        self._obj = _zstandard.ZstdDecompressor().decompressobj()
+
+    def feed(self, data: bytes):
+        piece = self._obj.decompress(data)
+        for i in range(0, len(piece), MAX_PIECE):
+            yield piece[i:i + MAX_PIECE]
+
+    def close(self) -> None:
+        if not self._obj.eof:
+            raise ValueError("Invalid ciphertext format.")
+
+
+class _Capped:
+    """
+    Decompressor wrapper that fails once the output passes ``limit`` bytes,
+    so a small ciphertext cannot inflate without bound.
+    """
+
+    def __init__(self, inner, limit: int):
+        self._inner = inner
+        self._left = limit
+
+    def feed(self, data: bytes):
+        for piece in self._inner.feed(data):
+            self._left -= len(piece)
+            if self._left < 0:
+                raise ValueError("Decompressed data exceeds the size limit.")
+            yield piece
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+class _Passthrough:
+    def feed(self, data: bytes):
+        if data:
+            yield data
+
+    def close(self) -> None:
+        pass
+
+
+def available() -> list:
+    codecs = ["none", "zlib", "lzma"]
+    if _zstd is not None or _zstandard is not None:
+        codecs.append("zstd")
+    return codecs
+
+
+def _check(codec: str) -> str:
+    if codec not in available():
+        raise ValueError(f"Unsupported compression {codec!r}.")
+    return codec
+
+
+def compressor(codec: str):
+    """
+    Streaming compressor with ``compress(data)`` / ``flush()``.
+    """
+    _check(codec)
+    if codec == "zlib":
+        return zlib.compressobj(6)
+    if codec == "lzma":
+        return lzma.LZMACompressor(preset=3)
+    if codec == "zstd":
+        if _zstd is not None:
+            return _zstd.ZstdCompressor()
+        return _zstandard.ZstdCompressor().compressobj()
+    return _Identity()
+
+
+def decompressor(codec: str, limit: int = None):
+    """
+    Streaming decompressor: ``feed(data)`` yields plaintext pieces and
+    ``close()`` raises unless the compressed stream ended cleanly. With a
+    ``limit``, output past that many bytes raises ValueError.
+    """
+    unpacker = _unpacker(_check(codec))
+    return unpacker if limit is None else _Capped(unpacker, limit)
+
+
+def _unpacker(codec: str):
+    if codec == "zlib":
+        return _Inflater(zlib.decompressobj(), "unconsumed_tail")
+    if codec == "lzma":
+        return _Inflater(lzma.LZMADecompressor())
+    if codec == "zstd":
+        if _zstd is not None:
+            return _Inflater(_zstd.ZstdDecompressor())
+        return _ZstandardInflater()
+    return _Passthrough()
+
+
+def compress_all(codec: str, data: bytes) -> bytes:
+    packer = compressor(codec)
+    return packer.compress(data) + packer.flush()
+
+
+def entropy(sample: bytes) -> float:
+    """
+    Shannon entropy in bits per byte.
+    """
+    if not sample:
+        return 0.0
+    n = len(sample)
+    return -sum(c / n * math.log2(c / n) for c in Counter(sample).values())
+
+
+def choose(first_chunk: bytes, requested: str = None) -> str:
+    """
+    Codec for a new ciphertext: ``requested`` (default ENCLYPT_COMPRESSION),
+    or "none" when the first chunk already looks compressed.
+    """
+    codec = _check((requested or COMPRESSION).lower())
+    if codec == "none":
+        return codec
+    if entropy(first_chunk[:ENTROPY_SAMPLE]) > ENTROPY_MAX_BITS:
+        metrics.COMPRESSION_DECISIONS.inc(codec=codec, decision="skipped")
+        return "none"
+    metrics.COMPRESSION_DECISIONS.inc(codec=codec, decision="compressed")
+    return codec
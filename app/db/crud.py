@@ -1,7 +1,10 @@
-import hashlib, uuid
+import uuid
+from datetime import datetime
+from sqlalchemy import and_, func, or_, select, update
 from sqlalchemy.orm import Session
 from .models import User, FileMeta
-from app.json_store import add_entry as add_json_entry
+from app.encryptor import forget_master_keys
+from app import authcache, metawriter
 
 # file‐size caps (per file and total‐usage)
 PER_FILE_CAP = {
@@ -29,31 +32,127 @@ def create_user(db: Session, email: str, pwd_hash: str, tier: str="account") ->
     db.refresh(user)
     return user
 
+def deactivate_user(db: Session, user: User) -> User:
+    user.is_active = 0
+    db.commit()
+    authcache.invalidate(user.license_key)
+    forget_master_keys(user.license_key)
+    return user
+
+def set_user_tier(db: Session, user: User, tier: str) -> User:
+    user.tier = tier
+    db.commit()
+    authcache.invalidate(user.license_key)
+    return user
+
+def rotate_license_key(db: Session, user: User) -> User:
+    old_key = user.license_key
+    user.license_key = uuid.uuid4().hex
+    db.commit()
+    authcache.invalidate(old_key)
+    forget_master_keys(old_key)
+    return user
+
 def sum_user_usage(db: Session, user: User) -> int:
-    tot = db.query(FileMeta.file_size).filter(FileMeta.user_id==user.id).all()
-    return sum(sz for (sz,) in tot)
+    # maintained counter: one primary-key read however many files exist,
+    # plus whatever the write-behind buffer has not committed yet
+    used = db.query(User.bytes_used).filter(User.id==user.id).scalar()
+    return (used or 0) + metawriter.pending_bytes(user.id)
+
+def reconcile_usage(db: Session) -> int:
+    """
+    Rebuild every user's bytes_used and file_count from file_metadata;
+    returns rows updated.
+    """
+    total = (
+        select(func.coalesce(func.sum(FileMeta.file_size), 0))
+        .where(FileMeta.user_id == User.id)
+        .scalar_subquery()
+    )
+    count = (
+        select(func.count(FileMeta.id))
+        .where(FileMeta.user_id == User.id)
+        .scalar_subquery()
+    )
+    res = db.execute(update(User).values(bytes_used=total, file_count=count))
+    db.commit()
+    return res.rowcount
 
-def create_file_meta(
+def list_user_files(
     db: Session,
+    user: User,
+    limit: int,
+    after: tuple | None = None,
+    method: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> tuple:
+    """
+    One page of a user's files, newest first, via the (user_id, timestamp, id)
+    index. ``after`` is the (timestamp, id) of the last row already seen.
+    Returns (rows, total, next_after).
+    """
+    filters = [FileMeta.user_id == user.id]
+    if method:
+        filters.append(FileMeta.method == method)
+    if since:
+        filters.append(FileMeta.timestamp >= since)
+    if until:
+        filters.append(FileMeta.timestamp < until)
+
+    q = db.query(FileMeta).filter(*filters)
+    if after:
+        ts, last_id = after
+        q = q.filter(or_(
+            FileMeta.timestamp < ts,
+            and_(FileMeta.timestamp == ts, FileMeta.id < last_id),
+        ))
+    rows = q.order_by(FileMeta.timestamp.desc(), FileMeta.id.desc()).limit(limit + 1).all()
+
+    if len(filters) == 1:
+        # unfiltered total comes from the maintained counter
+        total = db.query(User.file_count).filter(User.id == user.id).scalar() or 0
+    else:
+        total = db.query(func.count(FileMeta.id)).filter(*filters).scalar()
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = (rows[-1].timestamp, rows[-1].id)
+    return rows, total, next_after
+
+def file_meta_record(
     user: User,
     filename: str,
-    content: bytes,
+    size: int,
+    content_hash: str,
     method: str
-) -> FileMeta:
-    h = hashlib.sha256(content).hexdigest()
-    meta = FileMeta(
-        user_id      = user.id,
-        filename     = filename,
-        file_size    = len(content),
-        content_hash = h,
-        method       = method
-    )
-    db.add(meta)
-    db.commit()
-    db.refresh(meta)
-    # persist basic metadata to simple JSON file as lightweight store
-    try:
-        add_json_entry(user.license_key, filename, len(content), method)
-    except Exception:
-        pass  # JSON logging should never break the API
-    return meta
+) -> dict:
+    """
+    A metadata record as metawriter.write_records() stores it. ``size`` and
+    ``content_hash`` describe the output and come from the single-pass
+    pipeline, so the file is never re-read.
+    """
+    return {
+        "record_id":    uuid.uuid4().hex,
+        "user_id":      user.id,
+        "license_key":  user.license_key,
+        "filename":     filename,
+        "file_size":    size,
+        "content_hash": content_hash,
+        "method":       method,
+        "timestamp":    datetime.utcnow().isoformat(),
+    }
+
+def queue_file_meta(
+    user: User,
+    filename: str,
+    size: int,
+    content_hash: str,
+    method: str
+) -> None:
+    """
+    Record an encrypt/decrypt off the request path: the record is logged
+    and inserted with the next write-behind batch (app/metawriter.py).
+    """
+    metawriter.get_writer().enqueue(file_meta_record(user, filename, size, content_hash, method))
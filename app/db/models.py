@@ -1,6 +1,7 @@
 from datetime import datetime
 from sqlalchemy import (
-    Column, Integer, String, DateTime, ForeignKey, BigInteger
+    Column, Integer, String, DateTime, ForeignKey, BigInteger, Index,
+    inspect, text
 )
 from sqlalchemy.orm import relationship
 from .session import Base
@@ -14,11 +15,20 @@ class User(Base):
     tier          = Column(String, nullable=False)  # "guest","account","paid"
     is_active     = Column(Integer, default=1)
     created_at    = Column(DateTime, default=datetime.utcnow)
+    # running total of FileMeta.file_size, kept in step by metawriter.write_records
+    bytes_used    = Column(BigInteger, nullable=False, default=0, server_default="0")
+    file_count    = Column(Integer, nullable=False, default=0, server_default="0")
 
     files = relationship("FileMeta", back_populates="owner")
 
 class FileMeta(Base):
     __tablename__ = "file_metadata"
+    # keyset pagination of a user's history walks this index newest-first
+    __table_args__ = (
+        Index("ix_file_metadata_user_ts", "user_id", "timestamp", "id"),
+        # write-behind records (app/metawriter.py) are replayed idempotently by this id
+        Index("ux_file_metadata_record", "record_id", unique=True),
+    )
     id           = Column(Integer, primary_key=True, index=True)
     user_id      = Column(Integer, ForeignKey("users.id"), nullable=False)
     filename     = Column(String, nullable=False)
@@ -26,5 +36,53 @@ class FileMeta(Base):
     content_hash = Column(String, nullable=False)
     method       = Column(String, nullable=False)
     timestamp    = Column(DateTime, default=datetime.utcnow)
+    record_id    = Column(String(32), nullable=True)
 
     owner = relationship("User", back_populates="files")
+
+
+class UploadSession(Base):
+    """
+    A resumable upload (app/uploads.py). Chunk ``i`` of the plaintext is
+    sealed as segment ``i`` on arrival, so ``next_index`` chunks of the
+    ciphertext at ``path`` are final.
+    """
+    __tablename__ = "upload_sessions"
+    id           = Column(String, primary_key=True)   # uuid hex, the public upload id
+    user_id      = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    filename     = Column(String, nullable=False)
+    method       = Column(String, nullable=False)
+    total_size   = Column(BigInteger, nullable=False)
+    chunk_size   = Column(Integer, nullable=False)
+    header_len   = Column(Integer, nullable=False)    # header + nonce prefix
+    next_index   = Column(Integer, nullable=False, default=0)
+    path         = Column(String, nullable=False)
+    created_at   = Column(DateTime, default=datetime.utcnow)
+    expires_at   = Column(DateTime, nullable=False, index=True)
+
+
+def upgrade_schema(engine) -> set:
+    """
+    ``create_all`` never alters existing tables: add any model columns and
+    indexes the database is missing. Returns the added "table.column" names.
+    """
+    insp = inspect(engine)
+    added = set()
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(engine.dialect)}"
+                if col.server_default is not None:
+                    ddl += f" DEFAULT {col.server_default.arg}"
+                    if not col.nullable:
+                        ddl += " NOT NULL"
+                conn.execute(text(ddl))
+                added.add(f"{table.name}.{col.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    return added
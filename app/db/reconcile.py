@@ -0,0 +1,20 @@
+"""
+Rebuild per-user usage counters from file_metadata.
+
+    python -m app.db.reconcile
+"""
+from app.db.session import SessionLocal, engine, Base
+from app.db.models import upgrade_schema
+from app.db.crud import reconcile_usage
+
+
+def main() -> None:
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    with SessionLocal() as db:
+        n = reconcile_usage(db)
+    print(f"Reconciled usage counters for {n} users")
+
+
+if __name__ == "__main__":
+    main()
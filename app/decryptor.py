@@ -1,90 +1,685 @@
 import os
+import io
 import uuid
-from pathlib import Path
-from base64 import urlsafe_b64decode, urlsafe_b64encode
-from typing import Literal
+from base64 import urlsafe_b64encode
+from typing import AsyncIterator, BinaryIO, Literal
 
 from cryptography.fernet import InvalidToken, Fernet
-from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives.asymmetric import padding as asym_padding
+from cryptography.hazmat.primitives.asymmetric import rsa
 
+from app.cache import TTLCache
+from app.header import MAGIC, Header, HeaderReader, FIXED_LEN, is_header, parse_header, read_header
 from app.encryptor import (
+    AEAD_INTO,
+    BufferReader,
     TEMP_DIR,
-    PBKDF2_ITERS,
-    derive_key,
+    CHUNK_SIZE,
+    NONCE_PREFIX_LEN,
+    TAG_LEN,
+    DATA_KEY_LEN,
+    MASTER_KEY_TTL,
+    RSA_KEY_CACHE_SIZE,
+    SALT_LEN,
+    OAEP_PADDING,
+    TIER_FILE_SIZE_LIMITS,
+    file_key,
+    header_key,
+    header_key_async,
+    iter_records,
+    master_key,
+    master_key_async,
+    pem_fingerprint,
     sanitize_filename,
+    segment_nonce,
     validate_method,
 )
+from app.workers import run_crypto
+from app import compression, metrics
 
 # Ensure temp dir exists
 TEMP_DIR.mkdir(parents=True, exist_ok=True, mode=0o700)
 
+# ---------------- Config ----------------
+# upper bound on a header's chunk size, so a forged header cannot make the
+# opener buffer arbitrary amounts of memory
+MAX_CHUNK_SIZE = int(os.getenv("MAX_CHUNK_SIZE", str(64 * 1024 * 1024)))
 
-def fernet_decrypt(token: bytes, password: str) -> bytes:
-    """
-    Decrypt a Fernet token that was prefixed with a 16-byte salt.
-    """
-    if len(token) < 17:
-        raise ValueError("Invalid token format.")
-    salt = token[:16]
-    token_body = token[16:]
-    # Derive same key as encryptor
-    key = urlsafe_b64encode(derive_key(password, salt))
+_private_keys = TTLCache(RSA_KEY_CACHE_SIZE, MASTER_KEY_TTL)
+metrics.watch_cache("rsa_private_key", _private_keys)
+
+
+def fernet_open(token_body: bytes, key: bytes) -> bytes:
     try:
-        return Fernet(key).decrypt(token_body)
+        return Fernet(urlsafe_b64encode(key)).decrypt(token_body)
     except InvalidToken:
         raise ValueError("Fernet decryption failed: invalid key or corrupted data.")
 
 
-def aes256_decrypt(data: bytes, password: str) -> bytes:
+def fernet_decrypt(token: bytes, password: str, max_size: int = None) -> bytes:
     """
-    Decrypt AES-256-GCM data prefixed with 16-byte salt and 12-byte nonce.
+    Decrypt a Fernet token behind a v1 header or a baseline 16-byte salt.
     """
-    if len(data) < 16 + 12 + 16:
-        raise ValueError("Invalid ciphertext format.")
-    salt = data[:16]
-    nonce = data[16:28]
-    ct = data[28:]
-    # Derive key
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=PBKDF2_ITERS,
-    )
-    key = kdf.derive(password.encode())
-    aesgcm = AESGCM(key)
+    out = io.BytesIO()
+    decrypt_any_stream(BufferReader(token), out, password=password, method="fernet", max_size=max_size)
+    return out.getvalue()
+
+
+def open_segment(key: bytes, prefix: bytes, index: int, segment: bytes, last: bool) -> bytes:
     try:
-        return aesgcm.decrypt(nonce, ct, None)
+        return AESGCM(key).decrypt(segment_nonce(prefix, index, last), segment, None)
     except Exception:
         raise ValueError("AES-256 decryption failed: invalid key or corrupted data.")
 
 
-def rsa_decrypt(data: bytes, private_key_pem: str) -> bytes:
+class SegmentOpener:
+    """
+    Incremental decryptor for the layout written by ``SegmentSealer``.
+    A truncated stream fails in ``close`` because its last segment was not
+    sealed with the final flag.
+    """
+
+    def __init__(self, key: bytes, prefix: bytes, chunk_size: int = CHUNK_SIZE):
+        self.key = key
+        self.prefix = prefix
+        self.record_size = chunk_size + TAG_LEN
+        self.index = 0
+        self._buf = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        self._buf += data
+        jobs = []
+        while len(self._buf) > self.record_size:
+            with memoryview(self._buf) as view:
+                segment = bytes(view[:self.record_size])
+            jobs.append(self._job(segment, False))
+            del self._buf[:self.record_size]
+        return jobs
+
+    def close(self) -> tuple:
+        if len(self._buf) < TAG_LEN:
+            raise ValueError("Invalid ciphertext format.")
+        job = self._job(bytes(self._buf), True)
+        self._buf = bytearray()
+        return job
+
+    def update(self, data: bytes) -> bytes:
+        return b"".join(open_segment(*job) for job in self.feed(data))
+
+    def finalize(self) -> bytes:
+        return open_segment(*self.close())
+
+    def open_records(self, records, dst: BinaryIO) -> int:
+        """
+        Open (segment, last) records from ``iter_records`` straight into
+        ``dst`` through one reused output buffer; returns plaintext bytes.
+        Nothing reaches ``dst`` before its segment authenticated.
+        """
+        aead = AESGCM(self.key)
+        out = bytearray()
+        total = 0
+        for segment, last in records:
+            if len(segment) < TAG_LEN:
+                raise ValueError("Invalid ciphertext format.")
+            nonce = segment_nonce(self.prefix, self.index, last)
+            self.index += 1
+            n = len(segment) - TAG_LEN
+            try:
+                if AEAD_INTO:
+                    if len(out) < n:
+                        out = bytearray(n)      # sized by the first full record
+                    plain = memoryview(out)[:n]
+                    aead.decrypt_into(nonce, segment, None, plain)
+                else:
+                    plain = aead.decrypt(nonce, segment, None)
+            except Exception:
+                raise ValueError("AES-256 decryption failed: invalid key or corrupted data.")
+            dst.write(plain)
+            total += n
+        return total
+
+    def _job(self, segment: bytes, last: bool) -> tuple:
+        job = (self.key, self.prefix, self.index, segment, last)
+        self.index += 1
+        return job
+
+
+def opened_length(body_size: int, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Plaintext size of ``body_size`` bytes of segments (header excluded).
+    """
+    segments = max(1, -(-body_size // (chunk_size + TAG_LEN)))
+    return body_size - segments * TAG_LEN
+
+
+def segment_size(header: Header) -> int:
+    if not 0 < header.chunk_size <= MAX_CHUNK_SIZE:
+        raise ValueError("Invalid ciphertext format.")
+    return header.chunk_size
+
+
+# enough leading bytes to hold any header the server writes
+HEADER_PEEK = 4096
+
+
+def sniff_method(head: bytes, method: str = None) -> str:
+    """
+    Cipher named by the header at the start of ``head``, else ``method``.
+    """
+    if is_header(head):
+        try:
+            return parse_header(head)[0].method
+        except ValueError:
+            return None
+    return method
+
+
+def opened_size(head: bytes, total_size: int, method: str = None):
+    """
+    Plaintext size of a ``total_size``-byte segmented ciphertext that starts
+    with ``head``, or None when it cannot be told up front.
+    """
+    if is_header(head):
+        try:
+            header, header_len = parse_header(head)
+        except ValueError:
+            return None
+        # compressed sizes say nothing about the plaintext
+        if header.method == "fernet" or not header.chunk_size or header.compression != "none":
+            return None
+        return opened_length(total_size - header_len - NONCE_PREFIX_LEN, header.chunk_size)
+    return None
+
+
+class _Unread:
+    """
+    Put sniffed bytes back in front of a sync stream.
+    """
+
+    def __init__(self, head: bytes, src: BinaryIO):
+        self._head = head
+        self._src = src
+
+    def read(self, size: int = -1) -> bytes:
+        if not self._head:
+            return self._src.read(size)
+        if size is None or size < 0:
+            data, self._head = self._head + self._src.read(), b""
+            return data
+        data, self._head = self._head[:size], self._head[size:]
+        if len(data) < size:
+            data += self._src.read(size - len(data))
+        return data
+
+
+class _AsyncUnread:
+    """
+    Async twin of ``_Unread`` for uploads.
+    """
+
+    def __init__(self, head: bytes, file):
+        self._head = head
+        self._file = file
+
+    async def read(self, size: int = -1) -> bytes:
+        if not self._head:
+            return await self._file.read(size)
+        if size is None or size < 0:
+            data, self._head = self._head + await self._file.read(), b""
+            return data
+        data, self._head = self._head[:size], self._head[size:]
+        if len(data) < size:
+            data += await self._file.read(size - len(data))
+        return data
+
+
+def sniff_header(src: BinaryIO) -> tuple:
+    """
+    (Header, src) for v1 ciphertexts, with ``src`` positioned at the body;
+    (None, src) for headerless ones, with nothing consumed.
+    """
+    head = src.read(len(MAGIC))
+    if is_header(head):
+        return read_header(src.read, head), src
+    return None, _Unread(head, src)
+
+
+# ------------- Baseline ciphertexts --------
+# Files written before the v1 header, keyed straight from PBKDF2
+# (LEGACY_KDF) over a leading 16-byte salt. fernet: salt | token;
+# aes256: salt | 12-byte nonce | one GCM ciphertext + tag.
+BASELINE_NONCE_LEN = 12
+# rsa: the whole file as one RSA-OAEP ciphertext, so exactly the modulus
+# size; anything past a 16384-bit modulus cannot be one
+BASELINE_RSA_MAX = 2048
+
+
+def baseline_fernet_split(token: bytes) -> tuple:
+    """
+    (salt, Fernet token) of a baseline fernet ciphertext.
     """
-    Decrypt data encrypted with RSA-OAEP + SHA256.
+    if len(token) < SALT_LEN + 1:
+        raise ValueError("Invalid token format.")
+    return token[:SALT_LEN], token[SALT_LEN:]
+
+
+def baseline_aes256_open(data: bytes, key: bytes) -> bytes:
+    """
+    Decrypt a baseline aes256 ciphertext with the key from its salt.
+    """
+    if len(data) < SALT_LEN + BASELINE_NONCE_LEN + TAG_LEN:
+        raise ValueError("Invalid ciphertext format.")
+    with memoryview(data) as view:
+        nonce = bytes(view[SALT_LEN:SALT_LEN + BASELINE_NONCE_LEN])
+        try:
+            return AESGCM(key).decrypt(nonce, view[SALT_LEN + BASELINE_NONCE_LEN:], None)
+        except Exception:
+            raise ValueError("AES-256 decryption failed: invalid key or corrupted data.")
+
+
+def baseline_rsa_open(data: bytes, private_key_pem: str) -> bytes:
     """
+    Decrypt a baseline rsa ciphertext: the whole file under RSA-OAEP.
+    """
+    if not private_key_pem:
+        raise ValueError("RSA private key required for RSA decryption.")
+    private_key = load_private_key(private_key_pem)
+    if len(data) != private_key.key_size // 8:
+        raise ValueError("Invalid ciphertext format.")
     try:
-        private_key = serialization.load_pem_private_key(
-            private_key_pem.encode(),
-            password=None,
-        )
+        return private_key.decrypt(bytes(data), OAEP_PADDING)
     except Exception:
-        raise ValueError("Invalid RSA private key format.")
+        raise ValueError("RSA decryption failed: invalid key or corrupted data.")
+
+
+def _need_password(password: str, method: str) -> str:
+    if not password:
+        raise ValueError(f"Password required for {method} decryption.")
+    return password
+
+
+def unlock_header(header: Header, password: str = None, rsa_private_key: str = None) -> bytes:
+    """
+    Per-file key of a v1 ciphertext, from the password or the RSA private key.
+    """
+    if header.method == "rsa":
+        if not rsa_private_key:
+            raise ValueError("RSA private key required for RSA decryption.")
+        return file_key(unwrap_key(header.wrapped_key, rsa_private_key), b"", header.context())
+    return header_key(_need_password(password, header.method), header)
 
+
+async def unlock_header_async(header: Header, password: str = None, rsa_private_key: str = None) -> bytes:
+    if header.method == "rsa":
+        return await run_crypto(unlock_header, header, None, rsa_private_key)
+    return await header_key_async(_need_password(password, header.method), header)
+
+
+def _read_prefix(src: BinaryIO) -> bytes:
+    prefix = src.read(NONCE_PREFIX_LEN)
+    if len(prefix) != NONCE_PREFIX_LEN:
+        raise ValueError("Invalid ciphertext format.")
+    return prefix
+
+
+def decrypt_any_stream(
+    src: BinaryIO,
+    dst: BinaryIO,
+    password: str = None,
+    rsa_private_key: str = None,
+    method: str = None,
+    max_size: int = None,
+) -> tuple:
+    """
+    Decrypt any ciphertext from ``src`` into ``dst``. A v1 header decides the
+    cipher and chunk size; headerless (baseline) files are decrypted whole
+    as ``method``. Compressed files may inflate to at most ``max_size``
+    bytes. Returns (plaintext bytes written, method).
+    """
+    header, src = sniff_header(src)
+    if header is not None:
+        key = unlock_header(header, password, rsa_private_key)
+        if header.method == "fernet":
+            unpacker = compression.decompressor(header.compression, max_size)
+            total = _write_pieces(unpacker.feed(fernet_open(src.read(), key)), dst)
+            unpacker.close()
+            return total, "fernet"
+        opener = SegmentOpener(key, _read_prefix(src), segment_size(header))
+        return open_stream(src, dst, opener, header.compression, max_size), header.method
+
+    if method == "fernet":
+        salt, body = baseline_fernet_split(src.read())
+        plain = fernet_open(body, master_key(_need_password(password, method), salt))
+        dst.write(plain)
+        return len(plain), method
+    if method == "aes256":
+        data = src.read()
+        plain = baseline_aes256_open(data, master_key(_need_password(password, method), data[:SALT_LEN]))
+        dst.write(plain)
+        return len(plain), method
+    if method == "rsa":
+        plain = baseline_rsa_open(src.read(BASELINE_RSA_MAX + 1), rsa_private_key)
+        dst.write(plain)
+        return len(plain), method
+    raise ValueError("Unsupported decryption method.")
+
+
+def decrypt_stream(
+    src: BinaryIO,
+    dst: BinaryIO,
+    password: str,
+    max_size: int = None,
+) -> int:
+    """
+    Decrypt a segmented AES-256-GCM stream from ``src`` into ``dst``.
+    Returns the number of plaintext bytes written.
+    """
+    return decrypt_any_stream(src, dst, password=password, method="aes256", max_size=max_size)[0]
+
+
+def _write_pieces(pieces, dst: BinaryIO) -> int:
+    total = 0
+    for plain in pieces:
+        total += len(plain)
+        dst.write(plain)
+    return total
+
+
+def open_stream(
+    src: BinaryIO,
+    dst: BinaryIO,
+    opener: SegmentOpener,
+    codec: str = "none",
+    max_size: int = None,
+) -> int:
+    """
+    Pump the segments left in ``src`` through ``opener`` and the ``codec``
+    decompressor (capped at ``max_size`` bytes) into ``dst``; returns
+    plaintext bytes written.
+    """
+    if codec == "none" and opener.index == 0 and not opener._buf:
+        return opener.open_records(iter_records(src, opener.record_size), dst)
+    unpacker = compression.decompressor(codec, max_size)
+    total = 0
+    while True:
+        chunk = src.read(opener.record_size)
+        if not chunk:
+            break
+        total += _write_pieces(unpacker.feed(opener.update(chunk)), dst)
+    total += _write_pieces(unpacker.feed(opener.finalize()), dst)
+    unpacker.close()
+    return total
+
+
+def aes256_decrypt(data: bytes, password: str) -> bytes:
+    """
+    Decrypt segmented AES-256-GCM data held in memory.
+    """
+    out = io.BytesIO()
+    decrypt_stream(BufferReader(data), out, password)
+    return out.getvalue()
+
+
+def load_private_key(private_key_pem: str):
+    fp = pem_fingerprint(private_key_pem)
+    key = _private_keys.get(fp)
+    if key is None:
+        try:
+            key = serialization.load_pem_private_key(
+                private_key_pem.encode(),
+                password=None,
+            )
+        except Exception:
+            raise ValueError("Invalid RSA private key format.")
+        if not isinstance(key, rsa.RSAPrivateKey):
+            raise ValueError("Invalid RSA private key format.")
+        _private_keys.set(fp, key)
+    return key
+
+
+def unwrap_key(wrapped: bytes, private_key_pem: str) -> bytes:
+    """
+    Recover the data key that ``new_rsa_file_key`` wrapped with RSA-OAEP.
+    """
+    private_key = load_private_key(private_key_pem)
     try:
-        return private_key.decrypt(
-            data,
-            asym_padding.OAEP(
-                mgf=asym_padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None,
-            ),
-        )
+        key = private_key.decrypt(wrapped, OAEP_PADDING)
     except Exception:
         raise ValueError("RSA decryption failed: invalid key or corrupted data.")
+    if len(key) != DATA_KEY_LEN:
+        raise ValueError("RSA decryption failed: invalid key or corrupted data.")
+    return key
+
+
+def rsa_decrypt_stream(
+    src: BinaryIO,
+    dst: BinaryIO,
+    private_key_pem: str,
+    max_size: int = None,
+) -> int:
+    """
+    Decrypt hybrid RSA output: unwrap the data key, then open the segments.
+    """
+    return decrypt_any_stream(src, dst, rsa_private_key=private_key_pem, method="rsa", max_size=max_size)[0]
+
+
+def rsa_decrypt(data: bytes, private_key_pem: str) -> bytes:
+    """
+    Decrypt hybrid RSA-OAEP + AES-256-GCM data held in memory.
+    """
+    out = io.BytesIO()
+    rsa_decrypt_stream(BufferReader(data), out, private_key_pem)
+    return out.getvalue()
+
+
+# ------------- Range decryption ----------
+def parse_byte_range(spec: str, size: int) -> tuple:
+    """
+    Half-open (start, stop) for an inclusive "a-b", "a-" or suffix "-n"
+    range over ``size`` bytes; ValueError when it selects nothing.
+    """
+    first, sep, last = spec.strip().partition("-")
+    try:
+        if not sep or not (first or last):
+            raise ValueError
+        if not first:
+            start, stop = max(0, size - int(last)), size
+        else:
+            start = int(first)
+            stop = size if not last else min(int(last) + 1, size)
+            if last and int(last) < start:
+                raise ValueError
+    except ValueError:
+        raise ValueError("Invalid byte range.")
+    if not 0 <= start < stop:
+        raise ValueError("Range not satisfiable.")
+    return start, stop
+
+
+def _range_chunk_size(header: Header) -> int:
+    # fernet, compressed and baseline (headerless) files have no per-range layout
+    if header is None or header.method == "fernet" or header.compression != "none":
+        raise ValueError("Range decryption needs an uncompressed v1 aes256 or rsa ciphertext.")
+    return segment_size(header)
+
+
+def _range_segments(body_size: int, chunk_size: int, start: int, stop: int):
+    """
+    (index, slice start, slice stop, last) for each segment holding
+    plaintext bytes [start, stop) of ``body_size`` bytes of segments.
+    """
+    final = max(1, -(-body_size // (chunk_size + TAG_LEN))) - 1
+    stop = min(stop, opened_length(body_size, chunk_size))
+    for index in range(start // chunk_size, -(-stop // chunk_size)):
+        base = index * chunk_size
+        yield index, max(start - base, 0), stop - base, index == final
+
+
+def decrypt_range(
+    src: BinaryIO,
+    dst: BinaryIO,
+    start: int,
+    stop: int,
+    password: str = None,
+    rsa_private_key: str = None,
+) -> int:
+    """
+    Write plaintext bytes [start, stop) of the segmented ciphertext in the
+    seekable ``src`` to ``dst``. Only the segments covering the range are
+    read and authenticated, so the cost follows the range, not the file.
+    Returns the bytes written (short if ``stop`` is past the end).
+    """
+    src.seek(0)
+    header, _ = sniff_header(src)
+    chunk_size = _range_chunk_size(header)
+    key = unlock_header(header, password, rsa_private_key)
+    prefix = _read_prefix(src)
+    body = src.tell()
+    body_size = src.seek(0, io.SEEK_END) - body
+    record = chunk_size + TAG_LEN
+    written = 0
+    for index, lo, hi, last in _range_segments(body_size, chunk_size, start, stop):
+        src.seek(body + index * record)
+        plain = open_segment(key, prefix, index, src.read(record), last)
+        written += dst.write(memoryview(plain)[lo:hi])
+    return written
+
+
+async def _read_exact(file, size: int) -> bytes:
+    data = await file.read(size)
+    if len(data) != size:
+        raise ValueError("Invalid ciphertext format.")
+    return data
+
+
+async def read_header_async(file, head: bytes) -> tuple:
+    """
+    (Header, header length) from an upload whose first bytes were ``head``.
+    """
+    reader = HeaderReader()
+    reader.feed(head + await _read_exact(file, FIXED_LEN - len(head)))
+    while reader.need:
+        reader.feed(await _read_exact(file, reader.need))
+    return reader.header, reader.size
+
+
+async def decrypt_range_chunks(
+    file,
+    size: int,
+    start: int,
+    stop: int,
+    password: str = None,
+    rsa_private_key: str = None,
+) -> AsyncIterator[bytes]:
+    """
+    Async twin of ``decrypt_range`` for a seekable ``size``-byte upload:
+    yields the plaintext of [start, stop) one authenticated segment at a
+    time, with the KDF and every segment on the crypto pool.
+    """
+    await file.seek(0)
+    head = await file.read(len(MAGIC))
+    header, header_len = await read_header_async(file, head) if is_header(head) else (None, 0)
+    chunk_size = _range_chunk_size(header)
+    key = await unlock_header_async(header, password, rsa_private_key)
+    prefix = await _read_exact(file, NONCE_PREFIX_LEN)
+    body = header_len + NONCE_PREFIX_LEN
+    record = chunk_size + TAG_LEN
+    for index, lo, hi, last in _range_segments(size - body, chunk_size, start, stop):
+        await file.seek(body + index * record)
+        segment = await file.read(record)
+        plain = await run_crypto(open_segment, key, prefix, index, segment, last)
+        yield plain[lo:hi]
+
+
+async def _inflate(unpacker, codec: str, data: bytes, timer):
+    """
+    Decompressed pieces of ``data``, produced off the event loop.
+    """
+    if codec == "none":
+        yield data
+        return
+    pieces = unpacker.feed(data)
+    while (piece := await timer.timed("decompress", run_crypto(next, pieces, None, local=True))) is not None:
+        yield piece
+
+
+async def decrypt_chunks(
+    file,
+    password: str,
+    method: Literal["fernet", "aes256", "rsa"],
+    user_level: Literal["guest", "account", "paid"],
+    rsa_private_key: str = None,
+    timer: metrics.StageTimer = None,
+) -> AsyncIterator[bytes]:
+    """
+    Read the uploaded ciphertext once and yield plaintext pieces. Segmented
+    formats yield each segment only after it authenticated. A v1 header
+    overrides ``method``; the tier must allow both.
+    """
+    own_timer = timer is None
+    if own_timer:
+        timer = metrics.StageTimer("decrypt", method, user_level)
+    try:
+        # Check permissions
+        validate_method(method, user_level)
+
+        head = await timer.timed("read", file.read(len(MAGIC)))
+        if is_header(head):
+            header, header_len = await timer.timed("read", read_header_async(file, head))
+            timer.bytes_in += header_len
+            validate_method(header.method, user_level)
+            cipher, codec = header.method, header.compression
+            chunk_size = segment_size(header) if cipher != "fernet" else 0
+            key = await timer.timed("kdf", unlock_header_async(header, password, rsa_private_key))
+        else:
+            file = _AsyncUnread(head, file)
+            cipher, codec, chunk_size, key = method, "none", CHUNK_SIZE, None
+        # a compressed file may not inflate past what the tier could upload
+        unpacker = compression.decompressor(codec, TIER_FILE_SIZE_LIMITS.get(user_level))
+
+        if cipher == "aes256" and key is None:
+            data = await timer.timed("read", file.read())
+            timer.bytes_in += len(data)
+            key = await timer.timed("kdf", master_key_async(_need_password(password, cipher), data[:SALT_LEN]))
+            yield timer.out(await timer.timed("cipher", run_crypto(baseline_aes256_open, data, key)))
+
+        elif cipher == "rsa" and key is None:
+            data = await timer.timed("read", file.read(BASELINE_RSA_MAX + 1))
+            timer.bytes_in += len(data)
+            yield timer.out(await timer.timed("cipher", run_crypto(baseline_rsa_open, data, rsa_private_key)))
+
+        elif cipher in ("aes256", "rsa"):
+            opener = SegmentOpener(key, await _read_exact(file, NONCE_PREFIX_LEN), chunk_size)
+            timer.bytes_in += NONCE_PREFIX_LEN
+            while chunk := await timer.timed("read", file.read(chunk_size + TAG_LEN)):
+                timer.bytes_in += len(chunk)
+                for job in opener.feed(chunk):
+                    plain = await timer.timed("cipher", run_crypto(open_segment, *job))
+                    async for piece in _inflate(unpacker, codec, plain, timer):
+                        yield timer.out(piece)
+            plain = await timer.timed("cipher", run_crypto(open_segment, *opener.close()))
+            async for piece in _inflate(unpacker, codec, plain, timer):
+                yield timer.out(piece)
+            unpacker.close()
+
+        elif cipher == "fernet":
+            content = await timer.timed("read", file.read())
+            timer.bytes_in += len(content)
+            if key is None:
+                salt, content = baseline_fernet_split(content)
+                key = await timer.timed("kdf", master_key_async(_need_password(password, cipher), salt))
+            plain = await timer.timed("cipher", run_crypto(fernet_open, content, key))
+            async for piece in _inflate(unpacker, codec, plain, timer):
+                yield timer.out(piece)
+            unpacker.close()
+
+        else:
+            raise ValueError("Unsupported decryption method.")
+        timer.ok = True
+    finally:
+        if own_timer:
+            timer.record()
 
 
 async def decrypt_file(
@@ -98,28 +693,22 @@ async def decrypt_file(
     Read the uploaded encrypted file, decrypt it based on the method and user tier,
     and write the plaintext to a temporary file, returning its path.
     """
-    # Check permissions
-    validate_method(method, user_level)
-
-    content = await file.read()
-
-    if method == "fernet":
-        plaintext = fernet_decrypt(content, password)
-    elif method == "aes256":
-        plaintext = aes256_decrypt(content, password)
-    elif method == "rsa":
-        if not rsa_private_key:
-            raise ValueError("RSA private key required for RSA decryption.")
-        plaintext = rsa_decrypt(content, rsa_private_key)
-    else:
-        raise ValueError("Unsupported decryption method.")
-
-    # Sanitize and write output
+    # Sanitize output name
     safe_name = sanitize_filename(file.filename or "decrypted.bin")
     out_name = f"dec_{uuid.uuid4().hex}_{safe_name}"
     out_path = TEMP_DIR / out_name
 
-    with open(out_path, "wb") as f_out:
-        f_out.write(plaintext)
+    timer = metrics.StageTimer("decrypt", method, user_level)
+    try:
+        with open(out_path, "wb") as f_out:
+            async for piece in decrypt_chunks(file, password, method, user_level, rsa_private_key, timer):
+                with timer.stage("write"):
+                    f_out.write(piece)
+    except BaseException:
+        # never leave unauthenticated partial plaintext behind
+        out_path.unlink(missing_ok=True)
+        raise
+    finally:
+        timer.record()
 
     return str(out_path)
@@ -1,20 +1,54 @@
 import os
+import io
 import uuid
+import hashlib
 import secrets
 from pathlib import Path
 from base64 import urlsafe_b64encode
-from typing import Literal
+from typing import AsyncIterator, BinaryIO, Literal
 
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.asymmetric import padding as asym_padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app.cache import TTLCache
+from app.header import Header
+from app import kdf as kdfs
+from app import compression
+from app.workers import run_crypto
+from app import metrics
 
 # ---------------- Config ----------------
 TEMP_DIR = Path("temp_files")
 TEMP_DIR.mkdir(parents=True, exist_ok=True, mode=0o700)
-PBKDF2_ITERS = 200_000
+# Cost for new ciphertexts; it is recorded in each header, so changing it
+# never breaks existing files. Headerless (baseline) files used 200,000.
+PBKDF2_ITERS = int(os.getenv("PBKDF2_ITERS", "200000"))
+LEGACY_PBKDF2_ITERS = 200_000
+
+# PBKDF2 master keys are cached per (password, master salt) for this long
+MASTER_KEY_TTL        = int(os.getenv("MASTER_KEY_TTL", "900"))
+MASTER_KEY_CACHE_SIZE = int(os.getenv("MASTER_KEY_CACHE_SIZE", "1024"))
+# parsed RSA keys, keyed by PEM fingerprint
+RSA_KEY_CACHE_SIZE    = int(os.getenv("RSA_KEY_CACHE_SIZE", "256"))
+
+# Streaming AES-256-GCM: plaintext is sealed in fixed-size segments so memory
+# stays bounded by CHUNK_SIZE regardless of file size.
+CHUNK_SIZE = 1024 * 1024
+SALT_LEN = 16
+NONCE_PREFIX_LEN = 7
+DATA_KEY_LEN = 32
+TAG_LEN = 16
+# AESGCM.encrypt_into/decrypt_into (newer cryptography releases) write
+# segments into a reused buffer; older ones allocate one per segment
+AEAD_INTO = hasattr(AESGCM, "encrypt_into")
+# streaming read buffers start this small and grow towards a full record
+# only as they fill, so short inputs never allocate (and fault in) whole chunks
+RECORD_BUF_MIN = 64 * 1024
 
 ALLOWED_METHODS = {
     "guest":   ["fernet"],
@@ -40,81 +74,609 @@ def sanitize_filename(name: str) -> str:
     return "".join(c for c in base if c.isalnum() or c in ("-", "_", "."))
 
 
-def derive_key(password: str, salt: bytes, length: int = 32) -> bytes:
+def derive_key(password: str, salt: bytes, length: int = 32, iterations: int = PBKDF2_ITERS) -> bytes:
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=length,
         salt=salt,
-        iterations=PBKDF2_ITERS,
+        iterations=iterations,
     )
     return kdf.derive(password.encode())
 
+
+# (KDF name, encoded params) as stored in the header
+def pbkdf2_params(iterations: int) -> bytes:
+    return kdfs.pack_params("pbkdf2-sha256", {"iterations": iterations})
+
+
+LEGACY_KDF = ("pbkdf2-sha256", pbkdf2_params(LEGACY_PBKDF2_ITERS))
+
+
+def current_kdf(tier: str = None) -> tuple:
+    """
+    KDF for new ciphertexts: the calibrated entry for ``tier`` (see
+    ``python -m app.kdf``), else ENCLYPT_KDF at its default cost.
+    """
+    name, params = kdfs.tier_params(tier)
+    if params is None:
+        if name == "pbkdf2-sha256":
+            return ("pbkdf2-sha256", pbkdf2_params(PBKDF2_ITERS))
+        params = kdfs.get(name).defaults
+    return (name, kdfs.pack_params(name, params))
+
+
+def derive_master(password: str, salt: bytes, kdf: tuple = LEGACY_KDF) -> bytes:
+    name, packed = kdf
+    params = kdfs.unpack_params(name, packed)
+    if name == "pbkdf2-sha256":
+        return derive_key(password, salt, 32, params["iterations"])
+    return kdfs.derive(name, password, salt, params)
+
+
+# ------------- Key hierarchy ------------
+# The expensive password KDF runs once per (password, master salt) and the
+# result is cached; every file gets its own key from a cheap HKDF over a
+# fresh per-file salt. Both salts travel in the ciphertext header.
+_master_keys   = TTLCache(MASTER_KEY_CACHE_SIZE, MASTER_KEY_TTL)
+_session_salts = TTLCache(MASTER_KEY_CACHE_SIZE, MASTER_KEY_TTL)
+metrics.watch_cache("master_key", _master_keys)
+metrics.watch_cache("session_salt", _session_salts)
+
+
+def _password_id(password: str) -> bytes:
+    # cache keys never hold the raw license key
+    return hashlib.sha256(password.encode()).digest()
+
+
+def master_key(password: str, master_salt: bytes, kdf: tuple = LEGACY_KDF) -> bytes:
+    # KDF params are part of the key: the same salt under another cost is another key
+    ck = (_password_id(password), kdf, master_salt)
+    key = _master_keys.get(ck)
+    if key is None:
+        key = derive_master(password, master_salt, kdf)
+        _master_keys.set(ck, key)
+    return key
+
+
+async def master_key_async(password: str, master_salt: bytes, kdf: tuple = LEGACY_KDF) -> bytes:
+    ck = (_password_id(password), kdf, master_salt)
+    key = _master_keys.get(ck)
+    if key is None:
+        key = await run_crypto(derive_master, password, master_salt, kdf)
+        _master_keys.set(ck, key)
+    return key
+
+
+def session_salt(password: str) -> bytes:
+    """
+    Master salt used for new ciphertexts of this password until the cache
+    entry expires, so one PBKDF2 run covers a whole session of uploads.
+    """
+    pid = _password_id(password)
+    salt = _session_salts.get(pid)
+    if salt is None:
+        salt = secrets.token_bytes(SALT_LEN)
+        _session_salts.set(pid, salt)
+    return salt
+
+
+def file_key(master: bytes, file_salt: bytes, context: bytes = b"") -> bytes:
+    """
+    Per-file key. ``context`` is the digest of the v1 header it belongs to.
+    """
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=file_salt,
+        info=b"enclypt file key" + context,
+    ).derive(master)
+
+
+def _password_header(password: str, method: str, chunk_size: int, tier: str, codec: str) -> tuple:
+    kdf = current_kdf(tier)
+    master_salt = session_salt(password)
+    header = Header(
+        method=method,
+        chunk_size=chunk_size,
+        compression=codec,
+        kdf=kdf[0],
+        kdf_params=kdf[1],
+        salt=master_salt + secrets.token_bytes(SALT_LEN),
+    )
+    return header, kdf, master_salt
+
+
+def new_file_key(
+    password: str,
+    method: str = "aes256",
+    chunk_size: int = CHUNK_SIZE,
+    tier: str = None,
+    codec: str = "none",
+) -> tuple:
+    """
+    Return (header bytes, key) for a new ciphertext; ``tier`` picks the KDF
+    cost and ``codec`` is the compression applied before encryption.
+    """
+    header, kdf, master_salt = _password_header(password, method, chunk_size, tier, codec)
+    master = master_key(password, master_salt, kdf)
+    return header.pack(), file_key(master, header.salt[SALT_LEN:], header.context())
+
+
+async def new_file_key_async(
+    password: str,
+    method: str = "aes256",
+    chunk_size: int = CHUNK_SIZE,
+    tier: str = None,
+    codec: str = "none",
+) -> tuple:
+    header, kdf, master_salt = _password_header(password, method, chunk_size, tier, codec)
+    master = await master_key_async(password, master_salt, kdf)
+    return header.pack(), file_key(master, header.salt[SALT_LEN:], header.context())
+
+
+def _header_kdf(header: Header) -> tuple:
+    if len(header.salt) != 2 * SALT_LEN:
+        raise ValueError("Invalid ciphertext format.")
+    return (header.kdf, header.kdf_params)
+
+
+def header_key(password: str, header: Header) -> bytes:
+    """
+    Recover the per-file key of a password-based v1 ciphertext.
+    """
+    master = master_key(password, header.salt[:SALT_LEN], _header_kdf(header))
+    return file_key(master, header.salt[SALT_LEN:], header.context())
+
+
+async def header_key_async(password: str, header: Header) -> bytes:
+    master = await master_key_async(password, header.salt[:SALT_LEN], _header_kdf(header))
+    return file_key(master, header.salt[SALT_LEN:], header.context())
+
+
+def forget_master_keys(password: str) -> int:
+    """
+    Evict every cached master key for ``password``; call when a license key
+    is rotated or its user deactivated.
+    """
+    pid = _password_id(password)
+    _session_salts.pop(pid)
+    return _master_keys.evict(lambda ck: ck[0] == pid)
+
+
+# ------------- RSA key wrapping ---------
+# RSA only ever wraps a random 32-byte data key with OAEP; the payload goes
+# through the same segmented AES-256-GCM path as "aes256".
+_public_keys = TTLCache(RSA_KEY_CACHE_SIZE, MASTER_KEY_TTL)
+metrics.watch_cache("rsa_public_key", _public_keys)
+
+OAEP_PADDING = asym_padding.OAEP(
+    mgf=asym_padding.MGF1(hashes.SHA256()),
+    algorithm=hashes.SHA256(),
+    label=None
+)
+
+
+def pem_fingerprint(pem: str) -> bytes:
+    return hashlib.sha256(pem.strip().encode()).digest()
+
+
+def load_public_key(public_key_pem: str):
+    fp = pem_fingerprint(public_key_pem)
+    key = _public_keys.get(fp)
+    if key is None:
+        try:
+            key = serialization.load_pem_public_key(
+                public_key_pem.encode(),
+            )
+        except Exception:
+            raise ValueError("Invalid RSA public key.")
+        if not isinstance(key, rsa.RSAPublicKey):
+            raise ValueError("Invalid RSA public key.")
+        _public_keys.set(fp, key)
+    return key
+
+
+def new_rsa_file_key(public_key_pem: str, chunk_size: int = CHUNK_SIZE, codec: str = "none") -> tuple:
+    """
+    Return (header bytes, key): the header carries a fresh data key wrapped
+    with RSA-OAEP; the segment key is derived from it and the header.
+    """
+    data_key = secrets.token_bytes(DATA_KEY_LEN)
+    wrapped = load_public_key(public_key_pem).encrypt(data_key, OAEP_PADDING)
+    header = Header(method="rsa", chunk_size=chunk_size, wrapped_key=wrapped, compression=codec)
+    return header.pack(), file_key(data_key, b"", header.context())
+
+
+def check_size_limit(size: int, user_level: str):
+    size_limit = TIER_FILE_SIZE_LIMITS.get(user_level.lower())
+    if size_limit is not None and size > size_limit:
+        raise ValueError(f"File size exceeds {size_limit // (1024*1024)} MB limit for {user_level} tier")
+
+
+class BufferReader:
+    """
+    File-like reader over any buffer (bytes, bytearray, memoryview, mmap).
+    ``readview`` hands out slices of the buffer itself rather than copies.
+    """
+
+    def __init__(self, buf):
+        self._view = memoryview(buf).cast("B")
+        self._pos = 0
+
+    def readview(self, size: int = -1) -> memoryview:
+        end = len(self._view)
+        if size is not None and size >= 0:
+            end = min(self._pos + size, end)
+        view = self._view[self._pos:end]
+        self._pos = max(self._pos, end)
+        return view
+
+    def read(self, size: int = -1) -> bytes:
+        return bytes(self.readview(size))
+
+    def readinto(self, b) -> int:
+        view = self.readview(len(b))
+        b[:len(view)] = view
+        return len(view)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        self._view.release()
+
+
+def read_first(src, size: int):
+    """
+    Up to ``size`` leading bytes, as a view when ``src`` can lend one.
+    """
+    readview = getattr(src, "readview", None)
+    return readview(size) if readview is not None else src.read(size)
+
+
+def _fill(src, view: memoryview, filled: int = 0) -> int:
+    # read until ``view`` is full or the source is exhausted
+    readinto = getattr(src, "readinto", None)
+    while filled < len(view):
+        if readinto is not None:
+            n = readinto(view[filled:])
+        else:
+            data = src.read(len(view) - filled)
+            n = len(data)
+            view[filled:filled + n] = data
+        if not n:
+            break
+        filled += n
+    return filled
+
+
+def _fill_record(src, buf: bytearray, size: int, filled: int = 0) -> tuple:
+    """
+    Read into ``buf`` until it holds ``size`` bytes or ``src`` runs dry,
+    growing it fourfold (up to ``size``) whenever it fills up; returns
+    (buffer, bytes filled).
+    """
+    while True:
+        with memoryview(buf) as view:
+            filled = _fill(src, view, filled)
+        if filled < len(buf) or len(buf) >= size:
+            return buf, filled
+        grown = bytearray(min(size, 4 * len(buf)))
+        grown[:filled] = buf
+        buf = grown
+
+
+def iter_records(src, size: int, first=None):
+    """
+    Yield (record, last) for consecutive ``size``-byte records of ``src``;
+    the final record may be short or empty. Records are views, either into
+    ``src`` itself (``readview``) or into two reused buffers, so each one is
+    only valid until the next is requested. ``first`` is data already read.
+    """
+    if getattr(src, "readview", None) is not None:
+        cur = memoryview(first) if first is not None else src.readview(size)
+        while True:
+            nxt = src.readview(size) if len(cur) == size else cur[:0]
+            yield cur, not nxt
+            if not nxt:
+                return
+            cur = nxt
+
+    # buffers start small and grow to ``size`` only for inputs that need it
+    n = len(first) if first is not None else 0
+    bufs = [bytearray(min(size, max(n, RECORD_BUF_MIN))), bytearray(min(size, RECORD_BUF_MIN))]
+    if first is not None:
+        bufs[0][:n] = first
+    bufs[0], n = _fill_record(src, bufs[0], size, n)
+    i = 0
+    while True:
+        m = 0
+        if n == size:
+            bufs[1 - i], m = _fill_record(src, bufs[1 - i], size)
+        yield memoryview(bufs[i])[:n], not m
+        if not m:
+            return
+        i, n = 1 - i, m
+
+
+def segment_nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    """
+    96-bit GCM nonce: random prefix, 32-bit segment counter and a final-segment
+    flag, so segments can't be reordered, dropped or truncated unnoticed.
+    """
+    return prefix + index.to_bytes(4, "big") + (b"\x01" if last else b"\x00")
+
+
+def seal_segment(key: bytes, prefix: bytes, index: int, chunk: bytes, last: bool) -> bytes:
+    return AESGCM(key).encrypt(segment_nonce(prefix, index, last), chunk, None)
+
+
+class SegmentSealer:
+    """
+    Incremental segmented AES-256-GCM encryptor.
+
+    Output layout: header (see app.header) | 7-byte nonce prefix | segment 0
+    | ... | final segment. Every segment but the final one carries exactly
+    ``chunk_size`` plaintext bytes plus a 16-byte tag. Feed data in any slice size; at most
+    one chunk is buffered at a time.
+    """
+
+    def __init__(self, key: bytes, preamble: bytes, chunk_size: int = CHUNK_SIZE):
+        self.key = key
+        self.preamble = preamble          # the ciphertext header
+        self.prefix = secrets.token_bytes(NONCE_PREFIX_LEN)
+        self.chunk_size = chunk_size
+        self.index = 0
+        self._buf = bytearray()
+
+    def header(self) -> bytes:
+        return self.preamble + self.prefix
+
+    def feed(self, data: bytes) -> list:
+        """
+        Buffer ``data`` and return ``seal_segment`` argument tuples for every
+        segment that is now known not to be the last one.
+        """
+        self._buf += data
+        jobs = []
+        # keep a full chunk pending: it may turn out to be the final one
+        while len(self._buf) > self.chunk_size:
+            with memoryview(self._buf) as view:
+                chunk = bytes(view[:self.chunk_size])
+            jobs.append(self._job(chunk, False))
+            del self._buf[:self.chunk_size]
+        return jobs
+
+    def close(self) -> tuple:
+        job = self._job(bytes(self._buf), True)
+        self._buf = bytearray()
+        return job
+
+    def update(self, data: bytes) -> bytes:
+        return b"".join(seal_segment(*job) for job in self.feed(data))
+
+    def finalize(self) -> bytes:
+        return seal_segment(*self.close())
+
+    def seal_records(self, records, dst: BinaryIO) -> int:
+        """
+        Seal (chunk, last) records from ``iter_records`` straight into
+        ``dst`` through one reused output buffer; returns plaintext bytes.
+        """
+        aead = AESGCM(self.key)
+        out = bytearray()
+        total = 0
+        for chunk, last in records:
+            nonce = segment_nonce(self.prefix, self.index, last)
+            self.index += 1
+            if AEAD_INTO:
+                n = len(chunk) + TAG_LEN
+                if len(out) < n:
+                    out = bytearray(n)      # sized by the first full record
+                sealed = memoryview(out)[:n]
+                aead.encrypt_into(nonce, chunk, None, sealed)
+                dst.write(sealed)
+            else:
+                dst.write(aead.encrypt(nonce, chunk, None))
+            total += len(chunk)
+        return total
+
+    def _job(self, chunk: bytes, last: bool) -> tuple:
+        job = (self.key, self.prefix, self.index, chunk, last)
+        self.index += 1
+        return job
+
+
+def sealed_length(plain_size: int, header_len: int, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Exact ciphertext size for ``plain_size`` bytes behind a ``header_len`` header.
+    """
+    segments = max(1, -(-plain_size // chunk_size))
+    return header_len + plain_size + segments * TAG_LEN
+
+
+def new_sealer(password: str, chunk_size: int = CHUNK_SIZE, tier: str = None, codec: str = "none") -> SegmentSealer:
+    header, key = new_file_key(password, "aes256", chunk_size, tier, codec)
+    return SegmentSealer(key, header, chunk_size)
+
 # ------------- Encryption ---------------
-def fernet_encrypt(data: bytes, password: str) -> bytes:
-    salt = secrets.token_bytes(16)
-    key = urlsafe_b64encode(derive_key(password, salt))
-    token = Fernet(key).encrypt(data)
-    return salt + token
+def fernet_seal(data: bytes, key: bytes) -> bytes:
+    # Fernet only takes bytes; bytes(data) is free when it already is
+    return Fernet(urlsafe_b64encode(key)).encrypt(bytes(data))
+
+
+def fernet_encrypt(data: bytes, password: str, tier: str = None, codec: str = None) -> bytes:
+    codec = compression.choose(data, codec)
+    header, key = new_file_key(password, "fernet", 0, tier, codec)
+    return header + fernet_seal(compression.compress_all(codec, data), key)
+
+
+def seal_stream(src: BinaryIO, dst: BinaryIO, sealer: SegmentSealer, codec: str = "none", first: bytes = None) -> int:
+    """
+    Pump ``src`` through ``codec`` and ``sealer`` into ``dst``; returns
+    plaintext bytes read. ``first`` is a chunk already taken from ``src``.
+    """
+    dst.write(sealer.header())
+    if codec == "none":
+        return sealer.seal_records(iter_records(src, sealer.chunk_size, first), dst)
+    packer = compression.compressor(codec)
+    total = 0
+    chunk = src.read(sealer.chunk_size) if first is None else first
+    while chunk:
+        total += len(chunk)
+        dst.write(sealer.update(packer.compress(chunk)))
+        chunk = src.read(sealer.chunk_size)
+    dst.write(sealer.update(packer.flush()))
+    dst.write(sealer.finalize())
+    return total
+
+
+def encrypt_stream(
+    src: BinaryIO,
+    dst: BinaryIO,
+    password: str,
+    chunk_size: int = CHUNK_SIZE,
+    tier: str = None,
+    codec: str = None,
+) -> int:
+    """
+    Encrypt ``src`` into ``dst`` chunk by chunk with segmented AES-256-GCM,
+    compressing first unless ``codec`` (default ENCLYPT_COMPRESSION) is
+    "none" or the data looks incompressible. Returns plaintext bytes read.
+    """
+    first = read_first(src, chunk_size)
+    codec = compression.choose(first, codec)
+    return seal_stream(src, dst, new_sealer(password, chunk_size, tier, codec), codec, first)
 
 
 def aes256_encrypt(data: bytes, password: str) -> bytes:
-    salt = secrets.token_bytes(16)
-    key = derive_key(password, salt)
-    nonce = secrets.token_bytes(12)
-    aesgcm = AESGCM(key)
-    ct = aesgcm.encrypt(nonce, data, None)
-    return salt + nonce + ct
+    out = io.BytesIO()
+    encrypt_stream(BufferReader(data), out, password)
+    return out.getvalue()
+
+
+def rsa_encrypt_stream(
+    src: BinaryIO,
+    dst: BinaryIO,
+    public_key_pem: str,
+    chunk_size: int = CHUNK_SIZE,
+    codec: str = None,
+) -> int:
+    """
+    Hybrid RSA: wrap a random data key with RSA-OAEP and stream the payload
+    through segmented AES-256-GCM, so any file size works.
+    """
+    first = read_first(src, chunk_size)
+    codec = compression.choose(first, codec)
+    preamble, key = new_rsa_file_key(public_key_pem, chunk_size, codec)
+    return seal_stream(src, dst, SegmentSealer(key, preamble, chunk_size), codec, first)
 
 
 def rsa_encrypt(data: bytes, public_key_pem: str) -> bytes:
-    try:
-        public_key = serialization.load_pem_public_key(
-            public_key_pem.encode(),
-        )
-    except Exception:
-        raise ValueError("Invalid RSA public key.")
-    return public_key.encrypt(
-        data,
-        asym_padding.OAEP(
-            mgf=asym_padding.MGF1(hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None
-        )
-    )
+    out = io.BytesIO()
+    rsa_encrypt_stream(BufferReader(data), out, public_key_pem)
+    return out.getvalue()
 
 # --------- Main API Function ----------
-async def encrypt_file(
+async def encrypt_chunks(
     file,
     password: str,
     method: Literal["fernet", "aes256", "rsa"],
     user_level: Literal["guest", "account", "paid"],
-    rsa_public_key: str = None
-) -> str:
-    validate_method(method, user_level)
+    rsa_public_key: str = None,
+    timer: metrics.StageTimer = None,
+    codec: str = None,
+) -> AsyncIterator[bytes]:
+    """
+    Read the upload once and yield ciphertext pieces as they are produced.
+    KDF, key wrapping and cipher work run on the crypto pool. ``codec``
+    (default ENCLYPT_COMPRESSION) compresses the plaintext first unless the
+    first chunk looks incompressible. Stage times go to ``timer``; without
+    one the generator records its own.
+    """
+    own_timer = timer is None
+    if own_timer:
+        timer = metrics.StageTimer("encrypt", method, user_level)
+    try:
+        validate_method(method, user_level)
 
-    content = await file.read()
+        if method in ("aes256", "rsa"):
+            if method == "rsa" and not rsa_public_key:
+                raise ValueError("Missing RSA public key.")
+            # the first chunk decides the codec, which the header records
+            chunk = await timer.timed("read", file.read(CHUNK_SIZE))
+            timer.bytes_in += len(chunk)
+            check_size_limit(timer.bytes_in, user_level)
+            codec = compression.choose(chunk, codec)
+            if method == "aes256":
+                preamble, key = await timer.timed(
+                    "kdf", new_file_key_async(password, method, CHUNK_SIZE, user_level, codec)
+                )
+            else:
+                preamble, key = await timer.timed(
+                    "kdf", run_crypto(new_rsa_file_key, rsa_public_key, CHUNK_SIZE, codec)
+                )
+            sealer = SegmentSealer(key, preamble)
+            packer = compression.compressor(codec)
+            yield timer.out(sealer.header())
+            # the size limit is enforced while reading
+            while chunk:
+                if codec != "none":
+                    chunk = await timer.timed("compress", run_crypto(packer.compress, chunk, local=True))
+                for job in sealer.feed(chunk):
+                    yield timer.out(await timer.timed("cipher", run_crypto(seal_segment, *job)))
+                chunk = await timer.timed("read", file.read(CHUNK_SIZE))
+                timer.bytes_in += len(chunk)
+                check_size_limit(timer.bytes_in, user_level)
+            for job in sealer.feed(packer.flush()):
+                yield timer.out(await timer.timed("cipher", run_crypto(seal_segment, *job)))
+            yield timer.out(await timer.timed("cipher", run_crypto(seal_segment, *sealer.close())))
 
-    # enforce tier-specific size limits
-    size_limit = TIER_FILE_SIZE_LIMITS.get(user_level.lower())
-    if size_limit is not None and len(content) > size_limit:
-        raise ValueError(f"File size exceeds {size_limit // (1024*1024)} MB limit for {user_level} tier")
+        elif method == "fernet":
+            content = await timer.timed("read", file.read())
+            timer.bytes_in = len(content)
+            # enforce tier-specific size limits
+            check_size_limit(len(content), user_level)
+            codec = compression.choose(content, codec)
+            preamble, key = await timer.timed("kdf", new_file_key_async(password, method, 0, user_level, codec))
+            if codec != "none":
+                content = await timer.timed("compress", run_crypto(compression.compress_all, codec, content))
+            yield timer.out(preamble + await timer.timed("cipher", run_crypto(fernet_seal, content, key)))
+
+        else:
+            raise ValueError("Unsupported method.")
+        timer.ok = True
+    finally:
+        if own_timer:
+            timer.record()
 
-    if method == "fernet":
-        encrypted = fernet_encrypt(content, password)
-    elif method == "aes256":
-        encrypted = aes256_encrypt(content, password)
-    elif method == "rsa":
-        if not rsa_public_key:
-            raise ValueError("Missing RSA public key.")
-        encrypted = rsa_encrypt(content, rsa_public_key)
-    else:
-        raise ValueError("Unsupported method.")
 
+async def encrypt_file(
+    file,
+    password: str,
+    method: Literal["fernet", "aes256", "rsa"],
+    user_level: Literal["guest", "account", "paid"],
+    rsa_public_key: str = None
+) -> str:
     safe_name = sanitize_filename(file.filename or "")
     out_name = f"{uuid.uuid4().hex}_{safe_name}"
     out_path = TEMP_DIR / out_name
 
-    with open(out_path, "wb") as f:
-        f.write(encrypted)
+    timer = metrics.StageTimer("encrypt", method, user_level)
+    try:
+        with open(out_path, "wb") as f:
+            async for piece in encrypt_chunks(file, password, method, user_level, rsa_public_key, timer):
+                with timer.stage("write"):
+                    f.write(piece)
+    except BaseException:
+        out_path.unlink(missing_ok=True)
+        raise
+    finally:
+        timer.record()
 
     return str(out_path)
@@ -0,0 +1,151 @@
+import struct
+import hashlib
+from dataclasses import dataclass
+
+# ---------------- Format ----------------
+# Every ciphertext written since format v1 starts with a self-describing header:
+#
+#   magic "ENCL" | version u8 | cipher u8 | compression u8 | kdf u8 | chunk size u32
+#   | kdf params (u8 length + bytes) | salt (u8 length + bytes)
+#   | wrapped key (u16 length + bytes)
+#
+# followed by the cipher body: the 7-byte nonce prefix and segments for aes256
+# and rsa, or the Fernet token. Files without the magic are baseline
+# (single-shot, headerless) ciphertexts and are read with the caller's
+# ``method``.
+MAGIC = b"ENCL"
+VERSION = 1
+
+CIPHERS = {"fernet": 1, "aes256": 2, "rsa": 3}
+KDFS = {"none": 0, "pbkdf2-sha256": 1, "scrypt": 2, "argon2id": 3}
+COMPRESSIONS = {"none": 0, "zlib": 1, "lzma": 2, "zstd": 3}
+
+_FIXED = struct.Struct(">4sBBBBIB")
+FIXED_LEN = _FIXED.size
+# largest possible header: fixed part, two u8-prefixed fields, u16-prefixed key
+MAX_HEADER_LEN = FIXED_LEN + 255 + 1 + 255 + 2 + 0xFFFF
+
+
+def _lookup(table: dict, value: int, what: str) -> str:
+    for name, ident in table.items():
+        if ident == value:
+            return name
+    raise ValueError(f"Unsupported {what} in ciphertext header.")
+
+
+@dataclass(frozen=True)
+class Header:
+    method: str
+    chunk_size: int = 0
+    kdf: str = "none"
+    kdf_params: bytes = b""
+    salt: bytes = b""
+    wrapped_key: bytes = b""
+    compression: str = "none"
+    version: int = VERSION
+
+    def pack(self) -> bytes:
+        return b"".join((
+            _FIXED.pack(
+                MAGIC, self.version, CIPHERS[self.method], COMPRESSIONS[self.compression],
+                KDFS[self.kdf], self.chunk_size, len(self.kdf_params),
+            ),
+            self.kdf_params,
+            len(self.salt).to_bytes(1, "big"), self.salt,
+            len(self.wrapped_key).to_bytes(2, "big"), self.wrapped_key,
+        ))
+
+    def context(self) -> bytes:
+        """
+        Digest that binds the derived file key to every header field, so an
+        edited header (cipher, chunk size, compression...) fails to decrypt.
+        """
+        return hashlib.sha256(self.pack()).digest()
+
+
+def is_header(head: bytes) -> bool:
+    return head[:len(MAGIC)] == MAGIC
+
+
+class HeaderReader:
+    """
+    Incremental parser: ``need`` is how many more bytes ``feed`` wants next;
+    it drops to 0 once ``header`` is set. Works the same over sync files and
+    async uploads.
+    """
+
+    def __init__(self):
+        self.need = FIXED_LEN
+        self.header = None
+        self.size = 0
+        self._fields = None
+        self._stage = 0
+
+    def feed(self, data: bytes) -> int:
+        if self.need == 0 or len(data) != self.need:
+            raise ValueError("Invalid ciphertext format.")
+        self.size += len(data)
+        if self._stage == 0:
+            magic, version, cipher, compression, kdf, chunk_size, params_len = _FIXED.unpack(data)
+            if magic != MAGIC:
+                raise ValueError("Invalid ciphertext format.")
+            if version != VERSION:
+                raise ValueError(f"Unsupported ciphertext format version {version}.")
+            self._fields = {
+                "version": version,
+                "method": _lookup(CIPHERS, cipher, "cipher"),
+                "compression": _lookup(COMPRESSIONS, compression, "compression"),
+                "kdf": _lookup(KDFS, kdf, "KDF"),
+                "chunk_size": chunk_size,
+            }
+            self._stage, self.need = 1, params_len + 1
+        elif self._stage == 1:
+            self._fields["kdf_params"] = data[:-1]
+            self._stage, self.need = 2, data[-1] + 2
+        elif self._stage == 2:
+            self._fields["salt"] = data[:-2]
+            self._stage, self.need = 3, int.from_bytes(data[-2:], "big")
+            if self.need == 0:
+                self._finish(b"")
+        else:
+            self._finish(data)
+        return self.need
+
+    def _finish(self, wrapped_key: bytes) -> None:
+        self.header = Header(wrapped_key=wrapped_key, **self._fields)
+        self.need = 0
+
+
+def read_header(read, head: bytes = b"") -> Header:
+    """
+    Parse a header from a sync ``read(n)`` callable; ``head`` holds bytes
+    already taken from the stream (e.g. the sniffed magic).
+    """
+    reader = HeaderReader()
+    buf = head
+    while reader.need:
+        if len(buf) < reader.need:
+            more = read(reader.need - len(buf))
+            if len(more) != reader.need - len(buf):
+                raise ValueError("Invalid ciphertext format.")
+            buf += more
+        data, buf = buf[:reader.need], buf[reader.need:]
+        reader.feed(data)
+    if buf:
+        raise ValueError("Invalid ciphertext format.")
+    return reader.header
+
+
+def parse_header(data: bytes) -> tuple:
+    """
+    (Header, header length) from the leading bytes of a ciphertext.
+    """
+    reader = HeaderReader()
+    pos = 0
+    while reader.need:
+        if pos + reader.need > len(data):
+            raise ValueError("Invalid ciphertext format.")
+        chunk = data[pos:pos + reader.need]
+        pos += len(chunk)
+        reader.feed(chunk)
+    return reader.header, pos
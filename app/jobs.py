@@ -0,0 +1,258 @@
+import os
+import time
+import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from app.encryptor import (
+    TEMP_DIR, CHUNK_SIZE, TIER_FILE_SIZE_LIMITS, sanitize_filename,
+    encrypt_stream, rsa_encrypt_stream, fernet_encrypt,
+)
+from app.decryptor import decrypt_stream, rsa_decrypt_stream, fernet_decrypt
+from app import metrics
+
+# ---------------- Config ----------------
+JOB_WORKERS      = int(os.getenv("JOB_WORKERS", "2"))
+# submissions beyond this many unfinished jobs are refused
+JOB_MAX_PENDING  = int(os.getenv("JOB_MAX_PENDING", "64"))
+# finished results (and failed job records) are dropped after this many seconds
+JOB_RESULT_TTL   = int(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_SWEEP_EVERY  = int(os.getenv("JOB_SWEEP_EVERY", "60"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_jobs: dict = {}
+_lock = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+_sweeper: threading.Thread | None = None
+_stop = threading.Event()
+
+
+class QueueFull(RuntimeError):
+    """
+    Raised by submit() when JOB_MAX_PENDING jobs are already unfinished.
+    """
+
+
+@dataclass
+class Job:
+    id: str
+    owner: str                 # license key of the submitting user
+    op: str                    # "encrypt" | "decrypt"
+    method: str
+    filename: str
+    bytes_total: int
+    input_path: str
+    result_path: str
+    status: str = QUEUED
+    bytes_done: int = 0
+    size: int = 0              # output bytes
+    sha256: str = ""           # hex digest of the output
+    error: str | None = None
+    tier: str | None = None    # picks the KDF cost of password encryption
+    created: float = field(default_factory=time.time)
+    finished: float | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id":      self.id,
+            "op":          self.op,
+            "method":      self.method,
+            "filename":    self.filename,
+            "status":      self.status,
+            "bytes_done":  self.bytes_done,
+            "bytes_total": self.bytes_total,
+            "size":        self.size if self.status == DONE else None,
+            "sha256":      self.sha256 if self.status == DONE else None,
+            "error":       self.error,
+        }
+
+
+class _ProgressReader:
+    """
+    Counts bytes pulled from the job input so pollers see progress.
+    """
+
+    def __init__(self, f, job: Job):
+        self._f = f
+        self._job = job
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._f.read(size)
+        self._job.bytes_done += len(data)
+        return data
+
+    def readinto(self, b) -> int:
+        n = self._f.readinto(b)
+        self._job.bytes_done += n
+        return n
+
+
+class _HashingWriter:
+    def __init__(self, f):
+        self._f = f
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.hash.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor, _sweeper
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+            _stop.clear()
+            _sweeper = threading.Thread(target=_sweep_loop, name="job-sweeper", daemon=True)
+            _sweeper.start()
+        return _executor
+
+
+def new_job(owner: str, op: str, method: str, filename: str, bytes_total: int, tier: str = None) -> Job:
+    """
+    Allocate a job and its TEMP_DIR paths; the caller copies the upload to
+    ``input_path`` before handing the job to submit().
+    """
+    job_id = uuid.uuid4().hex
+    safe = sanitize_filename(filename or "") or "file"
+    return Job(
+        id=job_id,
+        owner=owner,
+        op=op,
+        method=method,
+        filename=filename,
+        bytes_total=bytes_total,
+        tier=tier,
+        input_path=str(TEMP_DIR / f"job_{job_id}.in"),
+        result_path=str(TEMP_DIR / f"job_{job_id}_{safe}"),
+    )
+
+
+def submit(job: Job, password: str, key_pem: str = None, on_done=None) -> Job:
+    """
+    Queue ``job`` on the worker pool; method and size checks are the
+    caller's. ``on_done(job)`` runs on the worker after a successful run.
+    """
+    with _lock:
+        pending = sum(1 for j in _jobs.values() if j.status in (QUEUED, RUNNING))
+        if pending >= JOB_MAX_PENDING:
+            raise QueueFull("Job queue is full, retry later")
+        _jobs[job.id] = job
+    _pool().submit(_run, job, password, key_pem, on_done)
+    return job
+
+
+def get(job_id: str, owner: str) -> Job | None:
+    job = _jobs.get(job_id)
+    if job is None or job.owner != owner or _expired(job, time.time()):
+        return None
+    return job
+
+
+def _run(job: Job, password: str, key_pem: str, on_done) -> None:
+    job.status = RUNNING
+    try:
+        with open(job.input_path, "rb") as raw, open(job.result_path, "wb") as out:
+            src, dst = _ProgressReader(raw, job), _HashingWriter(out)
+            _OPS[job.op, job.method](src, dst, password, key_pem, job.tier)
+        job.size, job.sha256 = dst.size, dst.hash.hexdigest()
+        if on_done is not None:
+            on_done(job)
+        job.status = DONE
+    except Exception as e:
+        job.error = str(e) or "Job failed"
+        job.status = FAILED
+        _remove(job.result_path)
+    finally:
+        job.finished = time.time()
+        _remove(job.input_path)
+
+
+def _fernet_encrypt(src, dst, password, _pem, tier):
+    dst.write(fernet_encrypt(src.read(), password, tier))
+
+
+def _inflate_cap(tier):
+    # compressed results may not outgrow what the tier could upload
+    return TIER_FILE_SIZE_LIMITS.get(tier)
+
+
+def _fernet_decrypt(src, dst, password, _pem, tier):
+    dst.write(fernet_decrypt(src.read(), password, _inflate_cap(tier)))
+
+
+def _require_key(pem):
+    if not pem:
+        raise ValueError("Missing RSA key.")
+    return pem
+
+
+_OPS = {
+    ("encrypt", "fernet"): _fernet_encrypt,
+    ("encrypt", "aes256"): lambda s, d, pw, _, tier: encrypt_stream(s, d, pw, CHUNK_SIZE, tier),
+    ("encrypt", "rsa"):    lambda s, d, _, pem, __: rsa_encrypt_stream(s, d, _require_key(pem)),
+    ("decrypt", "fernet"): _fernet_decrypt,
+    ("decrypt", "aes256"): lambda s, d, pw, _, tier: decrypt_stream(s, d, pw, _inflate_cap(tier)),
+    ("decrypt", "rsa"):    lambda s, d, _, pem, tier: rsa_decrypt_stream(s, d, _require_key(pem), _inflate_cap(tier)),
+}
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _expired(job: Job, now: float) -> bool:
+    return job.finished is not None and now - job.finished > JOB_RESULT_TTL
+
+
+def sweep(now: float | None = None) -> int:
+    """
+    Drop finished jobs older than JOB_RESULT_TTL and delete their results;
+    returns how many were removed.
+    """
+    now = time.time() if now is None else now
+    with _lock:
+        stale = [j for j in _jobs.values() if _expired(j, now)]
+        for job in stale:
+            del _jobs[job.id]
+    for job in stale:
+        _remove(job.result_path)
+    return len(stale)
+
+
+def _sweep_loop() -> None:
+    while not _stop.wait(JOB_SWEEP_EVERY):
+        sweep()
+
+
+def stats() -> dict:
+    with _lock:
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for job in _jobs.values():
+            counts[job.status] += 1
+    return counts
+
+
+def _job_metrics() -> list:
+    return [("enclypt_jobs", "gauge", "Background jobs by status",
+             [({"status": status}, n) for status, n in stats().items()])]
+
+
+metrics.register_collector(_job_metrics)
+
+
+def shutdown(wait: bool = True) -> None:
+    global _executor
+    _stop.set()
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
@@ -1,25 +1,133 @@
+import os
 import json
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
 from threading import Lock
 
-STORE_PATH = Path("file_metadata.json")
+from app import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+# Append-only JSON Lines log: one entry per line, never rewritten on append.
+STORE_PATH = Path("file_metadata.jsonl")
+# rewrite the log (cluster by key, drop torn lines) after this many appends; 0 = never
+COMPACT_EVERY   = int(os.getenv("JSON_STORE_COMPACT_EVERY", "50000"))
+# keep at most this many newest entries per license key when compacting; 0 = all
+MAX_PER_KEY     = int(os.getenv("JSON_STORE_MAX_PER_KEY", "0"))
+
 _lock = Lock()
+_index = None
+
+
+class _Index:
+    """
+    license_key -> byte offsets of its lines. ``upto`` is how far into the log
+    the index has been built, so lines appended by other workers are picked
+    up incrementally.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.inode = None
+        self.offsets: dict[str, list[int]] = {}
+        self.upto = 0
+        self.appends = 0
+
+
+def _legacy_path() -> Path:
+    return STORE_PATH.with_suffix(".json")
+
+
+def _index_path() -> Path:
+    return STORE_PATH.with_name(STORE_PATH.name + ".idx")
+
 
+@contextmanager
+def _file_lock(f, exclusive: bool = True):
+    # cross-process guard so compaction never races another worker's append
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        yield
+    finally:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
 
-def _load() -> list:
-    if STORE_PATH.exists():
-        try:
-            with STORE_PATH.open("r", encoding="utf-8") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            pass
-    return []
 
+def _migrate_legacy() -> None:
+    """
+    One-time conversion of the old rewrite-whole-file JSON array.
+    """
+    legacy = _legacy_path()
+    if legacy == STORE_PATH or not legacy.exists() or STORE_PATH.exists():
+        return
+    try:
+        with legacy.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except json.JSONDecodeError:
+        data = []
+    tmp = STORE_PATH.with_name(STORE_PATH.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        for entry in data:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+    os.replace(tmp, STORE_PATH)
+    legacy.rename(legacy.with_name(legacy.name + ".migrated"))
 
-def _save(data: list) -> None:
-    with STORE_PATH.open("w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+
+def _load_snapshot(idx: _Index, size: int) -> None:
+    try:
+        with _index_path().open("r", encoding="utf-8") as f:
+            snap = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return
+    if snap.get("inode") == idx.inode and snap.get("upto", size + 1) <= size:
+        idx.offsets = {k: list(v) for k, v in snap["offsets"].items()}
+        idx.upto = snap["upto"]
+
+
+def _catch_up(idx: _Index) -> None:
+    """
+    Index any lines past ``idx.upto``; rebuild from scratch if the log was
+    replaced by a compaction in another process.
+    """
+    try:
+        st = STORE_PATH.stat()
+    except FileNotFoundError:
+        idx.offsets, idx.upto, idx.inode = {}, 0, None
+        return
+    if st.st_ino != idx.inode or st.st_size < idx.upto:
+        idx.offsets, idx.upto, idx.inode = {}, 0, st.st_ino
+        _load_snapshot(idx, st.st_size)
+    if st.st_size == idx.upto:
+        return
+    with STORE_PATH.open("rb") as f:
+        f.seek(idx.upto)
+        offset = idx.upto
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # torn tail, an append is still in flight
+            try:
+                key = json.loads(line).get("license_key")
+            except (json.JSONDecodeError, AttributeError):
+                key = None
+            if key is not None:
+                idx.offsets.setdefault(key, []).append(offset)
+            offset += len(line)
+        idx.upto = offset
+
+
+def _current_index() -> _Index:
+    global _index
+    if _index is None or _index.path != STORE_PATH:
+        _migrate_legacy()
+        _index = _Index(STORE_PATH)
+    _catch_up(_index)
+    return _index
 
 
 def add_entry(license_key: str, filename: str, size: int, method: str) -> None:
@@ -30,13 +138,70 @@ def add_entry(license_key: str, filename: str, size: int, method: str) -> None:
         "method": method,
         "timestamp": datetime.utcnow().isoformat(),
     }
-    with _lock:
-        data = _load()
-        data.append(entry)
-        _save(data)
+    line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+    with metrics.timed_stage("metadata", "json_store", method), _lock:
+        idx = _current_index()
+        while True:
+            with STORE_PATH.open("ab") as f, _file_lock(f, exclusive=False):
+                # a compaction may have swapped the file while we waited
+                if os.fstat(f.fileno()).st_ino == STORE_PATH.stat().st_ino:
+                    f.write(line)
+                    break
+        _catch_up(idx)
+        idx.appends += 1
+        if COMPACT_EVERY and idx.appends >= COMPACT_EVERY:
+            _compact(idx)
 
 
 def get_entries(license_key: str) -> list:
     with _lock:
-        data = _load()
-        return [e for e in data if e.get("license_key") == license_key]
+        idx = _current_index()
+        offsets = idx.offsets.get(license_key)
+        if not offsets:
+            return []
+        out = []
+        with STORE_PATH.open("rb") as f:
+            for off in offsets:
+                f.seek(off)
+                out.append(json.loads(f.readline()))
+        return out
+
+
+def compact() -> None:
+    """
+    Rewrite the log with each key's entries adjacent (newest MAX_PER_KEY
+    kept), drop torn lines and snapshot the offset index next to it.
+    """
+    with _lock:
+        _compact(_current_index())
+
+
+def _compact(idx: _Index) -> None:
+    if not STORE_PATH.exists():
+        return
+    tmp = STORE_PATH.with_name(STORE_PATH.name + ".tmp")
+    with STORE_PATH.open("rb") as src, _file_lock(src):
+        if os.fstat(src.fileno()).st_ino != STORE_PATH.stat().st_ino:
+            return  # another worker compacted while we waited for the lock
+        _catch_up(idx)
+        offsets: dict[str, list[int]] = {}
+        pos = 0
+        with tmp.open("wb") as dst:
+            for key, key_offsets in idx.offsets.items():
+                if MAX_PER_KEY:
+                    key_offsets = key_offsets[-MAX_PER_KEY:]
+                for off in key_offsets:
+                    src.seek(off)
+                    line = src.readline()
+                    dst.write(line)
+                    offsets.setdefault(key, []).append(pos)
+                    pos += len(line)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp, STORE_PATH)
+    idx.offsets, idx.upto, idx.appends = offsets, pos, 0
+    idx.inode = STORE_PATH.stat().st_ino
+    snap_tmp = _index_path().with_name(_index_path().name + ".tmp")
+    with snap_tmp.open("w", encoding="utf-8") as f:
+        json.dump({"inode": idx.inode, "upto": pos, "offsets": offsets}, f)
+    os.replace(snap_tmp, _index_path())
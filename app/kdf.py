@@ -0,0 +1,283 @@
+"""
+Password KDF registry and per-tier cost calibration.
+
+    python -m app.kdf --kdf scrypt --target guest=50 --target paid=250
+
+benchmarks this host and writes the chosen parameters to ENCLYPT_KDF_PARAMS.
+New ciphertexts use the entry for the uploader's tier; every ciphertext
+records its KDF and parameters in its header, so decryption never depends on
+the current configuration.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import struct
+import time
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+try:  # needs cryptography >= 44 built against an OpenSSL with Argon2
+    from cryptography.hazmat.primitives.kdf.argon2 import Argon2id
+except ImportError:
+    Argon2id = None
+
+# ---------------- Config ----------------
+KDF_NAME = os.getenv("ENCLYPT_KDF", "pbkdf2-sha256")
+KDF_PARAMS_FILE = os.getenv("ENCLYPT_KDF_PARAMS", "kdf_params.json")
+# ceiling for memory-hard KDFs, checked on headers too so a forged one
+# cannot make the server allocate gigabytes
+KDF_MAX_MEMORY = int(os.getenv("KDF_MAX_MEMORY_MB", "1024")) * 1024 * 1024
+# same for PBKDF2 time: 10x the default cost, so a forged header cannot pin
+# a crypto worker for seconds per request
+KDF_MAX_PBKDF2_ITERS = int(os.getenv("KDF_MAX_PBKDF2_ITERS", "2000000"))
+
+DEFAULT_TARGETS_MS = {"guest": 50, "account": 100, "paid": 250}
+
+KEY_LEN = 32
+
+
+# ---------------- KDFs ------------------
+class Pbkdf2:
+    name = "pbkdf2-sha256"
+    defaults = {"iterations": 200_000}
+    floor = {"iterations": 100_000}
+    _fmt = struct.Struct(">I")
+
+    def pack(self, p: dict) -> bytes:
+        # files over the ceiling could not be decrypted here
+        if not 1 <= p["iterations"] <= KDF_MAX_PBKDF2_ITERS:
+            raise ValueError(f"PBKDF2 iterations must be between 1 and {KDF_MAX_PBKDF2_ITERS}.")
+        return self._fmt.pack(p["iterations"])
+
+    def unpack(self, data: bytes) -> dict:
+        (iterations,) = self._fmt.unpack(data)
+        if not 1 <= iterations <= KDF_MAX_PBKDF2_ITERS:
+            raise ValueError("Unsupported KDF parameters in ciphertext header.")
+        return {"iterations": iterations}
+
+    def derive(self, password: str, salt: bytes, p: dict) -> bytes:
+        return PBKDF2HMAC(
+            algorithm=hashes.SHA256(), length=KEY_LEN, salt=salt, iterations=p["iterations"],
+        ).derive(password.encode())
+
+    def scale(self, p: dict, factor: float) -> dict:
+        iterations = int(round(p["iterations"] * factor, -3))
+        return {"iterations": min(max(1000, iterations), KDF_MAX_PBKDF2_ITERS)}
+
+
+class ScryptKdf:
+    name = "scrypt"
+    defaults = {"log2_n": 15, "r": 8, "p": 1}
+    floor = {"log2_n": 14, "r": 8, "p": 1}
+    _fmt = struct.Struct(">BBB")
+
+    def pack(self, p: dict) -> bytes:
+        return self._fmt.pack(p["log2_n"], p["r"], p["p"])
+
+    def unpack(self, data: bytes) -> dict:
+        log2_n, r, par = self._fmt.unpack(data)
+        p = {"log2_n": log2_n, "r": r, "p": par}
+        if not (1 <= log2_n <= 30 and r and par) or self.memory(p) > KDF_MAX_MEMORY:
+            raise ValueError("Unsupported KDF parameters in ciphertext header.")
+        return p
+
+    @staticmethod
+    def memory(p: dict) -> int:
+        return 128 * p["r"] * (2 ** p["log2_n"] + p["p"])
+
+    def derive(self, password: str, salt: bytes, p: dict) -> bytes:
+        return Scrypt(
+            salt=salt, length=KEY_LEN, n=2 ** p["log2_n"], r=p["r"], p=p["p"],
+        ).derive(password.encode())
+
+    def scale(self, p: dict, factor: float) -> dict:
+        # n must stay a power of two; never step past the memory ceiling
+        log2_n = max(1, p["log2_n"] + round(math.log2(factor)))
+        while log2_n > 1 and self.memory({**p, "log2_n": log2_n}) > KDF_MAX_MEMORY:
+            log2_n -= 1
+        return {**p, "log2_n": log2_n}
+
+
+class Argon2idKdf:
+    name = "argon2id"
+    defaults = {"iterations": 3, "memory_kib": 64 * 1024, "lanes": 1}
+    floor = {"iterations": 2, "memory_kib": 19 * 1024, "lanes": 1}
+    _fmt = struct.Struct(">IIB")
+
+    def pack(self, p: dict) -> bytes:
+        return self._fmt.pack(p["iterations"], p["memory_kib"], p["lanes"])
+
+    def unpack(self, data: bytes) -> dict:
+        iterations, memory_kib, lanes = self._fmt.unpack(data)
+        if not (iterations and lanes and 8 * lanes <= memory_kib <= KDF_MAX_MEMORY // 1024):
+            raise ValueError("Unsupported KDF parameters in ciphertext header.")
+        return {"iterations": iterations, "memory_kib": memory_kib, "lanes": lanes}
+
+    def derive(self, password: str, salt: bytes, p: dict) -> bytes:
+        return Argon2id(
+            salt=salt, length=KEY_LEN, iterations=p["iterations"],
+            lanes=p["lanes"], memory_cost=p["memory_kib"],
+        ).derive(password.encode())
+
+    def scale(self, p: dict, factor: float) -> dict:
+        # spend the budget on memory first, then on passes
+        memory_kib = min(round(p["memory_kib"] * factor), KDF_MAX_MEMORY // 1024)
+        memory_kib = max(8 * p["lanes"], memory_kib)
+        iterations = max(1, round(p["iterations"] * factor * p["memory_kib"] / memory_kib))
+        return {**p, "iterations": iterations, "memory_kib": memory_kib}
+
+
+KDFS = {k.name: k for k in (Pbkdf2(), ScryptKdf())}
+if Argon2id is not None:
+    KDFS[Argon2idKdf.name] = Argon2idKdf()
+
+
+def get(name: str):
+    kdf = KDFS.get(name)
+    if kdf is None:
+        raise ValueError(f"Unsupported KDF {name!r}.")
+    return kdf
+
+
+def pack_params(name: str, params: dict) -> bytes:
+    return get(name).pack(params)
+
+
+def unpack_params(name: str, data: bytes) -> dict:
+    """
+    Decode and bound-check header parameters; raises ValueError.
+    """
+    try:
+        return get(name).unpack(data)
+    except struct.error:
+        raise ValueError("Unsupported KDF parameters in ciphertext header.")
+
+
+def derive(name: str, password: str, salt: bytes, params: dict) -> bytes:
+    return get(name).derive(password, salt, params)
+
+
+# ------------- Tier parameters ----------
+_tier_params = None
+
+
+def load_tier_params(path: str = None) -> dict:
+    """
+    Read the calibration file: {tier: {"kdf": name, "params": {...}}}.
+    A missing file means "no calibration"; a broken one is an error.
+    """
+    try:
+        with open(path or KDF_PARAMS_FILE) as f:
+            tiers = json.load(f)["tiers"]
+    except FileNotFoundError:
+        return {}
+    for entry in tiers.values():
+        # fail at load time, not on the first upload
+        pack_params(entry["kdf"], entry["params"])
+    return tiers
+
+
+def reload_tier_params() -> None:
+    global _tier_params
+    _tier_params = load_tier_params()
+
+
+def tier_params(tier: str = None) -> tuple:
+    """
+    (KDF name, params) calibrated for ``tier``; params is None when the
+    tier has no calibration and the KDF's defaults apply.
+    """
+    if _tier_params is None:
+        reload_tier_params()
+    entry = _tier_params.get(tier) if tier else None
+    if entry is None:
+        return KDF_NAME, None
+    return entry["kdf"], entry["params"]
+
+
+# ---------------- Calibration -----------
+def time_derivation(name: str, params: dict, samples: int = 3) -> float:
+    """
+    Median milliseconds per derivation on this host.
+    """
+    kdf = get(name)
+    salt = os.urandom(16)
+    times = []
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        kdf.derive("calibration", salt, params)
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+def calibrate(name: str, target_ms: float, rounds: int = 5, samples: int = 3) -> tuple:
+    """
+    Scale ``name`` from its floor cost towards ``target_ms`` per derivation.
+    Returns (params, measured ms); never goes below the KDF's floor.
+    """
+    kdf = get(name)
+    params = dict(kdf.floor)
+    ms = time_derivation(name, params, samples)
+    for _ in range(rounds):
+        if abs(ms - target_ms) <= 0.1 * target_ms:
+            break
+        nxt = kdf.scale(params, target_ms / ms)
+        if any(nxt[k] < kdf.floor[k] for k in kdf.floor):
+            nxt = dict(kdf.floor)
+        if nxt == params:
+            break
+        params, ms = nxt, time_derivation(name, nxt, samples)
+    return params, ms
+
+
+def calibrate_tiers(name: str, targets: dict, samples: int = 3) -> dict:
+    tiers = {}
+    for tier, target in targets.items():
+        params, ms = calibrate(name, target, samples=samples)
+        tiers[tier] = {"kdf": name, "params": params, "target_ms": target, "measured_ms": round(ms, 1)}
+    return {
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "calibrated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "tiers": tiers,
+    }
+
+
+def _target(value: str) -> tuple:
+    tier, _, ms = value.partition("=")
+    if tier not in DEFAULT_TARGETS_MS or not ms:
+        raise argparse.ArgumentTypeError(f"expected TIER=MS with TIER in {sorted(DEFAULT_TARGETS_MS)}")
+    return tier, float(ms)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(
+        prog="python -m app.kdf",
+        description="Pick per-tier KDF parameters that hit a latency budget on this host.",
+    )
+    ap.add_argument("--kdf", choices=sorted(KDFS), default=KDF_NAME)
+    ap.add_argument("--target", type=_target, action="append", default=[],
+                    help="TIER=MS, milliseconds per derivation (repeatable)")
+    ap.add_argument("--samples", type=int, default=3, help="derivations timed per step")
+    ap.add_argument("-o", "--out", default=KDF_PARAMS_FILE)
+    args = ap.parse_args(argv)
+
+    targets = {**DEFAULT_TARGETS_MS, **dict(args.target)}
+    result = calibrate_tiers(args.kdf, targets, args.samples)
+    tmp = args.out + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(result, f, indent=2)
+    os.replace(tmp, args.out)
+    for tier, entry in result["tiers"].items():
+        print(f"{tier:8} {entry['kdf']} {entry['params']}  {entry['measured_ms']} ms (target {entry['target_ms']})")
+    print(f"wrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
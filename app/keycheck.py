@@ -1,31 +1,24 @@
 import logging
-from functools import lru_cache
 
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
 
-from app.db.session import SessionLocal
-from app.db.models import User
+from app.authcache import lookup
 
 logger = logging.getLogger(__name__)
 
-# Cache validation results for a short time to reduce DB load
-@lru_cache(maxsize=1024)
+# Validation results come from the shared TTL'd auth cache, so deactivated
+# keys stop validating once invalidated (or after AUTH_CACHE_TTL at most)
 def is_valid_key(license_key: str) -> bool:
     """
     Verify that the provided license key exists and is active.
     Returns True if valid, False otherwise.
     """
     try:
-        with SessionLocal() as db:  # SQLite thread-safe session
-            user = db.query(User).filter(
-                User.license_key == license_key,
-                User.is_active == True,
-            ).first()
-            valid = bool(user)
-            if not valid:
-                logger.warning("License validation failed for key: %s", license_key)
-            return valid
+        user = lookup(license_key)
+        valid = bool(user and user.is_active)
+        if not valid:
+            logger.warning("License validation failed for key: %s", license_key)
+        return valid
     except Exception as e:
         logger.error("Error checking license key: %s", e)
         # On DB error, treat as invalid to be safe
@@ -37,12 +30,8 @@ def get_user_tier(license_key: str) -> str:
     Return the user tier ('guest', 'account', 'paid') associated with the license key.
     Raises HTTPException(401) if invalid or inactive.
     """
-    with SessionLocal() as db:
-        user = db.query(User).filter(
-            User.license_key == license_key,
-            User.is_active == True,
-        ).first()
-        if not user:
-            logger.warning("Attempt to fetch tier for invalid key: %s", license_key)
-            raise HTTPException(status_code=401, detail="Invalid license key")
-        return user.tier.lower()
+    user = lookup(license_key)
+    if not user or not user.is_active:
+        logger.warning("Attempt to fetch tier for invalid key: %s", license_key)
+        raise HTTPException(status_code=401, detail="Invalid license key")
+    return user.tier.lower()
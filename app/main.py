@@ -1,9 +1,43 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from app.api import router
-from app.db.session import engine, Base
+from app.db.session import engine, Base, SessionLocal
+from app.db.models import upgrade_schema
+from app.db.crud import reconcile_usage
+from app.workers import shutdown_executor
+from app import jobs, metawriter, metrics, uploads
 
 # create tables
 Base.metadata.create_all(bind=engine)
+if {"users.bytes_used", "users.file_count"} & upgrade_schema(engine):
+    # counters were just added to an existing database: backfill them
+    with SessionLocal() as db:
+        reconcile_usage(db)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # metadata a crashed worker logged but never committed
+    metawriter.replay()
+    # resumable uploads that went idle while the server was down
+    with SessionLocal() as db:
+        uploads.sweep(db)
+    yield
+    jobs.shutdown()
+    shutdown_executor()
+    # after jobs: their completion callbacks queue metadata too
+    metawriter.shutdown()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(router, prefix="/api")
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    # Prometheus text format; ENCLYPT_METRICS=0 turns collection and this off
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(404)
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,288 @@
+"""
+Write-behind buffer for FileMeta rows.
+
+The request path only appends a record to this process's log and queues it;
+a background thread inserts queued records in one transaction per batch,
+every METADATA_BATCH_SIZE records or METADATA_FLUSH_MS, whichever comes
+first. The log is the crash fallback: replay() at startup inserts whatever a
+dead process left behind. Each record carries a record_id, so replaying a
+batch that did commit writes nothing twice.
+"""
+import os
+import json
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import insert, select
+
+from app.db.session import SessionLocal
+from app.db.models import User, FileMeta
+from app.json_store import add_entry as add_json_entry
+from app import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+# ---------------- Config ----------------
+METADATA_BATCH_SIZE = int(os.getenv("METADATA_BATCH_SIZE", "256"))
+METADATA_FLUSH_MS   = int(os.getenv("METADATA_FLUSH_MS", "200"))
+# per-process append logs of records not yet committed
+METADATA_LOG_DIR    = Path(os.getenv("METADATA_LOG_DIR", "metadata_log"))
+# fsync each append: survives power loss, not just a crashed process
+METADATA_LOG_FSYNC  = os.getenv("METADATA_LOG_FSYNC", "0").lower() in ("1", "true", "yes")
+
+_COLUMNS = ("record_id", "user_id", "filename", "file_size", "content_hash", "method")
+
+
+def write_records(records: list) -> int:
+    """
+    Insert ``records`` in one transaction, skipping record_ids already
+    stored, and bump each owner's usage counters. Returns rows written.
+    """
+    with SessionLocal() as db:
+        ids = [r["record_id"] for r in records]
+        stored = set(db.scalars(select(FileMeta.record_id).where(FileMeta.record_id.in_(ids))))
+        fresh = [r for r in records if r["record_id"] not in stored]
+        if not fresh:
+            return 0
+        db.execute(insert(FileMeta), [
+            {**{c: r[c] for c in _COLUMNS}, "timestamp": datetime.fromisoformat(r["timestamp"])}
+            for r in fresh
+        ])
+        size, count = Counter(), Counter()
+        for r in fresh:
+            size[r["user_id"]] += r["file_size"]
+            count[r["user_id"]] += 1
+        for user_id in count:
+            db.query(User).filter(User.id == user_id).update(
+                {User.bytes_used: User.bytes_used + size[user_id],
+                 User.file_count: User.file_count + count[user_id]},
+                synchronize_session=False
+            )
+        with metrics.timed_stage("metadata", "db_commit", "batch"):
+            db.commit()
+    for r in fresh:
+        try:
+            add_json_entry(r["license_key"], r["filename"], r["file_size"], r["method"])
+        except Exception:
+            pass  # JSON logging should never break the flush
+    metrics.METADATA_BATCH_ROWS.observe(len(fresh))
+    return len(fresh)
+
+
+class _Log:
+    """
+    One append log, flock-ed for as long as its owner may still flush it:
+    replay() only touches logs it can lock.
+    """
+
+    def __init__(self, directory: Path, seq: int):
+        directory.mkdir(parents=True, exist_ok=True)
+        name = f"{os.getpid()}-{int(time.time() * 1000)}-{seq}"
+        tmp = directory / f"{name}.tmp"
+        self.f = open(tmp, "ab")
+        if fcntl is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        # only ever visible under its final name once locked
+        self.path = directory / f"{name}.log"
+        os.replace(tmp, self.path)
+
+    def append(self, line: bytes) -> None:
+        self.f.write(line)
+        self.f.flush()
+        if METADATA_LOG_FSYNC:
+            os.fsync(self.f.fileno())
+
+    def discard(self) -> None:
+        self.path.unlink(missing_ok=True)
+        self.f.close()
+
+
+class MetaWriter:
+    def __init__(self, log_dir: Path = None, batch_size: int = None, flush_ms: int = None):
+        self.log_dir = Path(log_dir or METADATA_LOG_DIR)
+        self.batch_size = batch_size or METADATA_BATCH_SIZE
+        self.flush_s = (METADATA_FLUSH_MS if flush_ms is None else flush_ms) / 1000
+        self._cond = threading.Condition()
+        self._flushing = threading.Lock()     # one batch in flight at a time
+        self._pending: list = []
+        self._log = None
+        self._sealed: list = []               # logs whose records are all still uncommitted
+        self._seq = 0
+        self._bytes = Counter()               # user_id -> bytes queued, not yet committed
+        self._count = Counter()               # user_id -> records queued
+        self._since = None
+        self._thread = None
+        self._closed = False
+
+    def enqueue(self, record: dict) -> None:
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Metadata writer is closed")
+            if self._log is None:
+                self._seq += 1
+                self._log = _Log(self.log_dir, self._seq)
+            with metrics.timed_stage("metadata", "log_append", record["method"]):
+                self._log.append(line)
+            self._pending.append(record)
+            self._bytes[record["user_id"]] += record["file_size"]
+            self._count[record["user_id"]] += 1
+            if self._since is None:
+                self._since = time.monotonic()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="metawriter", daemon=True)
+                self._thread.start()
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._cond.notify()
+            metrics.METADATA_PENDING.set(len(self._pending))
+
+    def pending_bytes(self, user_id: int) -> int:
+        with self._cond:
+            return self._bytes.get(user_id, 0)
+
+    def pending_count(self, user_id: int) -> int:
+        with self._cond:
+            return self._count.get(user_id, 0)
+
+    def flush(self) -> int:
+        """
+        Commit everything queued so far; returns rows written. If the write
+        fails the records stay queued (and logged) for the next attempt.
+        """
+        with self._flushing:
+            with self._cond:
+                batch, self._pending = self._pending, []
+                if self._log is not None:
+                    self._sealed.append(self._log)
+                    self._log = None
+                logs, self._sealed = self._sealed, []
+                self._since = None
+            if not batch:
+                return 0
+            try:
+                written = write_records(batch)
+            except Exception:
+                with self._cond:
+                    self._pending[:0] = batch
+                    self._sealed[:0] = logs
+                    self._since = self._since or time.monotonic()
+                metrics.METADATA_FLUSH_ERRORS.inc()
+                raise
+            with self._cond:
+                for r in batch:
+                    self._bytes[r["user_id"]] -= r["file_size"]
+                    self._count[r["user_id"]] -= 1
+                # drop users with nothing queued
+                self._bytes, self._count = +self._bytes, +self._count
+                metrics.METADATA_PENDING.set(len(self._pending))
+            for log in logs:
+                log.discard()
+            return written
+
+    def _due(self) -> bool:
+        if not self._pending:
+            return False
+        return len(self._pending) >= self.batch_size or time.monotonic() - self._since >= self.flush_s
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and not self._due():
+                    wait = self.flush_s - (time.monotonic() - self._since) if self._pending else None
+                    self._cond.wait(wait)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                # database unavailable: records stay queued and logged
+                time.sleep(self.flush_s)
+
+    def close(self) -> None:
+        """
+        Stop the flusher and commit what is left. Whatever cannot be
+        committed stays in the log for replay() on the next start.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+def replay(log_dir: Path = None) -> int:
+    """
+    Insert records from logs left by processes that died before flushing;
+    logs still locked by a live process are skipped. Returns rows written.
+    """
+    directory = Path(log_dir or METADATA_LOG_DIR)
+    if not directory.is_dir():
+        return 0
+    written = 0
+    for path in sorted(directory.glob("*.log")):
+        with open(path, "rb") as f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+            records = []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn tail from the crash
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+            for i in range(0, len(records), METADATA_BATCH_SIZE):
+                written += write_records(records[i:i + METADATA_BATCH_SIZE])
+            path.unlink()
+    return written
+
+
+_writer: MetaWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> MetaWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = MetaWriter()
+        return _writer
+
+
+def pending_bytes(user_id: int) -> int:
+    return _writer.pending_bytes(user_id) if _writer is not None else 0
+
+
+def flush() -> int:
+    """
+    Commit everything this process has queued; returns rows written.
+    """
+    writer = _writer
+    return writer.flush() if writer is not None else 0
+
+
+def settle(user_id: int) -> None:
+    """
+    Flush if ``user_id`` has queued records, so their reads see their writes.
+    """
+    writer = _writer
+    if writer is not None and writer.pending_count(user_id):
+        writer.flush()
+
+
+def shutdown() -> None:
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
@@ -0,0 +1,293 @@
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+
+# ---------------- Config ----------------
+METRICS_ENABLED = os.getenv("ENCLYPT_METRICS", "1").lower() not in ("0", "false", "no")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+_registry: list = []
+_collectors: list = []
+_caches: dict = {}
+
+
+def _fmt_labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_value(v) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict = {}
+        self._lock = Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._lines(key, value))
+        return lines
+
+    def _lines(self, key, value) -> list:
+        return [f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket counts (+Inf last), sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    def _lines(self, key, state) -> list:
+        counts, total = state
+        lines, running = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            le = "+Inf" if bound == float("inf") else _fmt_value(float(bound))
+            extra = f'le="{le}"'
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, extra)} {running}")
+        labels = _fmt_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_fmt_value(total)}")
+        lines.append(f"{self.name}_count{labels} {running}")
+        return lines
+
+
+# ---------------- Metrics ----------------
+STAGE_SECONDS = Histogram(
+    "enclypt_stage_seconds",
+    "Time spent per pipeline stage, per operation",
+    ("op", "stage", "method"),
+)
+OPERATIONS = Counter(
+    "enclypt_operations_total",
+    "Encrypt/decrypt operations by outcome",
+    ("op", "method", "tier", "outcome"),
+)
+BYTES_IN = Counter(
+    "enclypt_bytes_in_total",
+    "Bytes read from uploads",
+    ("op", "method", "tier"),
+)
+BYTES_OUT = Counter(
+    "enclypt_bytes_out_total",
+    "Bytes produced by the cipher",
+    ("op", "method", "tier"),
+)
+COMPRESSION_DECISIONS = Counter(
+    "enclypt_compression_decisions_total",
+    "Codec choices for new ciphertexts (skipped = looked incompressible)",
+    ("codec", "decision"),
+)
+UPLOAD_SESSIONS = Gauge(
+    "enclypt_upload_sessions",
+    "Resumable upload sessions with live state in this process",
+)
+CRYPTO_TASKS = Gauge(
+    "enclypt_crypto_tasks",
+    "Crypto calls waiting for or running on the crypto pool",
+)
+METADATA_PENDING = Gauge(
+    "enclypt_metadata_pending",
+    "File metadata records queued for the next batch insert",
+)
+METADATA_BATCH_ROWS = Histogram(
+    "enclypt_metadata_batch_rows",
+    "Rows inserted per write-behind batch",
+    buckets=(1, 4, 16, 64, 256, 1024, 4096),
+)
+METADATA_FLUSH_ERRORS = Counter(
+    "enclypt_metadata_flush_errors_total",
+    "Write-behind batches that failed and were kept for retry",
+)
+ADMISSION_ACTIVE = Gauge(
+    "enclypt_admission_active",
+    "Encrypt/decrypt requests holding an admission slot",
+)
+ADMISSION_QUEUED = Gauge(
+    "enclypt_admission_queued",
+    "Requests waiting for an admission slot",
+    ("tier",),
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "enclypt_admission_wait_seconds",
+    "Time spent queued before an admission slot was granted",
+    ("tier",),
+)
+ADMISSION_REJECTED = Counter(
+    "enclypt_admission_rejected_total",
+    "Requests turned away with 429 (queue_full or timeout)",
+    ("tier", "reason"),
+)
+
+
+class StageTimer:
+    """
+    Per-operation accumulator: stages hit once per chunk add up here and are
+    observed once when the operation ends, so the histogram shows per-file
+    stage time rather than per-chunk noise.
+    """
+
+    def __init__(self, op: str, method: str, tier: str):
+        self.op = op
+        self.method = method
+        self.tier = tier
+        self.stages: dict = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.ok = False
+        self._recorded = False
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - t0
+
+    async def timed(self, name: str, awaitable):
+        t0 = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - t0
+
+    def out(self, piece: bytes) -> bytes:
+        self.bytes_out += len(piece)
+        return piece
+
+    def record(self) -> None:
+        if self._recorded or not METRICS_ENABLED:
+            return
+        self._recorded = True
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, op=self.op, stage=name, method=self.method)
+        labels = {"op": self.op, "method": self.method, "tier": self.tier}
+        BYTES_IN.inc(self.bytes_in, **labels)
+        BYTES_OUT.inc(self.bytes_out, **labels)
+        OPERATIONS.inc(outcome="ok" if self.ok else "error", **labels)
+
+
+@contextmanager
+def timed_stage(op: str, stage: str, method: str = ""):
+    """
+    Observe a one-off stage (a DB commit, a log append) directly.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - t0, op=op, stage=stage, method=method)
+
+
+def register_collector(fn) -> None:
+    """
+    ``fn()`` is called at scrape time and returns a list of
+    (name, type, help, [(labels dict, value), ...]).
+    """
+    _collectors.append(fn)
+
+
+def watch_cache(name: str, cache) -> None:
+    """
+    Export a TTLCache's size, hits and misses under ``cache="name"``.
+    """
+    _caches[name] = cache
+
+
+def _cache_metrics() -> list:
+    stats = {name: cache.stats() for name, cache in _caches.items()}
+    return [
+        ("enclypt_cache_hits_total", "counter", "Cache hits",
+         [({"cache": n}, s["hits"]) for n, s in stats.items()]),
+        ("enclypt_cache_misses_total", "counter", "Cache misses",
+         [({"cache": n}, s["misses"]) for n, s in stats.items()]),
+        ("enclypt_cache_entries", "gauge", "Entries currently cached",
+         [({"cache": n}, s["size"]) for n, s in stats.items()]),
+    ]
+
+
+register_collector(_cache_metrics)
+
+
+def render() -> str:
+    """
+    Everything in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        for name, kind, help, samples in fn():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_fmt_labels(labels, labels.values())} {_fmt_value(value)}")
+    return "\n".join(lines) + "\n"
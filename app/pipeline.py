@@ -0,0 +1,141 @@
+import uuid
+import hashlib
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from app.encryptor import TEMP_DIR, sanitize_filename, encrypt_chunks
+from app.decryptor import decrypt_chunks
+from app import metrics
+
+
+class CapExceeded(PermissionError):
+    """
+    Raised mid-stream once an upload grows past its allowed size.
+    """
+
+
+@dataclass
+class PipelineResult:
+    path: str
+    bytes_in: int     # upload bytes consumed
+    size: int         # output bytes written
+    sha256: str       # hex digest of the output
+
+
+class MeteredUpload:
+    """
+    Wrap an async upload so its size is counted and capped while the cipher
+    pulls from it: no separate size-check read and no rewind.
+    """
+
+    def __init__(self, file, cap: int | None = None, message: str = "File size cap exceeded"):
+        self.file = file
+        self.filename = getattr(file, "filename", None)
+        self.cap = cap
+        self.message = message
+        self.bytes_in = 0
+        # Starlette knows the size up front; fail before any crypto work
+        known = getattr(file, "size", None)
+        if cap is not None and known is not None and known > cap:
+            raise CapExceeded(message)
+
+    async def read(self, size: int = -1) -> bytes:
+        data = await self.file.read(size)
+        self.bytes_in += len(data)
+        if self.cap is not None and self.bytes_in > self.cap:
+            raise CapExceeded(self.message)
+        return data
+
+
+async def first_piece(pieces: AsyncIterator[bytes]) -> bytes:
+    """
+    Pull the first output piece so validation, KDF and first-segment auth
+    errors surface before any response headers are sent.
+    """
+    try:
+        return await pieces.__anext__()
+    except StopAsyncIteration:
+        return b""
+
+
+async def hashed_stream(first: bytes, pieces: AsyncIterator[bytes], on_complete) -> AsyncIterator[bytes]:
+    """
+    Re-yield ``first`` and the rest of ``pieces`` while hashing them, then call
+    ``on_complete(size, hexdigest)`` once the stream finished cleanly.
+    """
+    h = hashlib.sha256(first)
+    size = len(first)
+    yield first
+    async for piece in pieces:
+        h.update(piece)
+        size += len(piece)
+        yield piece
+    on_complete(size, h.hexdigest())
+
+
+async def write_hashed(pieces: AsyncIterator[bytes], out_path, timer: metrics.StageTimer = None) -> tuple:
+    """
+    Write ``pieces`` to ``out_path`` while hashing them; returns (size, hexdigest).
+    The partial file is removed if the stream fails.
+    """
+    stage = timer.stage if timer is not None else (lambda name: nullcontext())
+    h = hashlib.sha256()
+    size = 0
+    try:
+        with open(out_path, "wb") as f:
+            async for piece in pieces:
+                with stage("hash"):
+                    h.update(piece)
+                size += len(piece)
+                with stage("write"):
+                    f.write(piece)
+    except BaseException:
+        out_path.unlink(missing_ok=True)
+        raise
+    return size, h.hexdigest()
+
+
+async def encrypt_upload(
+    file,
+    password: str,
+    method: str,
+    user_level: str,
+    rsa_public_key: str = None,
+    cap: int | None = None,
+    cap_message: str = "File size cap exceeded",
+) -> PipelineResult:
+    """
+    One pass over the upload: cap check, encryption, output SHA-256 and the
+    temp-file write all happen on the same chunks.
+    """
+    src = MeteredUpload(file, cap, cap_message)
+    out_path = TEMP_DIR / f"{uuid.uuid4().hex}_{sanitize_filename(file.filename or '')}"
+    timer = metrics.StageTimer("encrypt", method, user_level)
+    try:
+        size, digest = await write_hashed(
+            encrypt_chunks(src, password, method, user_level, rsa_public_key, timer), out_path, timer
+        )
+    finally:
+        timer.record()
+    return PipelineResult(str(out_path), src.bytes_in, size, digest)
+
+
+async def decrypt_upload(
+    file,
+    password: str,
+    method: str,
+    user_level: str,
+    rsa_private_key: str = None,
+) -> PipelineResult:
+    src = MeteredUpload(file)
+    safe_name = sanitize_filename(file.filename or "decrypted.bin")
+    out_path = TEMP_DIR / f"dec_{uuid.uuid4().hex}_{safe_name}"
+    timer = metrics.StageTimer("decrypt", method, user_level)
+    try:
+        size, digest = await write_hashed(
+            decrypt_chunks(src, password, method, user_level, rsa_private_key, timer), out_path, timer
+        )
+    finally:
+        timer.record()
+    return PipelineResult(str(out_path), src.bytes_in, size, digest)
@@ -0,0 +1,263 @@
+import os
+import asyncio
+import hashlib
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from app.db.models import UploadSession
+from app.encryptor import (
+    TEMP_DIR,
+    CHUNK_SIZE,
+    NONCE_PREFIX_LEN,
+    TAG_LEN,
+    new_file_key_async,
+    new_rsa_file_key,
+    header_key_async,
+    seal_segment,
+    sealed_length,
+    check_size_limit,
+    validate_method,
+)
+from app.header import read_header
+from app.workers import run_crypto
+from app import metrics
+
+# ---------------- Config ----------------
+# idle time after which an unfinished upload and its partial output are dropped
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+
+
+class SessionLost(Exception):
+    """
+    The in-memory key of an rsa session is gone (e.g. after a restart) and
+    cannot be rebuilt from the partial output; the client must start over.
+    """
+
+
+class _Live:
+    """
+    Per-session state kept between chunks: the segment key, nonce prefix and
+    the running SHA-256 of everything written so far.
+    """
+
+    def __init__(self, key: bytes, prefix: bytes, hasher):
+        self.key = key
+        self.prefix = prefix
+        self.hasher = hasher
+        self.lock = asyncio.Lock()
+
+
+_live: dict = {}
+
+
+def chunk_count(upload: UploadSession) -> int:
+    # an empty file is still one (empty) final segment
+    return max(1, -(-upload.total_size // upload.chunk_size))
+
+
+def chunk_length(upload: UploadSession, index: int) -> int:
+    return min(upload.chunk_size, upload.total_size - index * upload.chunk_size)
+
+
+def segment_offset(upload: UploadSession, index: int) -> int:
+    return upload.header_len + index * (upload.chunk_size + TAG_LEN)
+
+
+def status(upload: UploadSession) -> dict:
+    return {
+        "upload_id":      upload.id,
+        "filename":       upload.filename,
+        "method":         upload.method,
+        "total_size":     upload.total_size,
+        "chunk_size":     upload.chunk_size,
+        "chunks":         chunk_count(upload),
+        "next_index":     upload.next_index,
+        "bytes_received": min(upload.next_index * upload.chunk_size, upload.total_size),
+        "complete":       upload.next_index == chunk_count(upload),
+        "expires_at":     upload.expires_at.isoformat(),
+    }
+
+
+def _expiry() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=UPLOAD_SESSION_TTL)
+
+
+def _forget(upload_id: str) -> None:
+    if _live.pop(upload_id, None) is not None:
+        metrics.UPLOAD_SESSIONS.set(len(_live))
+
+
+async def create(
+    db: Session,
+    user,
+    filename: str,
+    total_size: int,
+    method: str,
+    rsa_public_key: str = None,
+) -> UploadSession:
+    """
+    Open a session: write the header and nonce prefix of the output now, so
+    every later chunk is sealed and appended as it arrives. Resumable
+    uploads are never compressed: segment ``i`` must hold plaintext chunk ``i``.
+    """
+    validate_method(method, user.tier)
+    if method not in ("aes256", "rsa"):
+        raise ValueError("Resumable uploads support aes256 and rsa only.")
+    if total_size < 0:
+        raise ValueError("total_size must not be negative.")
+    check_size_limit(total_size, user.tier)
+    sweep(db)
+
+    if method == "aes256":
+        header, key = await new_file_key_async(user.license_key, method, CHUNK_SIZE, user.tier)
+    elif not rsa_public_key:
+        raise ValueError("Missing RSA public key.")
+    else:
+        header, key = await run_crypto(new_rsa_file_key, rsa_public_key, CHUNK_SIZE)
+    prefix = os.urandom(NONCE_PREFIX_LEN)
+
+    upload_id = uuid.uuid4().hex
+    path = TEMP_DIR / f"upload_{upload_id}.enc"
+    with open(path, "wb") as f:
+        f.write(header + prefix)
+    upload = UploadSession(
+        id=upload_id,
+        user_id=user.id,
+        filename=filename,
+        method=method,
+        total_size=total_size,
+        chunk_size=CHUNK_SIZE,
+        header_len=len(header) + NONCE_PREFIX_LEN,
+        next_index=0,
+        path=str(path),
+        expires_at=_expiry(),
+    )
+    db.add(upload)
+    db.commit()
+    _live[upload_id] = _Live(key, prefix, hashlib.sha256(header + prefix))
+    metrics.UPLOAD_SESSIONS.set(len(_live))
+    return upload
+
+
+def get(db: Session, upload_id: str, user) -> UploadSession | None:
+    upload = db.get(UploadSession, upload_id)
+    if upload is None or upload.user_id != user.id or upload.expires_at <= datetime.utcnow():
+        return None
+    return upload
+
+
+def _rehash(path: str, length: int):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while length > 0:
+            data = f.read(min(CHUNK_SIZE, length))
+            if not data:
+                raise ValueError("Upload output is shorter than recorded.")
+            hasher.update(data)
+            length -= len(data)
+    return hasher
+
+
+async def _state(upload: UploadSession, password: str) -> _Live:
+    """
+    The session's live state, rebuilt from the partial output if this
+    process has not seen the session (aes256 only).
+    """
+    live = _live.get(upload.id)
+    if live is not None:
+        return live
+    if upload.method != "aes256":
+        raise SessionLost("Upload session can no longer be resumed; start a new one.")
+    with open(upload.path, "rb") as f:
+        header = read_header(f.read)
+        prefix = f.read(NONCE_PREFIX_LEN)
+    key = await header_key_async(password, header)
+    hasher = await asyncio.to_thread(_rehash, upload.path, segment_offset(upload, upload.next_index))
+    # another request may have rebuilt it while we awaited
+    live = _live.setdefault(upload.id, _Live(key, prefix, hasher))
+    metrics.UPLOAD_SESSIONS.set(len(_live))
+    return live
+
+
+def _write_at(path: str, offset: int, data: bytes) -> None:
+    with open(path, "r+b") as f:
+        # drop whatever a write interrupted before its commit left behind
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(data)
+
+
+async def put_chunk(db: Session, upload: UploadSession, index: int, data: bytes, password: str) -> dict:
+    """
+    Seal chunk ``index`` and append it. Chunks arrive in order; resending an
+    already stored chunk is a no-op so clients can retry blindly.
+    """
+    live = await _state(upload, password)
+    async with live.lock:
+        db.refresh(upload)
+        if index < upload.next_index:
+            return status(upload)
+        if index > upload.next_index or index >= chunk_count(upload):
+            raise LookupError(f"Expected chunk {upload.next_index}.")
+        if len(data) != chunk_length(upload, index):
+            raise ValueError(f"Chunk {index} must be {chunk_length(upload, index)} bytes.")
+
+        last = index == chunk_count(upload) - 1
+        segment = await run_crypto(seal_segment, live.key, live.prefix, index, data, last)
+        await asyncio.to_thread(_write_at, upload.path, segment_offset(upload, index), segment)
+        upload.next_index = index + 1
+        upload.expires_at = _expiry()
+        db.commit()
+        # only count bytes the database agrees were stored
+        live.hasher.update(segment)
+        return status(upload)
+
+
+async def finalize(db: Session, upload: UploadSession, password: str) -> tuple:
+    """
+    Close a complete session. Returns (path, ciphertext size, sha256 hex);
+    the caller records the metadata and removes the file after serving it.
+    """
+    live = await _state(upload, password)
+    async with live.lock:
+        db.refresh(upload)
+        if upload.next_index != chunk_count(upload):
+            raise LookupError(f"Upload incomplete: expected chunk {upload.next_index}.")
+        size = sealed_length(upload.total_size, upload.header_len, upload.chunk_size)
+        digest = live.hasher.hexdigest()
+        path = upload.path
+        db.delete(upload)
+        db.commit()
+    _forget(upload.id)
+    return path, size, digest
+
+
+def abort(db: Session, upload: UploadSession) -> None:
+    _remove(upload.path)
+    db.delete(upload)
+    db.commit()
+    _forget(upload.id)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def sweep(db: Session, now: datetime = None) -> int:
+    """
+    Drop expired sessions and their partial output; returns how many.
+    """
+    now = now or datetime.utcnow()
+    expired = db.query(UploadSession).filter(UploadSession.expires_at <= now).all()
+    for upload in expired:
+        _remove(upload.path)
+        _forget(upload.id)
+        db.delete(upload)
+    if expired:
+        db.commit()
+    return len(expired)
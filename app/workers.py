@@ -0,0 +1,71 @@
+import os
+import asyncio
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from threading import Lock
+
+from app import metrics
+
+# ---------------- Config ----------------
+# "thread" (default) or "process". Process workers only ever receive
+# module-level functions and plain bytes, so everything submitted must pickle.
+CRYPTO_EXECUTOR   = os.getenv("CRYPTO_EXECUTOR", "thread").lower()
+CRYPTO_WORKERS    = int(os.getenv("CRYPTO_WORKERS", str(min(32, (os.cpu_count() or 1) + 4))))
+# max crypto tasks queued or running per event loop; extra callers wait
+CRYPTO_MAX_PENDING = int(os.getenv("CRYPTO_MAX_PENDING", str(CRYPTO_WORKERS * 4)))
+
+_executor: Executor | None = None
+_executor_lock = Lock()
+_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def get_executor() -> Executor:
+    """
+    Lazily build the shared crypto pool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if CRYPTO_EXECUTOR == "process":
+                _executor = ProcessPoolExecutor(max_workers=CRYPTO_WORKERS)
+            elif CRYPTO_EXECUTOR == "thread":
+                _executor = ThreadPoolExecutor(
+                    max_workers=CRYPTO_WORKERS, thread_name_prefix="crypto"
+                )
+            else:
+                raise ValueError(f"Unknown CRYPTO_EXECUTOR {CRYPTO_EXECUTOR!r}")
+        return _executor
+
+
+def shutdown_executor(wait: bool = True) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+
+
+def _loop_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _slots.get(loop)
+    if sem is None:
+        sem = _slots[loop] = asyncio.Semaphore(CRYPTO_MAX_PENDING)
+    return sem
+
+
+async def run_crypto(fn, *args, local: bool = False):
+    """
+    Run a CPU-bound KDF, cipher or codec call on the crypto pool so the event
+    loop keeps serving other requests. Callers beyond CRYPTO_MAX_PENDING wait
+    for a slot instead of piling buffers into the pool queue. ``local``
+    calls act on in-process state (a streaming compressor, a generator) and
+    run on a thread even when the pool is a process pool.
+    """
+    metrics.CRYPTO_TASKS.inc()
+    try:
+        async with _loop_slots():
+            loop = asyncio.get_running_loop()
+            executor = None if local and CRYPTO_EXECUTOR == "process" else get_executor()
+            return await loop.run_in_executor(executor, fn, *args)
+    finally:
+        metrics.CRYPTO_TASKS.dec()
@@ -0,0 +1,406 @@
+"""
+Crypto and endpoint benchmarks with a regression gate.
+
+    python -m benchmarks.bench_crypto [--sizes 1K,1M,16M] [--methods fernet,aes256,rsa]
+                                      [--endpoint-sizes 1K,1M] [--copies-sizes 16M]
+                                      [--out results.json]
+                                      [--baseline benchmarks/baseline.json]
+                                      [--threshold 0.25] [--floor-ms 0.25]
+                                      [--save-baseline]
+
+Every case runs in a fresh subprocess (inside a scratch directory, so the
+database, temp files and JSON log are throwaway) which keeps peak RSS per
+case honest. Crypto cases stream file -> /dev/null through the same
+functions the API uses; endpoint cases post through TestClient.
+
+Reported per case: throughput (MB/s, best warm call), median per-call latency, the
+first (cold-cache) call, the share of that cold call spent in key setup
+(PBKDF2 for fernet/aes256, RSA-OAEP wrapping or unwrapping for rsa) and
+peak RSS. The run fails if any case's median call gets slower than the
+baseline by more than ``--threshold`` (as a throughput drop) and by more
+than ``--floor-ms``, so sub-millisecond cases are gated too. Baselines are
+machine-specific, so regenerate them with --save-baseline on the machine
+that gates. A baseline also records a digest of the container and stream
+code (STREAM_SOURCES) and is refused once that code changes: commits that
+touch it regenerate benchmarks/baseline.json.
+
+Copies cases run one aes256 call per path: "buffered" is the read() /
+update() loop, "zerocopy" the readinto/encrypt_into path the stream
+functions take, fed from an mmap on decrypt. Their children run with
+MALLOC_MMAP_THRESHOLD_ lowered so every large buffer is a fresh mapping;
+first-touch page faults per payload byte then approximate how many times
+each byte was copied into a new buffer ("copies"). The mmap'd input is
+page cache, so it shows up in the zerocopy decrypt's RSS without being a
+copy.
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+BASELINE = Path(__file__).with_name("baseline.json")
+MIB = 1024 * 1024
+UNITS = {"K": 1024, "M": MIB, "G": 1024 * MIB}
+PASSWORD = "bench-key"
+# fernet holds the whole payload (and its base64) in memory
+FERNET_MAX = 256 * MIB
+# slowdowns up to this many ms per call are timer noise, however fast the case
+GATE_FLOOR_MS = 0.25
+# container and stream code the baseline numbers were measured on
+STREAM_SOURCES = ("app/header.py", "app/encryptor.py", "app/decryptor.py", "app/compression.py")
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper()
+    if text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def size_label(size: int) -> str:
+    for unit in ("G", "M", "K"):
+        if size >= UNITS[unit] and size % UNITS[unit] == 0:
+            return f"{size // UNITS[unit]}{unit}"
+    return str(size)
+
+
+def reps_for(size: int) -> int:
+    # enough calls for a stable median without making 1 GB cases crawl
+    return max(1, min(20, (64 * MIB) // max(size, 1)))
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_payload(path: Path, size: int) -> None:
+    block = os.urandom(MIB)
+    with path.open("wb") as f:
+        left = size
+        while left:
+            n = min(left, MIB)
+            f.write(block[:n])
+            left -= n
+
+
+# ---------------- Cases (run in the child) ----------------
+def _rsa_pair():
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    priv = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    priv_pem = priv.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    pub_pem = priv.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+    return pub_pem, priv_pem
+
+
+def _crypto_ops(method: str):
+    """
+    (encrypt, decrypt, key_setup) callables for ``method``.
+    """
+    from app import encryptor as enc, decryptor as dec
+    from app.header import parse_header
+
+    if method == "fernet":
+        return (
+            lambda src, dst: dst.write(enc.fernet_encrypt(src.read(), PASSWORD)),
+            lambda src, dst: dst.write(dec.fernet_decrypt(src.read(), PASSWORD)),
+            lambda: enc.derive_key(PASSWORD, os.urandom(enc.SALT_LEN)),
+        )
+    if method == "aes256":
+        return (
+            lambda src, dst: enc.encrypt_stream(src, dst, PASSWORD),
+            lambda src, dst: dec.decrypt_stream(src, dst, PASSWORD),
+            lambda: enc.derive_key(PASSWORD, os.urandom(enc.SALT_LEN)),
+        )
+    pub, priv = _rsa_pair()
+    wrapped = parse_header(enc.new_rsa_file_key(pub)[0])[0].wrapped_key
+    return (
+        lambda src, dst: enc.rsa_encrypt_stream(src, dst, pub),
+        lambda src, dst: dec.rsa_decrypt_stream(src, dst, priv),
+        {"encrypt": lambda: enc.new_rsa_file_key(pub), "decrypt": lambda: dec.unwrap_key(wrapped, priv)},
+    )
+
+
+def _forget_keys():
+    from app import encryptor as enc, decryptor as dec
+    enc._master_keys.clear()
+    enc._session_salts.clear()
+    enc._public_keys.clear()
+    dec._private_keys.clear()
+
+
+def crypto_case(method: str, op: str, size: int) -> dict:
+    encrypt, decrypt, setup = _crypto_ops(method)
+    if isinstance(setup, dict):
+        setup = setup[op]
+    plain, sealed = Path("plain.bin"), Path("sealed.bin")
+    write_payload(plain, size)
+    if op == "decrypt":
+        with plain.open("rb") as src, sealed.open("wb") as dst:
+            encrypt(src, dst)
+    fn, path = (encrypt, plain) if op == "encrypt" else (decrypt, sealed)
+
+    def call() -> float:
+        with path.open("rb") as src, open(os.devnull, "wb") as dst:
+            t0 = time.perf_counter()
+            fn(src, dst)
+            return time.perf_counter() - t0
+
+    _forget_keys()
+    cold = call()
+    t0 = time.perf_counter()
+    setup()
+    setup_s = time.perf_counter() - t0
+    warm = [call() for _ in range(reps_for(size))]
+    return _record(size, cold, warm, setup_s)
+
+
+def endpoint_case(method: str, op: str, size: int) -> dict:
+    os.environ.setdefault("DATABASE_URL", "sqlite:///./bench.db")
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.db.crud import PER_FILE_CAP
+    from app.encryptor import TIER_FILE_SIZE_LIMITS
+
+    PER_FILE_CAP["account"] = None
+    TIER_FILE_SIZE_LIMITS["account"] = None
+    client = TestClient(app)
+    client.post("/api/register", data={"email": "bench@example.com", "password": "pw"})
+    token = client.post("/api/token", data={"username": "bench@example.com", "password": "pw"})
+    headers = {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+    data = os.urandom(size)
+    if op == "decrypt":
+        r = client.post("/api/encrypt", headers=headers, files={"file": ("b.bin", data)}, data={"method": method})
+        r.raise_for_status()
+        data = r.content
+
+    def call() -> float:
+        t0 = time.perf_counter()
+        r = client.post(f"/api/{op}", headers=headers, files={"file": ("b.bin", data)}, data={"method": method})
+        elapsed = time.perf_counter() - t0
+        r.raise_for_status()
+        return elapsed
+
+    cold = call()
+    warm = [call() for _ in range(reps_for(size))]
+    return _record(size, cold, warm, None)
+
+
+def _record(size: int, cold: float, warm: list, setup_s: float | None) -> dict:
+    # throughput from the fastest call (least scheduler noise), latency from the median
+    best, median = min(warm), statistics.median(warm)
+    return {
+        "bytes":       size,
+        "mb_s":        round(size / MIB / best, 3) if best else None,
+        "latency_ms":  round(median * 1000, 3),
+        "cold_ms":     round(cold * 1000, 3),
+        "kdf_share":   round(min(setup_s / cold, 1.0), 3) if setup_s is not None and cold else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def _buffered_encrypt(src, dst) -> None:
+    from app.encryptor import new_sealer
+    sealer = new_sealer(PASSWORD, codec="none")
+    dst.write(sealer.header())
+    while chunk := src.read(sealer.chunk_size):
+        dst.write(sealer.update(chunk))
+    dst.write(sealer.finalize())
+
+
+def _buffered_decrypt(src, dst) -> None:
+    from app.decryptor import SegmentOpener, _read_prefix, segment_size, unlock_header
+    from app.header import read_header
+    header = read_header(src.read)
+    opener = SegmentOpener(unlock_header(header, PASSWORD, None), _read_prefix(src), segment_size(header))
+    while chunk := src.read(opener.record_size):
+        dst.write(opener.update(chunk))
+    dst.write(opener.finalize())
+
+
+def copies_case(path: str, op: str, size: int) -> dict:
+    import mmap
+    from app import encryptor as enc, decryptor as dec
+
+    plain, sealed = Path("plain.bin"), Path("sealed.bin")
+    write_payload(plain, size)
+    if op == "decrypt":
+        with plain.open("rb") as src, sealed.open("wb") as dst:
+            enc.encrypt_stream(src, dst, PASSWORD, codec="none")
+    source = plain if op == "encrypt" else sealed
+    # key setup is cached after this, so only the streaming pass is measured
+    with source.open("rb") as src, open(os.devnull, "wb") as dst:
+        (enc.encrypt_stream if op == "encrypt" else dec.decrypt_stream)(src, dst, PASSWORD)
+
+    with source.open("rb") as f, open(os.devnull, "wb") as dst:
+        rss0, faults0 = peak_rss_mb(), resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+        t0 = time.perf_counter()
+        if path == "buffered":
+            (_buffered_encrypt if op == "encrypt" else _buffered_decrypt)(f, dst)
+        elif op == "encrypt":
+            enc.encrypt_stream(f, dst, PASSWORD, codec="none")
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                reader = enc.BufferReader(mm)
+                dec.decrypt_stream(reader, dst, PASSWORD)
+                reader.close()
+        elapsed = time.perf_counter() - t0
+        faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults0
+    return {
+        "bytes":         size,
+        "mb_s":          round(size / MIB / elapsed, 3),
+        "latency_ms":    round(elapsed * 1000, 3),
+        "copies":        round(faults * resource.getpagesize() / size, 2),
+        "rss_growth_mb": round(peak_rss_mb() - rss0, 1),
+        "peak_rss_mb":   round(peak_rss_mb(), 1),
+    }
+
+
+# ---------------- Driver ----------------
+def run_child(kind: str, method: str, op: str, size: int) -> dict:
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    if kind == "copies":
+        env["MALLOC_MMAP_THRESHOLD_"] = "65536"
+    with tempfile.TemporaryDirectory(prefix="enclypt-bench-") as scratch:
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_crypto", "--case", f"{kind}:{method}:{op}:{size}"],
+            cwd=scratch,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+    if out.returncode:
+        raise RuntimeError(f"{kind}/{method}/{op}/{size} failed:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def sources_digest() -> str:
+    h = hashlib.sha256()
+    for rel in STREAM_SOURCES:
+        h.update(rel.encode() + b"\0" + (ROOT / rel).read_bytes())
+    return h.hexdigest()
+
+
+def compare(results: dict, baseline: dict, threshold: float, floor_ms: float = GATE_FLOOR_MS) -> list:
+    """
+    Names of cases whose median call got slower than baseline by more than
+    ``threshold`` (as a throughput drop) and by more than ``floor_ms``.
+    """
+    slower = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base or base.get("latency_ms") is None or res.get("latency_ms") is None:
+            continue
+        limit = max(base["latency_ms"] / (1 - threshold), base["latency_ms"] + floor_ms)
+        if res["latency_ms"] > limit:
+            slower.append(name)
+    return slower
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", default="1K,1M,16M", help="crypto payload sizes, e.g. 1K,1M,1G")
+    ap.add_argument("--methods", default="fernet,aes256,rsa")
+    ap.add_argument("--endpoint-sizes", default="1K,1M", help="'' to skip the endpoint cases")
+    ap.add_argument("--copies-sizes", default="16M", help="'' to skip the buffer-copy cases")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--baseline", default=str(BASELINE))
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed throughput drop (0.25 = 25%%)")
+    ap.add_argument("--floor-ms", type=float, default=GATE_FLOOR_MS, help="slowdown per call always allowed")
+    ap.add_argument("--save-baseline", action="store_true", help="write results to --baseline")
+    ap.add_argument("--case", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.case:
+        kind, method, op, size = args.case.split(":")
+        case = {"crypto": crypto_case, "endpoint": endpoint_case, "copies": copies_case}[kind]
+        print(json.dumps(case(method, op, int(size))))
+        return 0
+
+    methods = [m for m in args.methods.split(",") if m]
+    plan = [
+        ("crypto", m, op, parse_size(s))
+        for s in args.sizes.split(",") if s
+        for m in methods
+        for op in ("encrypt", "decrypt")
+        if not (m == "fernet" and parse_size(s) > FERNET_MAX)
+    ] + [
+        ("endpoint", m, op, parse_size(s))
+        for s in args.endpoint_sizes.split(",") if s
+        for m in methods if m != "rsa"   # the endpoints take rsa keys per request; skip
+        for op in ("encrypt", "decrypt")
+    ]
+
+    results = {}
+    print(f"{'case':<32} {'MB/s':>9} {'ms/call':>9} {'cold ms':>9} {'kdf':>6} {'rss MB':>8}")
+    for kind, method, op, size in plan:
+        name = f"{kind}/{method}/{op}/{size_label(size)}"
+        r = results[name] = run_child(kind, method, op, size)
+        kdf = f"{r['kdf_share']:.0%}" if r["kdf_share"] is not None else "-"
+        print(
+            f"{name:<32} {r['mb_s']:>9.2f} {r['latency_ms']:>9.2f} "
+            f"{r['cold_ms']:>9.2f} {kdf:>6} {r['peak_rss_mb']:>8.1f}"
+        )
+
+    copies = [
+        ("copies", path, op, parse_size(s))
+        for s in args.copies_sizes.split(",") if s
+        for op in ("encrypt", "decrypt")
+        for path in ("buffered", "zerocopy")
+    ]
+    if copies:
+        print(f"\n{'case':<32} {'MB/s':>9} {'copies':>9} {'rss +MB':>9} {'rss MB':>8}")
+    for kind, path, op, size in copies:
+        name = f"{kind}/aes256/{op}/{size_label(size)}/{path}"
+        r = results[name] = run_child(kind, path, op, size)
+        print(
+            f"{name:<32} {r['mb_s']:>9.2f} {r['copies']:>9.2f} "
+            f"{r['rss_growth_mb']:>9.1f} {r['peak_rss_mb']:>8.1f}"
+        )
+
+    Path(args.out).write_text(json.dumps(results, indent=2) + "\n")
+    if args.save_baseline:
+        saved = {"sources": sources_digest(), "cases": results}
+        Path(args.baseline).write_text(json.dumps(saved, indent=2) + "\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    try:
+        saved = json.loads(Path(args.baseline).read_text())
+    except FileNotFoundError:
+        print(f"no baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+    if saved.get("sources") != sources_digest():
+        print(f"{args.baseline} predates the current stream code; regenerate it with --save-baseline")
+        return 1
+    baseline = saved["cases"]
+    slower = compare(results, baseline, args.threshold, args.floor_ms)
+    for name in slower:
+        print(
+            f"REGRESSION {name}: {results[name]['latency_ms']:.3f} ms/call "
+            f"vs baseline {baseline[name]['latency_ms']:.3f}"
+        )
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
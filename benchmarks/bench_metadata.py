@@ -0,0 +1,77 @@
+"""
+Compare per-request metadata commits with the write-behind batch writer.
+
+    python -m benchmarks.bench_metadata [--records 2000] [--threads 8]
+
+Runs against a scratch SQLite database. "request path" is the time callers
+spend recording metadata; "end to end" includes the final flush.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+_scratch = tempfile.mkdtemp(prefix="enclypt-meta-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_scratch}/bench.db"
+os.environ.setdefault("METADATA_LOG_DIR", f"{_scratch}/metadata_log")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import app.json_store as json_store
+from app import metawriter
+from app.db import crud
+from app.db.session import Base, SessionLocal, engine
+
+json_store.STORE_PATH = Path(_scratch) / "file_metadata.jsonl"
+
+
+def sync_flow(user, n: int, threads: int) -> tuple:
+    def one(i):
+        # one transaction per record, as if each request committed its own
+        metawriter.write_records([crud.file_meta_record(user, f"f{i}", 1024, "0" * 64, "aes256")])
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one, range(n)))
+    elapsed = time.perf_counter() - t0
+    return elapsed, elapsed
+
+
+def write_behind_flow(user, n: int, threads: int) -> tuple:
+    def one(i):
+        crud.queue_file_meta(user, f"f{i}", 1024, "0" * 64, "aes256")
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one, range(n)))
+    request_path = time.perf_counter() - t0
+    metawriter.shutdown()
+    return request_path, time.perf_counter() - t0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--records", type=int, default=2000)
+    ap.add_argument("--threads", type=int, default=8, help="concurrent callers")
+    args = ap.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        user = crud.create_user(db, "bench@example.com", "x")
+
+    print(f"{'flow':>12} {'request path':>13} {'end to end':>11} {'records/s':>10}")
+    for name, flow in (("sync", sync_flow), ("write-behind", write_behind_flow)):
+        request_path, total = flow(user, args.records, args.threads)
+        print(
+            f"{name:>12} {request_path * 1000:>11.1f}ms {total * 1000:>9.1f}ms "
+            f"{args.records / total:>10.0f}"
+        )
+    with SessionLocal() as db:
+        assert crud.sum_user_usage(db, user) == 2 * args.records * 1024
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Compare the old three-pass /api/encrypt flow with the single-pass pipeline.
+
+    python -m benchmarks.bench_upload [--sizes 1,16,64] [--method aes256]
+
+Sizes are in MiB. For each request we report upload bytes read, bytes read
+back from the temp file, bytes written, peak Python heap and wall time.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from starlette.datastructures import UploadFile
+
+from app.encryptor import encrypt_file
+from app.pipeline import encrypt_upload
+
+
+class CountingFile:
+    """
+    File proxy that tallies bytes read and written through it.
+    """
+
+    def __init__(self, f, stats: dict, prefix: str):
+        self._f = f
+        self._stats = stats
+        self._prefix = prefix
+
+    def read(self, *args):
+        data = self._f.read(*args)
+        self._stats[self._prefix + "_read"] += len(data)
+        return data
+
+    def write(self, data):
+        self._stats[self._prefix + "_written"] += len(data)
+        return self._f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+
+def make_upload(size: int, stats: dict) -> UploadFile:
+    raw = tempfile.TemporaryFile()
+    block = os.urandom(1024 * 1024)
+    left = size
+    while left:
+        raw.write(block[:min(left, len(block))])
+        left -= min(left, len(block))
+    raw.seek(0)
+    return UploadFile(file=CountingFile(raw, stats, "upload"), size=size, filename="bench.bin")
+
+
+def patch_open(stats: dict):
+    """
+    Route the temp-file traffic of both flows through CountingFile.
+    """
+    import builtins
+    real_open = builtins.open
+
+    def counting_open(path, mode="r", *args, **kwargs):
+        f = real_open(path, mode, *args, **kwargs)
+        if "b" in mode and str(path).startswith("temp_files"):
+            return CountingFile(f, stats, "disk")
+        return f
+
+    builtins.open = counting_open
+    return lambda: setattr(builtins, "open", real_open)
+
+
+async def legacy_flow(upload, method):
+    content = await upload.read()            # size check
+    size = len(content)
+    await upload.seek(0)
+    out = await encrypt_file(upload, "bench-key", method, "paid")
+    with open(out, "rb") as f:               # re-read for create_file_meta
+        data = f.read()
+    hashlib.sha256(data).hexdigest()
+    os.remove(out)
+    return size
+
+
+async def pipeline_flow(upload, method):
+    res = await encrypt_upload(upload, "bench-key", method, "paid")
+    os.remove(res.path)
+    return res.bytes_in
+
+
+def run_case(flow, size, method) -> dict:
+    stats = dict.fromkeys(("upload_read", "upload_written", "disk_read", "disk_written"), 0)
+    upload = make_upload(size, stats)
+    restore = patch_open(stats)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        asyncio.run(flow(upload, method))
+    finally:
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        restore()
+    return {
+        "upload_read": stats["upload_read"],
+        "disk_read": stats["disk_read"],
+        "disk_written": stats["disk_written"],
+        "peak_heap": peak,
+        "seconds": elapsed,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", default="1,16,64", help="payload sizes in MiB")
+    ap.add_argument("--method", default="aes256", choices=["fernet", "aes256"])
+    args = ap.parse_args(argv)
+
+    mib = 1024 * 1024
+    run_case(pipeline_flow, 1024, args.method)  # warm the master-key cache
+    print(f"{'size':>6} {'flow':>9} {'upload rd':>10} {'disk rd':>9} {'disk wr':>9} {'peak heap':>10} {'ms':>8}")
+    for size_mb in (int(s) for s in args.sizes.split(",")):
+        for name, flow in (("legacy", legacy_flow), ("pipeline", pipeline_flow)):
+            r = run_case(flow, size_mb * mib, args.method)
+            print(
+                f"{size_mb:>4}MB {name:>9} {r['upload_read'] / mib:>8.1f}MB "
+                f"{r['disk_read'] / mib:>7.1f}MB {r['disk_written'] / mib:>7.1f}MB "
+                f"{r['peak_heap'] / mib:>8.1f}MB {r['seconds'] * 1000:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -109,6 +109,9 @@ export interface DashboardData {
   email: string;
   tier: string;
   files: DashboardFile[];
+  // newest-first page; pass next_cursor as ?after= for the next one
+  total: number;
+  next_cursor: string | null;
 }
 
 export function getDashboard(token: string): Promise<DashboardData> {
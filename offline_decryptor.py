@@ -1,14 +1,284 @@
-import asyncio
+"""
+Enclypt offline decryptor.
+
+    python offline_decryptor.py                      # Tkinter GUI
+    python offline_decryptor.py INPUT... [options]   # headless batch mode
+
+INPUT may be files, directories (walked recursively) or glob patterns.
+Run with --help for the batch options.
+"""
+import argparse
+import getpass
+import glob
+import mmap
 import os
-from io import BytesIO
-from tkinter import Tk, StringVar, filedialog, messagebox
-from tkinter import ttk
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from app.encryptor import SALT_LEN, BufferReader
+from app.decryptor import HEADER_PEEK, decrypt_any_stream, decrypt_range, opened_size, parse_byte_range
+from app.header import is_header
+
+METHODS = ["fernet", "aes256", "rsa"]
+# baseline rsa files are one OAEP ciphertext: 2048/3072/4096-bit moduli
+RSA_CIPHERTEXT_SIZES = (256, 384, 512)
+# every Fernet token starts with version 0x80 and a timestamp's zero high bytes
+FERNET_MAGIC = b"gAAAAA"
+
+
+# ---------------- Decryption ----------------
+class Cancelled(Exception):
+    """
+    Raised from a progress callback to abort the file being decrypted.
+    """
+
+
+class _ProgressReader:
+    def __init__(self, f, progress):
+        self._f = f
+        self._progress = progress
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._f.read(size)
+        self._progress(len(data))
+        return data
+
+    def readview(self, size: int = -1) -> memoryview:
+        view = self._f.readview(size)
+        self._progress(len(view))
+        return view
+
+
+@contextmanager
+def _mapped(f):
+    """
+    A BufferReader over ``f`` memory-mapped, so segments are decrypted
+    straight out of the page cache instead of being copied into buffers.
+    """
+    if os.fstat(f.fileno()).st_size == 0:
+        # empty files cannot be mapped
+        yield BufferReader(b"")
+        return
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    reader = BufferReader(mm)
+    try:
+        yield reader
+    finally:
+        try:
+            reader.close()
+            mm.close()
+        except BufferError:
+            # a failed decrypt may still hold views into the map (e.g. in its
+            # traceback); it is unmapped once they are collected
+            pass
+
+
+def detect_method(head: bytes, size: int, have_rsa_key: bool) -> str:
+    """
+    Best guess at the method of a headerless (baseline) ciphertext from its
+    first bytes and size; v1 files name their cipher in the header.
+    """
+    if head[SALT_LEN:SALT_LEN + len(FERNET_MAGIC)] == FERNET_MAGIC:
+        return "fernet"
+    if have_rsa_key and size in RSA_CIPHERTEXT_SIZES:
+        return "rsa"
+    return "aes256"
+
+
+def decrypt_path(
+    src_path,
+    dst_path,
+    password: str,
+    method: str,
+    rsa_key: str = None,
+    progress=None,
+    byte_range: str = None,
+) -> tuple:
+    """
+    Decrypt ``src_path`` into ``dst_path`` with streaming I/O. Output goes to a
+    ``.part`` file that is renamed only once every segment authenticated.
+    ``progress(n)`` is called per read with the ciphertext bytes consumed; an
+    exception it raises (e.g. Cancelled) aborts the file. ``byte_range``
+    ("A-B", "A-" or "-N", inclusive like HTTP Range) decrypts just those
+    plaintext bytes, touching only the segments that hold them.
+    Returns (bytes_in, bytes_out, method).
+    """
+    src_path, dst_path = Path(src_path), Path(dst_path)
+    if method == "auto":
+        with src_path.open("rb") as f:
+            head = f.read(SALT_LEN + len(FERNET_MAGIC))
+            size = os.fstat(f.fileno()).st_size
+        # v1 headers name the cipher; only headerless files need guessing
+        method = None if is_header(head) else detect_method(head, size, rsa_key is not None)
+        if method == "rsa":
+            try:
+                return decrypt_path(src_path, dst_path, password, "rsa", rsa_key, progress, byte_range)
+            except ValueError:
+                # a short aes256 file can be exactly a modulus long
+                method = "aes256"
+
+    dst_path.parent.mkdir(parents=True, exist_ok=True)
+    part = dst_path.with_name(dst_path.name + ".part")
+    try:
+        with src_path.open("rb") as raw, part.open("wb") as dst:
+            if byte_range is not None:
+                written = _decrypt_slice(raw, dst, byte_range, password, method, rsa_key)
+            else:
+                with _mapped(raw) as mapped:
+                    src = _ProgressReader(mapped, progress) if progress else mapped
+                    written, method = decrypt_any_stream(src, dst, password, rsa_key, method)
+        os.replace(part, dst_path)
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+    return src_path.stat().st_size, written, method
+
+
+def _decrypt_slice(raw, dst, byte_range: str, password: str, method: str, rsa_key: str) -> int:
+    total = opened_size(raw.read(HEADER_PEEK), os.fstat(raw.fileno()).st_size, method)
+    if total is None:
+        raise ValueError("Range decryption needs an uncompressed v1 aes256 or rsa ciphertext.")
+    start, stop = parse_byte_range(byte_range, total)
+    return decrypt_range(raw, dst, start, stop, password, rsa_key)
+
+
+def output_name(name: str) -> str:
+    """
+    Undo the server's naming: ``encrypted_report.pdf`` / ``report.pdf.enc``
+    become ``report.pdf``.
+    """
+    out = name
+    if out.startswith("encrypted_"):
+        out = out[len("encrypted_"):]
+    if out.endswith(".enc"):
+        out = out[:-len(".enc")]
+    return out if out and out != name else name + ".dec"
+
+
+def collect_inputs(patterns: list) -> list:
+    """
+    Expand files, directories and globs to (path, path relative to its root).
+    """
+    found = []
+    for pattern in patterns:
+        p = Path(pattern)
+        if p.is_dir():
+            found.extend((f, f.relative_to(p)) for f in sorted(p.rglob("*")) if f.is_file())
+        elif p.is_file():
+            found.append((p, Path(p.name)))
+        else:
+            found.extend(
+                (Path(m), Path(Path(m).name))
+                for m in sorted(glob.glob(pattern, recursive=True))
+                if os.path.isfile(m)
+            )
+    return found
+
+
+def _decrypt_one(src, dst, password, method, rsa_key, byte_range=None) -> tuple:
+    # process-pool entry point: never raises, so one bad file can't stop a batch
+    try:
+        bytes_in, bytes_out, used = decrypt_path(src, dst, password, method, rsa_key, None, byte_range)
+        return str(src), bytes_in, bytes_out, used, None
+    except Exception as e:
+        return str(src), 0, 0, method, str(e) or type(e).__name__
+
 
-from app.decryptor import decrypt_file
+# ---------------- Headless CLI ----------------
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(
+        prog="offline_decryptor.py",
+        description="Decrypt Enclypt ciphertexts offline, in parallel.",
+    )
+    ap.add_argument("inputs", nargs="+", help="files, directories or glob patterns")
+    ap.add_argument("-o", "--out", help="output directory (default: next to each input)")
+    ap.add_argument("-m", "--method", choices=METHODS, default="aes256")
+    ap.add_argument("--auto-method", action="store_true", help="guess the method of headerless (baseline) files")
+    ap.add_argument("-p", "--password", help="license key (default: $ENCLYPT_KEY or prompt)")
+    ap.add_argument("-k", "--rsa-key", help="PEM file with the RSA private key")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    ap.add_argument("--range", metavar="A-B", dest="byte_range",
+                    help="only decrypt plaintext bytes A-B (inclusive; also A- or -N)")
+    ap.add_argument("--overwrite", action="store_true", help="replace existing outputs")
+    ap.add_argument("-q", "--quiet", action="store_true", help="only print failures and the summary")
+    return ap
 
 
+def plan_outputs(inputs: list, out_dir) -> list:
+    """
+    (src, dst) pairs; with ``out_dir`` the input tree is mirrored under it.
+    """
+    pairs = []
+    for src, rel in inputs:
+        name = output_name(rel.name)
+        if out_dir:
+            dst = Path(out_dir) / rel.parent / name
+        else:
+            dst = src.with_name(name)
+        pairs.append((src, dst))
+    return pairs
+
+
+def run_cli(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    password = args.password or os.getenv("ENCLYPT_KEY") or getpass.getpass("License key: ")
+    rsa_key = Path(args.rsa_key).read_text() if args.rsa_key else None
+    method = "auto" if args.auto_method else args.method
+
+    pairs = plan_outputs(collect_inputs(args.inputs), args.out)
+    if not pairs:
+        print("no input files found", file=sys.stderr)
+        return 2
+    skipped = 0
+    if not args.overwrite:
+        kept = [(s, d) for s, d in pairs if not d.exists()]
+        skipped, pairs = len(pairs) - len(kept), kept
+
+    failed = done = bytes_in = bytes_out = 0
+    t0 = time.perf_counter()
+    # one PBKDF2 per worker per master salt; the rest is cheap HKDF + AES-GCM
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = [pool.submit(_decrypt_one, s, d, password, method, rsa_key, args.byte_range) for s, d in pairs]
+        for fut in as_completed(futures):
+            src, n_in, n_out, used, error = fut.result()
+            if error:
+                failed += 1
+                print(f"FAILED {src}: {error}", file=sys.stderr)
+                continue
+            done += 1
+            bytes_in += n_in
+            bytes_out += n_out
+            if not args.quiet:
+                print(f"ok  {src} ({used})")
+    elapsed = time.perf_counter() - t0
+
+    mib = bytes_in / (1024 * 1024)
+    print(
+        f"{done} decrypted, {failed} failed, {skipped} skipped (exists) in {elapsed:.1f}s: "
+        f"{mib:.1f} MiB at {mib / elapsed if elapsed else 0:.1f} MiB/s, "
+        f"{done / elapsed if elapsed else 0:.1f} files/s"
+    )
+    return 1 if failed else 0
+
+
+# ---------------- GUI ----------------
 class DecryptorGUI:
+    """
+    Tk front end. Decryption runs on a worker thread that reports through a
+    queue polled with ``root.after``, so the window stays responsive; files
+    added to the list are decrypted one after another.
+    """
+
+    POLL_MS = 100
+
     def __init__(self):
+        from tkinter import Tk, StringVar, DoubleVar, Listbox, ttk
+
         self.root = Tk()
         self.root.title("Enclypt Offline Decryptor")
         self.root.resizable(False, False)
@@ -20,32 +290,54 @@ class DecryptorGUI:
 
         pad = {"padx": 8, "pady": 6}
 
-        ttk.Label(self.root, text="Encrypted File:").grid(row=0, column=0, sticky="e", **pad)
-        self.file_var = StringVar()
-        ttk.Entry(self.root, textvariable=self.file_var, width=40).grid(row=0, column=1, **pad)
-        ttk.Button(self.root, text="Browse", command=self.choose_file).grid(row=0, column=2, **pad)
+        ttk.Label(self.root, text="Encrypted Files:").grid(row=0, column=0, sticky="ne", **pad)
+        self.files = Listbox(self.root, width=48, height=6, selectmode="extended")
+        self.files.grid(row=0, column=1, **pad)
+        buttons = ttk.Frame(self.root)
+        buttons.grid(row=0, column=2, sticky="n", **pad)
+        ttk.Button(buttons, text="Add", command=self.choose_file).pack(fill="x")
+        ttk.Button(buttons, text="Remove", command=self.remove_files).pack(fill="x", pady=4)
 
         ttk.Label(self.root, text="Password / Key:").grid(row=1, column=0, sticky="e", **pad)
         self.pass_var = StringVar()
-        ttk.Entry(self.root, textvariable=self.pass_var, show="*").grid(row=1, column=1, **pad)
+        ttk.Entry(self.root, textvariable=self.pass_var, show="*").grid(row=1, column=1, sticky="w", **pad)
 
         ttk.Label(self.root, text="Method:").grid(row=2, column=0, sticky="e", **pad)
         self.method_var = StringVar(value="fernet")
-        ttk.Combobox(self.root, textvariable=self.method_var, values=["fernet", "aes256", "rsa"], state="readonly").grid(row=2, column=1, sticky="w", **pad)
+        ttk.Combobox(self.root, textvariable=self.method_var, values=METHODS + ["auto"], state="readonly").grid(row=2, column=1, sticky="w", **pad)
 
         ttk.Label(self.root, text="RSA Private Key:").grid(row=3, column=0, sticky="e", **pad)
         self.key_var = StringVar()
         ttk.Entry(self.root, textvariable=self.key_var, width=40).grid(row=3, column=1, **pad)
         ttk.Button(self.root, text="Browse", command=self.choose_key).grid(row=3, column=2, **pad)
 
-        ttk.Button(self.root, text="Decrypt", command=self.run_decrypt).grid(row=4, column=1, pady=12)
+        self.progress_var = DoubleVar(value=0)
+        ttk.Progressbar(self.root, variable=self.progress_var, maximum=1.0, length=360).grid(row=4, column=0, columnspan=3, **pad)
+        self.status_var = StringVar(value="Idle")
+        ttk.Label(self.root, textvariable=self.status_var).grid(row=5, column=0, columnspan=3, sticky="w", **pad)
+
+        actions = ttk.Frame(self.root)
+        actions.grid(row=6, column=0, columnspan=3, pady=12)
+        self.decrypt_btn = ttk.Button(actions, text="Decrypt", command=self.run_decrypt)
+        self.decrypt_btn.pack(side="left", padx=6)
+        self.cancel_btn = ttk.Button(actions, text="Cancel", command=self.cancel, state="disabled")
+        self.cancel_btn.pack(side="left", padx=6)
+
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.worker = None
 
     def choose_file(self):
-        path = filedialog.askopenfilename()
-        if path:
-            self.file_var.set(path)
+        from tkinter import filedialog
+        for path in filedialog.askopenfilenames():
+            self.files.insert("end", path)
+
+    def remove_files(self):
+        for i in reversed(self.files.curselection()):
+            self.files.delete(i)
 
     def choose_key(self):
+        from tkinter import filedialog
         path = filedialog.askopenfilename()
         if path:
             self.key_var.set(path)
@@ -54,41 +346,116 @@ class DecryptorGUI:
         self.root.mainloop()
 
     def run_decrypt(self):
-        file_path = self.file_var.get()
-        if not os.path.isfile(file_path):
-            messagebox.showerror("Error", "Choose a valid encrypted file")
+        from tkinter import messagebox
+        paths = list(self.files.get(0, "end"))
+        if not paths or not all(os.path.isfile(p) for p in paths):
+            messagebox.showerror("Error", "Add one or more valid encrypted files")
             return
         password = self.pass_var.get()
         method = self.method_var.get()
         rsa_key = None
-        if method == "rsa":
+        if method in ("rsa", "auto") and self.key_var.get():
             key_path = self.key_var.get()
             if not os.path.isfile(key_path):
-                messagebox.showerror("Error", "RSA key file required")
+                messagebox.showerror("Error", "RSA key file not found")
                 return
             with open(key_path, "r") as f:
                 rsa_key = f.read()
+        elif method == "rsa":
+            messagebox.showerror("Error", "RSA key file required")
+            return
+
+        self.cancel_event.clear()
+        self.decrypt_btn.configure(state="disabled")
+        self.cancel_btn.configure(state="normal")
+        self.worker = threading.Thread(
+            target=decrypt_queue,
+            args=(paths, password, method, rsa_key, self.events, self.cancel_event),
+            daemon=True,
+        )
+        self.worker.start()
+        self.root.after(self.POLL_MS, self.poll)
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.status_var.set("Cancelling…")
+
+    def poll(self):
+        from tkinter import messagebox
+        finished = None
+        try:
+            while True:
+                kind, *data = self.events.get_nowait()
+                if kind == "start":
+                    path, index, count = data
+                    self.progress_var.set(0)
+                    self.status_var.set(f"[{index}/{count}] {os.path.basename(path)}")
+                elif kind == "progress":
+                    path, done, total, rate = data
+                    self.progress_var.set(done / total if total else 1.0)
+                    self.status_var.set(
+                        f"{os.path.basename(path)}: {done / 1048576:.1f} / "
+                        f"{total / 1048576:.1f} MiB at {rate / 1048576:.1f} MiB/s"
+                    )
+                elif kind == "done":
+                    finished = data
+        except queue.Empty:
+            pass
+
+        if finished is None:
+            self.root.after(self.POLL_MS, self.poll)
+            return
+        ok, failed, cancelled = finished
+        self.decrypt_btn.configure(state="normal")
+        self.cancel_btn.configure(state="disabled")
+        self.progress_var.set(0)
+        self.status_var.set("Cancelled" if cancelled else "Idle")
+        lines = [f"Decrypted {len(ok)} file(s)"] + [f"  {out}" for out in ok]
+        lines += [f"Failed: {os.path.basename(p)}: {err}" for p, err in failed]
+        if failed:
+            messagebox.showerror("Finished with errors", "\n".join(lines))
+        else:
+            messagebox.showinfo("Cancelled" if cancelled else "Success", "\n".join(lines))
 
-        async def task():
-            with open(file_path, "rb") as f:
-                data = f.read()
-            src = BytesIO(data)
-            src.filename = os.path.basename(file_path)
-            try:
-                out = await decrypt_file(
-                    file=src,
-                    password=password,
-                    method=method,
-                    user_level="paid",
-                    rsa_private_key=rsa_key,
-                )
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
-                return
-            messagebox.showinfo("Success", f"Decrypted file saved to {out}")
 
-        asyncio.run(task())
+def decrypt_queue(paths, password, method, rsa_key, events, cancel_event) -> None:
+    """
+    GUI worker: decrypt ``paths`` in order next to their inputs, posting
+    ("start" | "progress" | "done", ...) tuples to ``events``. Setting
+    ``cancel_event`` aborts the current file (its partial output is removed)
+    and skips the rest.
+    """
+    ok, failed = [], []
+    for index, path in enumerate(paths, 1):
+        if cancel_event.is_set():
+            break
+        src = Path(path)
+        out = src.with_name(output_name(src.name))
+        total = src.stat().st_size
+        events.put(("start", path, index, len(paths)))
+        state = {"done": 0, "t0": time.perf_counter(), "last": 0.0}
+
+        def progress(n, path=path, total=total, state=state):
+            if cancel_event.is_set():
+                raise Cancelled()
+            state["done"] += n
+            now = time.perf_counter()
+            if now - state["last"] >= 0.1 or state["done"] >= total:
+                state["last"] = now
+                rate = state["done"] / max(now - state["t0"], 1e-9)
+                events.put(("progress", path, state["done"], total, rate))
+
+        try:
+            decrypt_path(src, out, password, method, rsa_key, progress)
+            ok.append(str(out))
+        except Cancelled:
+            break
+        except Exception as e:
+            failed.append((path, str(e) or type(e).__name__))
+    events.put(("done", ok, failed, cancel_event.is_set()))
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_cli())
     DecryptorGUI().run()
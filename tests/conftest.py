@@ -1,2 +1,25 @@
 import os
 os.environ['DATABASE_URL'] = 'sqlite:///./test.db'
+
+from pathlib import Path
+import pytest
+
+
+@pytest.fixture
+def setup_db(tmp_path, monkeypatch):
+    """
+    A fresh schema with the JSON store and metadata log under ``tmp_path``.
+    """
+    from app.db.session import Base, engine
+    from app import metawriter
+    import app.json_store as json_store
+
+    monkeypatch.setattr(json_store, "STORE_PATH", tmp_path / "file_metadata.jsonl")
+    monkeypatch.setattr(metawriter, "METADATA_LOG_DIR", tmp_path / "metadata_log")
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    yield
+    metawriter.shutdown()
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+    Path(engine.url.database).unlink(missing_ok=True)
@@ -0,0 +1,118 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import admission
+from app.admission import Gate, Overloaded
+
+
+@pytest.mark.asyncio
+async def test_paid_goes_first_and_full_queues_are_refused():
+    gate = Gate(1, {"paid": 2, "account": 2, "guest": 1}, max_wait=5)
+    running = await gate.admit("guest")
+    order = []
+
+    async def wait(tier):
+        ticket = await gate.admit(tier)
+        order.append(tier)
+        ticket.release()
+
+    waiters = [asyncio.create_task(wait(t)) for t in ("guest", "account", "paid")]
+    await asyncio.sleep(0)
+    assert gate.waiting == {"paid": 1, "account": 1, "guest": 1}
+    with pytest.raises(Overloaded) as e:
+        await gate.admit("guest")
+    assert e.value.retry_after >= 1
+
+    running.release()
+    running.release()          # idempotent
+    await asyncio.gather(*waiters)
+    assert order == ["paid", "account", "guest"]
+    assert gate.active == 0
+
+
+@pytest.mark.asyncio
+async def test_wait_times_out_and_cancelled_waiters_free_their_place():
+    gate = Gate(1, {"paid": 4, "account": 4, "guest": 4}, max_wait=0.05)
+    running = await gate.admit("paid")
+    with pytest.raises(Overloaded):
+        await gate.admit("guest")
+
+    gate.max_wait = 5
+    gone = asyncio.create_task(gate.admit("paid"))
+    later = asyncio.create_task(gate.admit("account"))
+    await asyncio.sleep(0)
+    gone.cancel()
+    await asyncio.sleep(0)
+    running.release()
+    ticket = await later
+    assert gate.active == 1 and gate.waiting["paid"] == 0
+    ticket.release()
+    assert gate.active == 0
+
+
+@pytest.mark.asyncio
+async def test_try_admit_never_queues_and_batches_stay_within_the_gate(monkeypatch):
+    from app import batch
+
+    gate = Gate(2, {"paid": 4, "account": 4, "guest": 4}, max_wait=5)
+    request = await gate.admit("paid")
+    extra = gate.try_admit("paid")
+    assert extra is not None and gate.try_admit("paid") is None
+    assert sum(gate.waiting.values()) == 0
+    extra.release()
+    assert Gate(0, {}, 1).try_admit("guest") is not None
+
+    running, peak = 0, 0
+
+    async def sealing(*args):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        yield b"x"
+
+    monkeypatch.setattr(admission, "gate", lambda: gate)
+    monkeypatch.setattr(batch, "encrypt_chunks", sealing)
+    sources = [type("Src", (), {"filename": f"{i}.txt", "size": 1})() for i in range(6)]
+    async for _ in batch.encrypt_batch_zip(sources, "pw", "aes256", "paid"):
+        pass
+    # the request's own slot plus the one free slot, never the full 8
+    assert peak == 2
+    assert gate.active == 1
+    request.release()
+
+
+def test_encrypt_returns_429_when_busy(setup_db, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)
+    client.post('/api/register', data={'email': 'busy@example.com', 'password': 'pw'})
+    r = client.post('/api/token', data={'username': 'busy@example.com', 'password': 'pw'})
+    auth = {'Authorization': f"Bearer {r.json()['access_token']}"}
+
+    full = Gate(1, {"paid": 0, "account": 0, "guest": 0}, max_wait=1)
+    full.active = 1
+    monkeypatch.setattr(admission, "gate", lambda: full)
+    r = client.post('/api/encrypt', headers=auth, files={'file': ('a.txt', b'x')})
+    assert r.status_code == 429
+    assert int(r.headers["retry-after"]) >= 1
+
+    monkeypatch.setattr(admission, "gate", lambda: Gate(1, admission.QUEUE_LIMITS, 1))
+    r = client.post('/api/uploads', headers=auth, data={'filename': 'a.txt', 'total_size': '1'})
+    assert r.status_code == 201
+    upload_id = r.json()["upload_id"]
+    monkeypatch.setattr(admission, "gate", lambda: full)
+    r = client.put(f'/api/uploads/{upload_id}/chunks/0', headers=auth, content=b'x')
+    assert r.status_code == 429
+    assert client.delete(f'/api/uploads/{upload_id}', headers=auth).status_code == 204
+
+    monkeypatch.setattr(admission, "gate", lambda: Gate(1, admission.QUEUE_LIMITS, 1))
+    r = client.post('/api/encrypt', headers=auth, files={'file': ('a.txt', b'x')})
+    assert r.status_code == 200
@@ -0,0 +1,33 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import batch
+
+
+@pytest.mark.asyncio
+async def test_unread_members_stall_the_batch(monkeypatch):
+    started = 0
+
+    async def sealing(*args):
+        nonlocal started
+        started += 1
+        yield b"x" * 10
+
+    monkeypatch.setattr(batch, "BATCH_MAX_BUFFERED", 2)
+    monkeypatch.setattr(batch, "encrypt_chunks", sealing)
+    sources = [type("Src", (), {"filename": f"{i}.txt", "size": 10})() for i in range(20)]
+    pieces = batch.encrypt_batch_zip(sources, "pw", "aes256", "paid")
+
+    await pieces.__anext__()
+    await asyncio.sleep(0.05)
+    # one member written, the next two waiting on the client
+    assert started == 3
+
+    async for _ in pieces:
+        pass
+    assert started == 20
@@ -0,0 +1,22 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks import bench_crypto
+
+
+def test_fast_cases_are_gated_against_a_floor():
+    base = {"tiny": {"latency_ms": 0.02}, "big": {"latency_ms": 40.0}}
+    assert bench_crypto.compare({"tiny": {"latency_ms": 0.2}}, base, 0.25) == []
+    assert bench_crypto.compare({"tiny": {"latency_ms": 1.46}}, base, 0.25) == ["tiny"]
+    assert bench_crypto.compare({"big": {"latency_ms": 50.0}}, base, 0.25) == []
+    assert bench_crypto.compare({"big": {"latency_ms": 60.0}}, base, 0.25) == ["big"]
+
+
+def test_baseline_matches_the_stream_code():
+    saved = json.loads(bench_crypto.BASELINE.read_text())
+    assert saved["sources"] == bench_crypto.sources_digest(), (
+        "stream code changed: python -m benchmarks.bench_crypto --save-baseline"
+    )
@@ -0,0 +1,84 @@
+import io
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import compression
+from app.header import parse_header
+
+TEXT = b'{"layer": 12, "weights": "model.bin", "notes": "repeat me"}\n' * 20000
+
+
+@pytest.mark.parametrize("codec", compression.available())
+def test_stream_roundtrip_per_codec(codec):
+    from app.encryptor import encrypt_stream, fernet_encrypt
+    from app.decryptor import decrypt_stream, fernet_decrypt
+
+    enc = io.BytesIO()
+    encrypt_stream(io.BytesIO(TEXT), enc, "pw", chunk_size=4096, codec=codec)
+    assert parse_header(enc.getvalue())[0].compression == codec
+    if codec != "none":
+        assert len(enc.getvalue()) < len(TEXT) // 5
+
+    out = io.BytesIO()
+    # the header tells decryption which codec to undo
+    assert decrypt_stream(io.BytesIO(enc.getvalue()), out, "pw") == len(TEXT)
+    assert out.getvalue() == TEXT
+    assert fernet_decrypt(fernet_encrypt(TEXT, "pw", codec=codec), "pw") == TEXT
+
+
+def test_incompressible_data_is_stored_as_is():
+    assert compression.choose(os.urandom(64 * 1024), "zlib") == "none"
+    assert compression.choose(TEXT, "zlib") == "zlib"
+    assert compression.choose(TEXT, "none") == "none"
+    with pytest.raises(ValueError):
+        compression.choose(TEXT, "brotli")
+
+
+def test_decompressor_output_is_bounded(monkeypatch):
+    monkeypatch.setattr(compression, "MAX_PIECE", 1000)
+    for codec in ("zlib", "lzma"):
+        bomb = compression.compress_all(codec, b"\0" * 200_000)
+        unpacker = compression.decompressor(codec)
+        pieces = list(unpacker.feed(bomb))
+        unpacker.close()
+        assert max(map(len, pieces)) <= 1000 and sum(map(len, pieces)) == 200_000
+
+    # a stream cut short never passes close()
+    unpacker = compression.decompressor("zlib")
+    list(unpacker.feed(compression.compress_all("zlib", TEXT)[:-10]))
+    with pytest.raises(ValueError):
+        unpacker.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method", ["fernet", "aes256"])
+async def test_inflation_past_the_cap_is_refused(method, monkeypatch):
+    from app import encryptor
+    from app.encryptor import encrypt_stream, fernet_encrypt
+    from app.decryptor import decrypt_any_stream, decrypt_chunks
+
+    class Upload(io.BytesIO):
+        async def read(self, *args):
+            return super().read(*args)
+
+    if method == "fernet":
+        blob = fernet_encrypt(TEXT, "pw", codec="zlib")
+    else:
+        enc = io.BytesIO()
+        encrypt_stream(io.BytesIO(TEXT), enc, "pw", chunk_size=4096, codec="zlib")
+        blob = enc.getvalue()
+
+    assert decrypt_any_stream(io.BytesIO(blob), io.BytesIO(), "pw", max_size=len(TEXT)) == (len(TEXT), method)
+    with pytest.raises(ValueError, match="size limit"):
+        decrypt_any_stream(io.BytesIO(blob), io.BytesIO(), "pw", max_size=len(TEXT) - 1)
+
+    # the API caps inflation at the tier's upload limit
+    monkeypatch.setitem(encryptor.TIER_FILE_SIZE_LIMITS, "account", len(TEXT) // 2)
+    with pytest.raises(ValueError, match="size limit"):
+        async for _ in decrypt_chunks(Upload(blob), "pw", method, "account"):
+            pass
@@ -0,0 +1,113 @@
+import sys
+from pathlib import Path
+import pytest
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.db.session import engine, SessionLocal
+from app.db.models import User, upgrade_schema
+from app.db import crud
+from app import metawriter
+
+
+pytestmark = pytest.mark.usefixtures("setup_db")
+
+
+def _record(user, filename, size, method):
+    metawriter.write_records([crud.file_meta_record(user, filename, size, "h", method)])
+
+
+def test_usage_counter_and_reconcile():
+    with SessionLocal() as db:
+        user = crud.create_user(db, "u@example.com", "x")
+        _record(user, "a", 100, "fernet")
+        _record(user, "b", 50, "aes256")
+        assert crud.sum_user_usage(db, user) == 150
+
+        db.query(User).update({User.bytes_used: 0})
+        db.commit()
+        assert crud.sum_user_usage(db, user) == 0
+        crud.reconcile_usage(db)
+        assert crud.sum_user_usage(db, user) == 150
+
+
+def test_upgrade_schema_adds_missing_columns(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with eng.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR, password_hash VARCHAR,"
+            " license_key VARCHAR, tier VARCHAR, is_active INTEGER, created_at DATETIME)"
+        ))
+        conn.execute(text("INSERT INTO users (email, tier) VALUES ('a', 'guest')"))
+    assert "users.bytes_used" in upgrade_schema(eng)
+    with eng.connect() as conn:
+        assert conn.execute(text("SELECT bytes_used FROM users")).scalar() == 0
+    assert upgrade_schema(eng) == set()
+
+
+def test_list_user_files_keyset_pages():
+    from datetime import datetime, timedelta
+    from app.db.models import FileMeta
+
+    with SessionLocal() as db:
+        user = crud.create_user(db, "p@example.com", "x")
+        for i in range(5):
+            _record(user, f"f{i}", 1, "aes256" if i % 2 else "fernet")
+        # two rows sharing a timestamp must still page without gaps or repeats
+        ts = datetime(2026, 1, 1)
+        db.query(FileMeta).update({FileMeta.timestamp: ts})
+        db.query(FileMeta).filter(FileMeta.filename == "f4").update(
+            {FileMeta.timestamp: ts + timedelta(seconds=1)}
+        )
+        db.commit()
+
+        seen, after = [], None
+        while True:
+            rows, total, after = crud.list_user_files(db, user, 2, after=after)
+            seen += [r.filename for r in rows]
+            assert total == 5
+            if after is None:
+                break
+        assert seen == ["f4", "f3", "f2", "f1", "f0"]
+
+        rows, total, _ = crud.list_user_files(db, user, 10, method="aes256")
+        assert [r.filename for r in rows] == ["f3", "f1"] and total == 2
+
+
+def test_auth_cache_invalidated_on_changes():
+    from app import authcache
+    from app.keycheck import is_valid_key, get_user_tier
+
+    with SessionLocal() as db:
+        user = crud.create_user(db, "c@example.com", "x", tier="account")
+        key = user.license_key
+        assert get_user_tier(key) == "account"
+        hits = authcache.stats()["hits"]
+        assert is_valid_key(key)
+        assert authcache.stats()["hits"] == hits + 1
+
+        crud.set_user_tier(db, user, "paid")
+        assert get_user_tier(key) == "paid"
+
+        crud.deactivate_user(db, user)
+        assert not is_valid_key(key)
+
+
+def test_sqlite_wal_and_concurrent_writes():
+    from concurrent.futures import ThreadPoolExecutor
+
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() > 0
+
+    with SessionLocal() as db:
+        user = crud.create_user(db, "w@example.com", "x")
+
+    def write(i):
+        _record(user, f"f{i}", 1, "fernet")
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(write, range(64)))
+    with SessionLocal() as db:
+        assert crud.sum_user_usage(db, user) == 64
@@ -99,3 +99,234 @@ async def test_encrypt_decrypt_rsa():
 
     os.remove(enc_path)
     os.remove(dec_path)
+
+
+@pytest.mark.parametrize("size", [0, 1, 4096, 4096 * 3, 4096 * 3 + 7])
+def test_stream_roundtrip(size):
+    from app.encryptor import encrypt_stream
+    from app.decryptor import decrypt_stream
+
+    data = os.urandom(size)
+    enc = io.BytesIO()
+    encrypt_stream(io.BytesIO(data), enc, "pw")
+
+    out = io.BytesIO()
+    decrypt_stream(io.BytesIO(enc.getvalue()), out, "pw")
+    assert out.getvalue() == data
+
+
+def test_stream_detects_truncation():
+    from app.encryptor import encrypt_stream, TAG_LEN
+    from app.decryptor import decrypt_stream
+
+    enc = io.BytesIO()
+    encrypt_stream(io.BytesIO(os.urandom(4096 * 3)), enc, "pw")
+    # drop the final segment: what remains ends on a non-final segment
+    truncated = enc.getvalue()[:-(4096 + TAG_LEN)]
+
+    with pytest.raises(ValueError):
+        decrypt_stream(io.BytesIO(truncated), io.BytesIO(), "pw")
+
+
+def test_master_key_derived_once_per_session(monkeypatch):
+    import app.encryptor as enc
+    from app.decryptor import aes256_decrypt, fernet_decrypt
+
+    calls = []
+    real = enc.derive_key
+    monkeypatch.setattr(enc, "derive_key", lambda *a: calls.append(a) or real(*a))
+    enc.forget_master_keys("session-pw")
+
+    blobs = [enc.aes256_encrypt(b"a", "session-pw"), enc.fernet_encrypt(b"b", "session-pw")]
+    assert aes256_decrypt(blobs[0], "session-pw") == b"a"
+    assert fernet_decrypt(blobs[1], "session-pw") == b"b"
+    assert len(calls) == 1
+    # per-file salts still differ
+    from app.header import parse_header
+    salts = [parse_header(b)[0].salt for b in blobs]
+    assert salts[0][:16] == salts[1][:16] and salts[0][16:] != salts[1][16:]
+
+    enc.forget_master_keys("session-pw")
+    assert aes256_decrypt(blobs[0], "session-pw") == b"a"
+    assert len(calls) == 2
+
+
+def test_rsa_hybrid_large_payload():
+    from app.encryptor import rsa_encrypt, load_public_key
+    from app.decryptor import rsa_decrypt, load_private_key
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    priv_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    ).decode()
+    pub_pem = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+
+    # far beyond the ~190 bytes plain RSA-OAEP can take
+    data = os.urandom(3 * 1024 * 1024 + 5)
+    assert rsa_decrypt(rsa_encrypt(data, pub_pem), priv_pem) == data
+    # parsed keys are reused across calls
+    assert load_public_key(pub_pem) is load_public_key(pub_pem)
+    assert load_private_key(priv_pem) is load_private_key(priv_pem)
+
+
+def test_header_roundtrip_and_tamper():
+    from app.encryptor import aes256_encrypt
+    from app.decryptor import aes256_decrypt
+    from app.header import Header, parse_header
+
+    h = Header("rsa", 4096, wrapped_key=b"k" * 256)
+    assert parse_header(h.pack() + b"body") == (h, len(h.pack()))
+
+    blob = aes256_encrypt(b"payload", "pw")
+    header, n = parse_header(blob)
+    assert header.method == "aes256" and header.kdf == "pbkdf2-sha256"
+    # any header edit changes the derived key, e.g. a different chunk size
+    forged = Header(**{**header.__dict__, "chunk_size": header.chunk_size // 2}).pack()
+    with pytest.raises(ValueError):
+        aes256_decrypt(forged + blob[n:], "pw")
+
+
+# ciphertexts written by the baseline (pre-segmenting) encryptor
+BASELINE = Path(__file__).parent / "fixtures" / "baseline"
+BASELINE_KEY = "baseline-key"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method", ["fernet", "aes256", "rsa"])
+async def test_baseline_ciphertexts_still_decrypt(method):
+    from app import decryptor
+    from app.decryptor import decrypt_any_stream
+
+    blob = (BASELINE / f"{method}.bin").read_bytes()
+    plain = (BASELINE / "plain.txt").read_bytes()
+    pem = (BASELINE / "rsa_key.pem").read_text()
+    secret = {"password": BASELINE_KEY} if method != "rsa" else {"rsa_private_key": pem}
+
+    assert getattr(decryptor, f"{method}_decrypt")(blob, *secret.values()) == plain
+    out = io.BytesIO()
+    assert decrypt_any_stream(io.BytesIO(blob), out, method=method, **secret) == (len(plain), method)
+    assert out.getvalue() == plain
+
+    src = AsyncBytesIO(blob)
+    src.filename = "old.bin"
+    path = await decrypt_file(src, BASELINE_KEY, method, "paid", pem)
+    assert Path(path).read_bytes() == plain
+    os.remove(path)
+
+    tampered = blob[:-1] + bytes([blob[-1] ^ 1])
+    with pytest.raises(ValueError):
+        decrypt_any_stream(io.BytesIO(tampered), io.BytesIO(), method=method, **secret)
+
+
+def test_header_kdf_params_win_over_config(monkeypatch):
+    import app.encryptor as enc
+    from app.decryptor import decrypt_any_stream
+
+    monkeypatch.setattr(enc, "PBKDF2_ITERS", 1000)
+    blob = enc.aes256_encrypt(b"cheap", "iters-pw")
+    monkeypatch.setattr(enc, "PBKDF2_ITERS", 2000)
+    enc.forget_master_keys("iters-pw")
+
+    out = io.BytesIO()
+    # the header names the cipher, so a wrong ``method`` is ignored
+    assert decrypt_any_stream(io.BytesIO(blob), out, password="iters-pw", method="fernet") == (5, "aes256")
+    assert out.getvalue() == b"cheap"
+
+
+def test_range_decrypt_reads_only_covering_segments():
+    from app.encryptor import encrypt_stream
+    from app.decryptor import decrypt_range, parse_byte_range
+
+    class CountingReader(io.BytesIO):
+        consumed = 0
+
+        def read(self, *args):
+            data = super().read(*args)
+            self.consumed += len(data)
+            return data
+
+    data = os.urandom(50 * 4096 + 7)
+    enc = io.BytesIO()
+    encrypt_stream(io.BytesIO(data), enc, "pw", chunk_size=4096, codec="none")
+
+    src, out = CountingReader(enc.getvalue()), io.BytesIO()
+    start, stop = parse_byte_range("10000-12287", len(data))
+    assert decrypt_range(src, out, start, stop, password="pw") == 2288
+    assert out.getvalue() == data[10000:12288]
+    assert src.consumed < 3 * 4200
+
+    # the tail of the file authenticates as the final segment
+    start, stop = parse_byte_range("-5", len(data))
+    out = io.BytesIO()
+    decrypt_range(io.BytesIO(enc.getvalue()), out, start, stop, password="pw")
+    assert out.getvalue() == data[-5:]
+
+    with pytest.raises(ValueError):
+        parse_byte_range(f"{len(data)}-", len(data))
+    compressed = io.BytesIO()
+    encrypt_stream(io.BytesIO(b"a" * 10000), compressed, "pw", codec="zlib")
+    with pytest.raises(ValueError):
+        decrypt_range(io.BytesIO(compressed.getvalue()), io.BytesIO(), 0, 10, password="pw")
+
+
+@pytest.mark.parametrize("size", [0, 4096, 4096 * 3 + 7])
+def test_buffer_and_mmap_inputs(tmp_path, size):
+    import mmap
+    from app.encryptor import BufferReader, aes256_encrypt, encrypt_stream
+    from app.decryptor import aes256_decrypt, decrypt_stream
+
+    class Trickle(io.BytesIO):
+        # a pipe-like source that never fills a whole chunk per read
+        def readinto(self, b):
+            return super().readinto(memoryview(b)[:1000])
+
+    data = os.urandom(size)
+    sealed = aes256_encrypt(memoryview(bytearray(data)), "pw")
+    assert aes256_decrypt(memoryview(sealed), "pw") == data
+
+    enc = io.BytesIO()
+    encrypt_stream(Trickle(data), enc, "pw", chunk_size=4096, codec="none")
+    path = tmp_path / "sealed.bin"
+    path.write_bytes(enc.getvalue())
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        src, out = BufferReader(mm), io.BytesIO()
+        assert decrypt_stream(src, out, "pw") == size
+        src.close()
+    assert out.getvalue() == data
+
+    tampered = bytearray(enc.getvalue())
+    tampered[-1] ^= 1
+    out = io.BytesIO()
+    with pytest.raises(ValueError):
+        decrypt_stream(BufferReader(tampered), out, "pw")
+    # nothing from the forged final segment was released
+    assert len(out.getvalue()) == max(0, (size - 1) // 4096) * 4096
+
+
+@pytest.mark.parametrize("size", [1024, 300 * 1024, 3 * 256 * 1024])
+def test_record_buffers_grow_only_as_needed(size):
+    import tracemalloc
+    from app.encryptor import RECORD_BUF_MIN, iter_records
+
+    class Trickle(io.BytesIO):
+        def readinto(self, b):
+            return super().readinto(memoryview(b)[:40_000])
+
+    data = os.urandom(size)
+    tracemalloc.start()
+    try:
+        records = [(bytes(r), last) for r, last in iter_records(Trickle(data), 256 * 1024)]
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert b"".join(r for r, _ in records) == data
+    assert [last for _, last in records] == [False] * (len(records) - 1) + [True]
+    assert all(len(r) == 256 * 1024 for r, _ in records[:-1])
+    if size < RECORD_BUF_MIN:
+        # a small input never pays for a full record buffer
+        assert peak < 2 * RECORD_BUF_MIN + 2 * size + 16 * 1024
@@ -0,0 +1,326 @@
+import hashlib
+import io
+import json
+import os
+import zipfile
+import sys
+from pathlib import Path
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.main import app
+from app.db.session import SessionLocal
+from app.db.models import FileMeta
+from app import metawriter
+
+client = TestClient(app)
+
+
+pytestmark = pytest.mark.usefixtures("setup_db")
+
+
+@pytest.fixture
+def auth():
+    client.post('/api/register', data={'email': 'enc@example.com', 'password': 'pw'})
+    r = client.post('/api/token', data={'username': 'enc@example.com', 'password': 'pw'})
+    return {'Authorization': f"Bearer {r.json()['access_token']}"}
+
+
+@pytest.mark.parametrize("method", ["fernet", "aes256"])
+def test_encrypt_then_decrypt(auth, method):
+    data = b"payload " * 5000
+    r = client.post('/api/encrypt', headers=auth,
+                    files={'file': ('a.txt', data)}, data={'method': method})
+    assert r.status_code == 200
+    ciphertext = r.content
+
+    metawriter.flush()
+    with SessionLocal() as db:
+        meta = db.query(FileMeta).one()
+    # hash and size recorded in the same pass that produced the output
+    assert meta.file_size == len(ciphertext)
+    assert meta.content_hash == hashlib.sha256(ciphertext).hexdigest()
+
+    r = client.post('/api/decrypt', headers=auth,
+                    files={'file': ('a.txt.enc', ciphertext)}, data={'method': method})
+    assert r.status_code == 200
+    assert r.content == data
+
+
+def test_encrypt_cap_enforced(auth, monkeypatch):
+    import app.api as api
+    monkeypatch.setitem(api.PER_FILE_CAP, "account", 1024)
+    r = client.post('/api/encrypt', headers=auth,
+                    files={'file': ('big.bin', b"x" * 4096)}, data={'method': 'aes256'})
+    assert r.status_code == 403
+    with SessionLocal() as db:
+        assert db.query(FileMeta).count() == 0
+
+
+@pytest.mark.parametrize("method", ["fernet", "aes256"])
+def test_stream_output_mode(auth, method, monkeypatch):
+    import app.api as api
+    monkeypatch.setattr(api, "OUTPUT_MODE", "stream")
+    data = os.urandom(3 * 1024 * 1024 + 11)
+
+    r = client.post('/api/encrypt', headers=auth,
+                    files={'file': ('a.bin', data)}, data={'method': method})
+    assert r.status_code == 200
+    assert int(r.headers['content-length']) == len(r.content)
+    ciphertext = r.content
+
+    r = client.post('/api/decrypt', headers=auth,
+                    files={'file': ('a.bin.enc', ciphertext)}, data={'method': method})
+    assert r.status_code == 200
+    assert int(r.headers['content-length']) == len(data)
+    assert r.content == data
+
+    metawriter.flush()
+    with SessionLocal() as db:
+        sizes = sorted(m.file_size for m in db.query(FileMeta))
+    assert sizes == sorted([len(ciphertext), len(data)])
+    assert not list(Path("temp_files").glob("*a.bin*"))
+
+
+def test_dashboard_pagination(auth):
+    for i in range(3):
+        client.post('/api/encrypt', headers=auth,
+                    files={'file': (f'{i}.txt', b'x')}, data={'method': 'fernet'})
+    page = client.get('/api/dashboard', headers=auth, params={'limit': 2}).json()
+    assert page['total'] == 3 and len(page['files']) == 2
+    rest = client.get('/api/dashboard', headers=auth,
+                      params={'limit': 2, 'after': page['next_cursor']}).json()
+    assert len(rest['files']) == 1 and rest['next_cursor'] is None
+    assert client.get('/api/dashboard', headers=auth, params={'after': 'bogus'}).status_code == 400
+
+
+def test_encrypt_batch(auth):
+    from app.db.models import User
+    from app.decryptor import aes256_decrypt
+
+    payloads = {f"f{i}.bin": os.urandom(1024 * (i + 1)) for i in range(4)}
+    r = client.post('/api/encrypt/batch', headers=auth, data={'method': 'aes256'},
+                    files=[('files', (n, d)) for n, d in payloads.items()])
+    assert r.status_code == 200
+    out = zipfile.ZipFile(io.BytesIO(r.content))
+    manifest = json.loads(out.read('manifest.json'))
+    assert sorted(m['file'] for m in manifest) == sorted(payloads)
+    for m in manifest:
+        ciphertext = out.read(m['entry'])
+        assert hashlib.sha256(ciphertext).hexdigest() == m['sha256']
+        with SessionLocal() as db:
+            key = db.query(User).one().license_key
+        assert aes256_decrypt(ciphertext, key) == payloads[m['file']]
+
+    metawriter.flush()
+    with SessionLocal() as db:
+        assert db.query(FileMeta).count() == 4
+        user = db.query(User).one()
+        assert user.file_count == 4
+        assert user.bytes_used == sum(m['size'] for m in manifest)
+
+    # one zip upload is expanded into its members
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('docs/a.txt', b"a" * 5000)
+        z.writestr('b.txt', b"b" * 10)
+    r = client.post('/api/encrypt/batch', headers=auth, data={'method': 'fernet'},
+                    files={'files': ('bundle.zip', buf.getvalue())})
+    assert r.status_code == 200
+    names = zipfile.ZipFile(io.BytesIO(r.content)).namelist()
+    assert sorted(names) == ['b.txt.enc', 'docs/a.txt.enc', 'manifest.json']
+
+
+def test_encrypt_batch_total_cap(auth, monkeypatch):
+    import app.api as api
+    monkeypatch.setitem(api.PER_FILE_CAP, "account", 1024)
+    r = client.post('/api/encrypt/batch', headers=auth, data={'method': 'aes256'},
+                    files=[('files', ('a', b"x" * 100)), ('files', ('b', b"x" * 4096))])
+    assert r.status_code == 200
+    manifest = json.loads(zipfile.ZipFile(io.BytesIO(r.content)).read('manifest.json'))
+    assert {m['file']: 'error' in m for m in manifest} == {'a': False, 'b': True}
+    metawriter.flush()
+    with SessionLocal() as db:
+        assert db.query(FileMeta).count() == 1
+
+
+def _wait_for(job_id, headers):
+    import time
+    for _ in range(200):
+        status = client.get(f'/api/jobs/{job_id}', headers=headers).json()
+        if status['status'] in ('done', 'failed'):
+            return status
+        time.sleep(0.05)
+    raise AssertionError("job did not finish")
+
+
+def test_job_roundtrip(auth):
+    data = os.urandom(2 * 1024 * 1024 + 5)
+    r = client.post('/api/jobs', headers=auth, data={'method': 'aes256'},
+                    files={'file': ('big.bin', data)})
+    assert r.status_code == 200
+    status = _wait_for(r.json()['job_id'], auth)
+    assert status['status'] == 'done'
+    assert status['bytes_done'] == status['bytes_total'] == len(data)
+    ciphertext = client.get(f"/api/jobs/{status['job_id']}/result", headers=auth).content
+    assert hashlib.sha256(ciphertext).hexdigest() == status['sha256']
+
+    r = client.post('/api/jobs', headers=auth, data={'op': 'decrypt', 'method': 'aes256'},
+                    files={'file': ('big.bin.enc', ciphertext)})
+    status = _wait_for(r.json()['job_id'], auth)
+    assert client.get(f"/api/jobs/{status['job_id']}/result", headers=auth).content == data
+    metawriter.flush()
+    with SessionLocal() as db:
+        assert db.query(FileMeta).count() == 2
+
+
+def test_job_failure_and_expiry(auth, monkeypatch):
+    import time
+    from app import jobs
+    r = client.post('/api/jobs', headers=auth, data={'op': 'decrypt', 'method': 'aes256'},
+                    files={'file': ('junk.enc', b"not a ciphertext" * 10)})
+    status = _wait_for(r.json()['job_id'], auth)
+    assert status['status'] == 'failed'
+    assert client.get(f"/api/jobs/{status['job_id']}/result", headers=auth).status_code == 400
+
+    assert jobs.sweep(time.time() + jobs.JOB_RESULT_TTL + 1) >= 1
+    assert client.get(f"/api/jobs/{status['job_id']}", headers=auth).status_code == 404
+
+
+def test_metrics_endpoint(auth):
+    client.post('/api/encrypt', headers=auth,
+                files={'file': ('a.txt', b"x" * 1000)}, data={'method': 'aes256'})
+    metawriter.flush()
+    r = client.get('/metrics')
+    assert r.status_code == 200
+    assert 'enclypt_stage_seconds_count{op="encrypt",stage="kdf",method="aes256"}' in r.text
+    assert 'enclypt_stage_seconds_count{op="metadata",stage="db_commit",method="batch"}' in r.text
+    assert 'enclypt_bytes_in_total{op="encrypt",method="aes256",tier="account"}' in r.text
+    assert 'enclypt_cache_hits_total{cache="auth"}' in r.text
+
+
+def test_compressed_stream_output_mode(auth, monkeypatch):
+    import app.api as api
+    import app.compression as compression
+    monkeypatch.setattr(api, "OUTPUT_MODE", "stream")
+    monkeypatch.setattr(compression, "COMPRESSION", "zlib")
+    data = b"compress me please " * 200_000
+
+    r = client.post('/api/encrypt', headers=auth,
+                    files={'file': ('a.txt', data)}, data={'method': 'aes256'})
+    assert r.status_code == 200
+    # the compressed size is not known up front
+    assert 'content-length' not in r.headers
+    assert len(r.content) < len(data) // 10
+
+    r = client.post('/api/decrypt', headers=auth,
+                    files={'file': ('a.txt.enc', r.content)}, data={'method': 'aes256'})
+    assert r.status_code == 200
+    assert 'content-length' not in r.headers
+    assert r.content == data
+
+
+def test_resumable_upload_roundtrip(auth):
+    import app.uploads as uploads
+    from app.encryptor import CHUNK_SIZE
+    data = os.urandom(2 * CHUNK_SIZE + 123)
+    chunks = [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+
+    r = client.post('/api/uploads', headers=auth,
+                    data={'filename': 'big.bin', 'total_size': len(data), 'method': 'aes256'})
+    assert r.status_code == 201
+    up = r.json()
+    assert up['chunks'] == 3 and up['next_index'] == 0
+    url = f"/api/uploads/{up['upload_id']}"
+
+    assert client.put(f"{url}/chunks/0", headers=auth, content=chunks[0]).json()['next_index'] == 1
+    # a blind retry is harmless, gaps and bad sizes are refused
+    assert client.put(f"{url}/chunks/0", headers=auth, content=chunks[0]).status_code == 200
+    assert client.put(f"{url}/chunks/2", headers=auth, content=chunks[2]).status_code == 409
+    assert client.put(f"{url}/chunks/1", headers=auth, content=b"short").status_code == 400
+    assert client.post(f"{url}/finalize", headers=auth).status_code == 409
+
+    # the key and running hash are rebuilt from the partial output after a restart
+    uploads._live.clear()
+    client.put(f"{url}/chunks/1", headers=auth, content=chunks[1])
+    status = client.put(f"{url}/chunks/2", headers=auth, content=chunks[2]).json()
+    assert status['complete'] and status['bytes_received'] == len(data)
+    assert client.get(url, headers=auth).json()['next_index'] == 3
+
+    r = client.post(f"{url}/finalize", headers=auth)
+    assert r.status_code == 200
+    ciphertext = r.content
+    metawriter.flush()
+    with SessionLocal() as db:
+        meta = db.query(FileMeta).one()
+    assert meta.file_size == len(ciphertext)
+    assert meta.content_hash == hashlib.sha256(ciphertext).hexdigest()
+    assert client.get(url, headers=auth).status_code == 404
+
+    r = client.post('/api/decrypt', headers=auth,
+                    files={'file': ('big.bin.enc', ciphertext)}, data={'method': 'aes256'})
+    assert r.content == data
+
+
+def test_resumable_upload_expires(auth):
+    from datetime import datetime, timedelta
+    import app.uploads as uploads
+    r = client.post('/api/uploads', headers=auth,
+                    data={'filename': 'a.bin', 'total_size': 10, 'method': 'aes256'})
+    up = r.json()
+    with SessionLocal() as db:
+        path = Path(db.get(uploads.UploadSession, up['upload_id']).path)
+        assert path.exists()
+        assert uploads.sweep(db, datetime.utcnow() + timedelta(seconds=uploads.UPLOAD_SESSION_TTL + 1)) == 1
+    assert not path.exists()
+    assert client.get(f"/api/uploads/{up['upload_id']}", headers=auth).status_code == 404
+
+
+def test_decrypt_range_header(auth):
+    data = os.urandom(3 * 1024 * 1024 + 11)
+    ciphertext = client.post('/api/encrypt', headers=auth,
+                             files={'file': ('r.bin', data)}, data={'method': 'aes256'}).content
+
+    r = client.post('/api/decrypt', headers={**auth, 'Range': 'bytes=1048570-1048600'},
+                    files={'file': ('r.bin.enc', ciphertext)}, data={'method': 'aes256'})
+    assert r.status_code == 206
+    assert r.headers['content-range'] == f"bytes 1048570-1048600/{len(data)}"
+    assert r.content == data[1048570:1048601]
+
+    # an open-ended range streams every segment from the start
+    r = client.post('/api/decrypt', headers={**auth, 'Range': 'bytes=0-'},
+                    files={'file': ('r.bin.enc', ciphertext)}, data={'method': 'aes256'})
+    assert r.status_code == 206
+    assert int(r.headers['content-length']) == len(data)
+    assert r.content == data
+
+    r = client.post('/api/decrypt', headers={**auth, 'Range': f'bytes={len(data)}-'},
+                    files={'file': ('r.bin.enc', ciphertext)}, data={'method': 'aes256'})
+    assert r.status_code == 416
+    assert r.headers['content-range'] == f"bytes */{len(data)}"
+
+    # fernet has no segments: it is decrypted whole, then the slice is served
+    token = client.post('/api/encrypt', headers=auth,
+                        files={'file': ('f.bin', b"fernet")}, data={'method': 'fernet'}).content
+    r = client.post('/api/decrypt', headers={**auth, 'Range': 'bytes=0-1'},
+                    files={'file': ('f.bin.enc', token)}, data={'method': 'fernet'})
+    assert r.content == b"fe"
+
+
+@pytest.mark.parametrize("mode", ["file", "stream"])
+def test_decrypt_refuses_header_cipher_above_tier(auth, mode, monkeypatch):
+    import app.api as api
+    from app.encryptor import rsa_encrypt
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    monkeypatch.setattr(api, "OUTPUT_MODE", mode)
+    pub = rsa.generate_private_key(public_exponent=65537, key_size=2048).public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+    # an account user claims aes256, but the header says rsa
+    r = client.post('/api/decrypt', headers=auth,
+                    files={'file': ('x.enc', rsa_encrypt(b"paid only", pub))}, data={'method': 'aes256'})
+    assert r.status_code == 403
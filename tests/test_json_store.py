@@ -0,0 +1,55 @@
+import json
+import sys
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import app.json_store as store
+
+
+@pytest.fixture(autouse=True)
+def store_path(tmp_path, monkeypatch):
+    path = tmp_path / "file_metadata.jsonl"
+    monkeypatch.setattr(store, "STORE_PATH", path)
+    return path
+
+
+def test_append_and_lookup(store_path):
+    store.add_entry("k1", "a.txt", 10, "fernet")
+    store.add_entry("k2", "b.txt", 20, "aes256")
+    store.add_entry("k1", "c.txt", 30, "aes256")
+
+    assert [e["filename"] for e in store.get_entries("k1")] == ["a.txt", "c.txt"]
+    assert [e["filename"] for e in store.get_entries("k2")] == ["b.txt"]
+    assert store.get_entries("missing") == []
+    assert len(store_path.read_text().splitlines()) == 3
+
+
+def test_picks_up_lines_from_other_writers(store_path):
+    store.add_entry("k1", "a.txt", 10, "fernet")
+    with store_path.open("a") as f:
+        f.write(json.dumps({"license_key": "k1", "filename": "b.txt"}) + "\n")
+        f.write("{torn")
+    assert [e["filename"] for e in store.get_entries("k1")] == ["a.txt", "b.txt"]
+
+
+def test_compaction_keeps_newest_per_key(store_path, monkeypatch):
+    monkeypatch.setattr(store, "MAX_PER_KEY", 2)
+    for i in range(3):
+        store.add_entry("k1", f"{i}.txt", i, "fernet")
+        store.add_entry("k2", f"{i}.bin", i, "fernet")
+    store.compact()
+
+    assert [e["filename"] for e in store.get_entries("k1")] == ["1.txt", "2.txt"]
+    assert [e["filename"] for e in store.get_entries("k2")] == ["1.bin", "2.bin"]
+    store.add_entry("k1", "3.txt", 3, "fernet")
+    assert store.get_entries("k1")[-1]["filename"] == "3.txt"
+
+
+def test_migrates_legacy_json(store_path):
+    legacy = store_path.with_suffix(".json")
+    legacy.write_text(json.dumps([{"license_key": "k1", "filename": "old.txt"}]))
+    store.add_entry("k1", "new.txt", 1, "fernet")
+    assert [e["filename"] for e in store.get_entries("k1")] == ["old.txt", "new.txt"]
+    assert not legacy.exists()
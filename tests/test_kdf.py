@@ -0,0 +1,65 @@
+import io
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import kdf
+
+
+@pytest.mark.parametrize("name", sorted(kdf.KDFS))
+def test_params_roundtrip(name):
+    k = kdf.get(name)
+    assert kdf.unpack_params(name, kdf.pack_params(name, k.defaults)) == k.defaults
+    assert len(kdf.derive(name, "pw", b"s" * 16, k.floor)) == kdf.KEY_LEN
+
+
+def test_forged_params_are_rejected(monkeypatch):
+    monkeypatch.setattr(kdf, "KDF_MAX_MEMORY", 64 * 1024 * 1024)
+    with pytest.raises(ValueError):
+        kdf.unpack_params("scrypt", kdf.pack_params("scrypt", {"log2_n": 24, "r": 8, "p": 1}))
+    with pytest.raises(ValueError):
+        kdf.unpack_params("pbkdf2-sha256", b"\x00\x00\x00\x00")
+    with pytest.raises(ValueError):
+        kdf.unpack_params("pbkdf2-sha256", (kdf.KDF_MAX_PBKDF2_ITERS + 1).to_bytes(4, "big"))
+    assert kdf.get("pbkdf2-sha256").scale({"iterations": 200_000}, 1e6) == {"iterations": kdf.KDF_MAX_PBKDF2_ITERS}
+    with pytest.raises(ValueError):
+        kdf.unpack_params("pbkdf2-sha256", b"\x01")
+    with pytest.raises(ValueError):
+        kdf.get("md5")
+
+
+def test_calibration_file_drives_new_ciphertexts(tmp_path, monkeypatch):
+    import app.encryptor as enc
+    from app.decryptor import decrypt_any_stream
+    from app.header import parse_header
+
+    monkeypatch.setattr(kdf.Pbkdf2, "floor", {"iterations": 1000})
+    result = kdf.calibrate_tiers("pbkdf2-sha256", {"paid": 5}, samples=1)
+    assert result["tiers"]["paid"]["params"]["iterations"] >= 1000
+
+    path = tmp_path / "kdf_params.json"
+    result["tiers"]["paid"] = {"kdf": "scrypt", "params": {"log2_n": 10, "r": 8, "p": 1}}
+    path.write_text(json.dumps(result))
+    monkeypatch.setattr(kdf, "KDF_PARAMS_FILE", str(path))
+    kdf.reload_tier_params()
+    try:
+        out = io.BytesIO()
+        enc.encrypt_stream(io.BytesIO(b"tiered"), out, "kdf-pw", tier="paid")
+        blob = out.getvalue()
+        header, _ = parse_header(blob)
+        assert header.kdf == "scrypt"
+        # untiered callers keep the default KDF
+        assert parse_header(enc.fernet_encrypt(b"x", "kdf-pw"))[0].kdf == kdf.KDF_NAME
+    finally:
+        monkeypatch.setattr(kdf, "KDF_PARAMS_FILE", str(tmp_path / "missing.json"))
+        kdf.reload_tier_params()
+
+    # decryption only needs the header, not the calibration file
+    enc.forget_master_keys("kdf-pw")
+    out = io.BytesIO()
+    assert decrypt_any_stream(io.BytesIO(blob), out, password="kdf-pw") == (6, "aes256")
+    assert out.getvalue() == b"tiered"
@@ -0,0 +1,90 @@
+import sys
+import time
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.db.session import SessionLocal
+from app.db.models import FileMeta
+from app.db import crud
+from app import metawriter
+import app.json_store as json_store
+
+
+pytestmark = pytest.mark.usefixtures("setup_db")
+
+
+def _count():
+    with SessionLocal() as db:
+        return db.query(FileMeta).count()
+
+
+def test_queued_records_count_towards_quota_and_flush_in_batches(monkeypatch):
+    monkeypatch.setattr(metawriter, "METADATA_FLUSH_MS", 60_000)
+    with SessionLocal() as db:
+        user = crud.create_user(db, "q@example.com", "x")
+        for i in range(10):
+            crud.queue_file_meta(user, f"f{i}", 100, "h", "aes256")
+        # nothing committed yet, but the quota already sees it
+        assert _count() == 0
+        assert crud.sum_user_usage(db, user) == 1000
+        assert list(metawriter.METADATA_LOG_DIR.glob("*.log"))
+
+        assert metawriter.flush() == 10
+        assert _count() == 10
+        assert crud.sum_user_usage(db, user) == 1000
+        assert not list(metawriter.METADATA_LOG_DIR.glob("*.log"))
+    assert len(json_store.get_entries(user.license_key)) == 10
+
+
+def test_batch_size_triggers_background_flush():
+    with SessionLocal() as db:
+        user = crud.create_user(db, "b@example.com", "x")
+    writer = metawriter.MetaWriter(metawriter.METADATA_LOG_DIR, batch_size=4, flush_ms=60_000)
+    try:
+        for i in range(4):
+            writer.enqueue({
+                "record_id": f"r{i}", "user_id": user.id, "license_key": user.license_key,
+                "filename": f"f{i}", "file_size": 1, "content_hash": "h",
+                "method": "fernet", "timestamp": "2026-01-01T00:00:00",
+            })
+        for _ in range(200):
+            if _count() == 4:
+                break
+            time.sleep(0.01)
+        assert _count() == 4
+    finally:
+        writer.close()
+
+
+def test_replay_inserts_what_a_crashed_writer_left(monkeypatch):
+    monkeypatch.setattr(metawriter, "METADATA_FLUSH_MS", 60_000)
+    with SessionLocal() as db:
+        user = crud.create_user(db, "r@example.com", "x")
+    for i in range(3):
+        crud.queue_file_meta(user, f"f{i}", 10, "h", "fernet")
+    writer = metawriter.get_writer()
+    # a live writer's log is left alone
+    assert metawriter.replay() == 0
+
+    # crash: the process dies with the records only in its log
+    writer._log.f.write(b'{"torn')
+    writer._log.f.close()
+    writer._pending.clear()
+    writer.close()
+    metawriter._writer = None
+    assert metawriter.replay() == 3
+    assert metawriter.replay() == 0
+    with SessionLocal() as db:
+        assert crud.sum_user_usage(db, user) == 30
+
+    # a batch that committed before the crash is not inserted twice
+    rec = {
+        "record_id": "dup", "user_id": user.id, "license_key": user.license_key,
+        "filename": "d", "file_size": 5, "content_hash": "h",
+        "method": "fernet", "timestamp": "2026-01-01T00:00:00",
+    }
+    assert metawriter.write_records([rec]) == 1
+    assert metawriter.write_records([rec]) == 0
+    assert _count() == 4
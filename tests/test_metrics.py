@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import metrics
+from app.cache import TTLCache
+
+
+def test_histogram_and_counter_render():
+    c = metrics.Counter("t_ops_total", "ops", ("method",))
+    h = metrics.Histogram("t_seconds", "secs", ("stage",), buckets=(0.1, 1.0))
+    try:
+        c.inc(method="aes256")
+        c.inc(2, method="aes256")
+        h.observe(0.05, stage="kdf")
+        h.observe(0.5, stage="kdf")
+        h.observe(5, stage="kdf")
+        text = metrics.render()
+    finally:
+        metrics._registry.remove(c)
+        metrics._registry.remove(h)
+    assert 't_ops_total{method="aes256"} 3' in text
+    assert 't_seconds_bucket{stage="kdf",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="kdf",le="1.0"} 2' in text
+    assert 't_seconds_bucket{stage="kdf",le="+Inf"} 3' in text
+    assert 't_seconds_count{stage="kdf"} 3' in text
+
+
+def test_stage_timer_records_once():
+    timer = metrics.StageTimer("encrypt", "tmethod", "paid")
+    with timer.stage("cipher"):
+        pass
+    timer.bytes_in, timer.ok = 10, True
+    timer.record()
+    timer.record()
+    assert metrics.BYTES_IN.value(op="encrypt", method="tmethod", tier="paid") == 10
+    assert metrics.OPERATIONS.value(op="encrypt", method="tmethod", tier="paid", outcome="ok") == 1
+
+
+def test_cache_stats_exported():
+    cache = TTLCache(4, 60)
+    metrics.watch_cache("t_cache", cache)
+    try:
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+        text = metrics.render()
+    finally:
+        metrics._caches.pop("t_cache")
+    assert 'enclypt_cache_hits_total{cache="t_cache"} 1' in text
+    assert 'enclypt_cache_misses_total{cache="t_cache"} 1' in text
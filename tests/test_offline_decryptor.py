@@ -0,0 +1,128 @@
+import os
+import sys
+from pathlib import Path
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives import serialization
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import offline_decryptor
+from app.encryptor import aes256_encrypt, fernet_encrypt, rsa_encrypt
+
+KEY = "offline-key"
+
+
+def _rsa_pems():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    priv_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    ).decode()
+    pub_pem = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+    return pub_pem, priv_pem
+
+
+def test_cli_decrypts_tree_with_auto_method(tmp_path, capsys):
+    pub_pem, priv_pem = _rsa_pems()
+    (tmp_path / "key.pem").write_text(priv_pem)
+    src = tmp_path / "archive"
+    (src / "sub").mkdir(parents=True)
+    plain = {
+        "a.bin": os.urandom(2 * 1024 * 1024 + 3),
+        "sub/b.txt": b"fernet payload",
+        "sub/c.bin": os.urandom(5000),
+    }
+    (src / "encrypted_a.bin").write_bytes(aes256_encrypt(plain["a.bin"], KEY))
+    (src / "sub" / "b.txt.enc").write_bytes(fernet_encrypt(plain["sub/b.txt"], KEY))
+    (src / "sub" / "encrypted_c.bin").write_bytes(rsa_encrypt(plain["sub/c.bin"], pub_pem))
+
+    out = tmp_path / "out"
+    rc = offline_decryptor.run_cli([
+        str(src), "-o", str(out), "-p", KEY, "--auto-method",
+        "-k", str(tmp_path / "key.pem"), "-j", "2",
+    ])
+    assert rc == 0
+    for name, data in plain.items():
+        assert (out / name).read_bytes() == data
+    assert "3 decrypted, 0 failed" in capsys.readouterr().out
+
+
+def test_auto_method_reads_baseline_files(tmp_path, capsys):
+    import shutil
+
+    fixtures = Path(__file__).parent / "fixtures" / "baseline"
+    for method in ("fernet", "aes256", "rsa"):
+        shutil.copy(fixtures / f"{method}.bin", tmp_path / f"{method}.enc")
+    out = tmp_path / "out"
+    rc = offline_decryptor.run_cli([
+        str(tmp_path / "*.enc"), "-o", str(out), "-p", "baseline-key", "--auto-method",
+        "-k", str(fixtures / "rsa_key.pem"), "-j", "1",
+    ])
+    assert rc == 0
+    for method in ("fernet", "aes256", "rsa"):
+        assert (out / method).read_bytes() == (fixtures / "plain.txt").read_bytes()
+    assert "3 decrypted, 0 failed" in capsys.readouterr().out
+
+
+def test_cli_failure_leaves_no_partial_output(tmp_path):
+    sealed = bytearray(aes256_encrypt(os.urandom(3 * 1024 * 1024), KEY))
+    sealed[-10] ^= 1  # corrupt the final segment
+    (tmp_path / "x.enc").write_bytes(bytes(sealed))
+    rc = offline_decryptor.run_cli([str(tmp_path / "*.enc"), "-p", KEY, "-m", "aes256", "-j", "1"])
+    assert rc == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["x.enc"]
+
+
+def test_gui_worker_queue_progress_and_cancel(tmp_path):
+    import queue
+    import threading
+
+    files = []
+    for name in ("one.enc", "two.enc"):
+        path = tmp_path / name
+        path.write_bytes(aes256_encrypt(os.urandom(3 * 1024 * 1024), KEY))
+        files.append(str(path))
+
+    events = queue.Queue()
+    offline_decryptor.decrypt_queue(files, KEY, "aes256", None, events, threading.Event())
+    seen = []
+    while not events.empty():
+        seen.append(events.get())
+    assert [e[0] for e in seen].count("start") == 2
+    assert any(e[0] == "progress" for e in seen)
+    kind, ok, failed, cancelled = seen[-1]
+    assert (kind, len(ok), failed, cancelled) == ("done", 2, [], False)
+
+    # cancelling mid-stream removes the partial output and skips the rest
+    for p in ok:
+        os.remove(p)
+    cancel = threading.Event()
+
+    class CancelOnProgress(queue.Queue):
+        def put(self, item, *args, **kwargs):
+            if item[0] == "progress":
+                cancel.set()
+            super().put(item, *args, **kwargs)
+
+    events = CancelOnProgress()
+    offline_decryptor.decrypt_queue(files, KEY, "aes256", None, events, cancel)
+    last = None
+    while not events.empty():
+        last = events.get()
+    assert last == ("done", [], [], True)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["one.enc", "two.enc"]
+
+
+def test_cli_range_extracts_slice(tmp_path):
+    data = os.urandom(2 * 1024 * 1024 + 99)
+    (tmp_path / "big.bin.enc").write_bytes(aes256_encrypt(data, KEY))
+
+    code = offline_decryptor.run_cli(
+        [str(tmp_path / "big.bin.enc"), "-p", KEY, "--range", "1048000-1049000", "-j", "1", "-q"]
+    )
+    assert code == 0
+    assert (tmp_path / "big.bin").read_bytes() == data[1048000:1049001]
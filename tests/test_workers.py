@@ -0,0 +1,39 @@
+import asyncio
+import sys
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.encryptor import derive_key
+from app.workers import run_crypto
+
+
+@pytest.mark.asyncio
+async def test_kdf_runs_off_the_event_loop():
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.001)
+
+    t = asyncio.create_task(ticker())
+    key = await run_crypto(derive_key, "pw", b"s" * 16)
+    t.cancel()
+
+    assert key == derive_key("pw", b"s" * 16)
+    # the loop kept running while PBKDF2 was busy in the pool
+    assert ticks > 1
+
+
+@pytest.mark.asyncio
+async def test_local_calls_stay_in_process(monkeypatch):
+    from app import workers
+
+    monkeypatch.setattr(workers, "CRYPTO_EXECUTOR", "process")
+    state = []
+    # a closure over live state could never be pickled into a process pool
+    assert await run_crypto(lambda x: state.append(x) or len(state), 7, local=True) == 1
+    assert state == [7]